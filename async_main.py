@@ -0,0 +1,353 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import asyncio, os, time, urllib, requests, metrics, throttle, circuit, webex_xml, async_upstream, search_index
+from settings import config, MS_LOGIN_API_URL, MS_GRAPH_API_URL, WEBEX_LOGIN_API_URL, WEBEX_MEETINGS_API_URL
+from session_store import create_session_store, ServerSideSessionInterface
+from scheduler import ticket_cache, directory, validate_meeting_data
+from graph_batch import GraphBatchError
+from main import Services, eligible_owners, meeting_data_from_form, check_form_choices, availability_for, issue_submit_key, enqueue_meeting
+
+try:
+    from quart import Quart, request, redirect, url_for, render_template, session, jsonify, g, abort, Response
+except ImportError as e:
+    raise ImportError("the async mode needs Quart, install it with: pip install -r requirements-async.txt") from e
+
+# async mode of the app: the same pages as main.py, served by an ASGI server (e.g. hypercorn async_main:app), with route handlers that
+# are coroutines and call Microsoft and Webex through async_upstream, so that a single process holds many page loads in flight
+# without a thread per request; meetings are still scheduled by the background workers of the job queue of main.py
+
+
+# the server-side sessions of main.py, opened and saved by Quart's coroutines; in a thread, as the SQLite store may wait for a lock
+class AsyncServerSideSessionInterface(ServerSideSessionInterface):
+    async def open_session(self, app, request):
+        return await asyncio.to_thread(super().open_session, app, request)
+
+    async def save_session(self, app, session, response):
+        await asyncio.to_thread(super().save_session, app, session, response)
+
+
+app = Quart(__name__)
+app.secret_key = config.get('flask_secret_key') or os.urandom(32)
+app.session_interface = AsyncServerSideSessionInterface(create_session_store(config))
+
+
+# the job queue, token refresh, static files and warm-up of main.py, started once the server has started; the upstream connections
+# opened by the warm-up are those of the job workers, the route handlers open theirs (async_upstream) on first use
+services = Services(config, app.jinja_env)
+
+
+@app.before_serving
+async def start_services():
+    services.start()
+
+
+@app.after_serving
+async def close_upstream():
+    await async_upstream.close()
+
+
+# the fingerprinted static files, see static_assets.py
+@app.template_global()
+def asset_url(filename):
+    path = services.assets.url_path(filename)
+    if path is None:
+        return url_for('static', filename=filename)
+    return url_for('static_asset', filename=path)
+
+
+@app.before_request
+async def start_timing():
+    g.request_started = time.perf_counter()
+    metrics.start_request()
+    throttle.set_priority(throttle.INTERACTIVE)
+
+
+@app.after_request
+async def record_timing(response):
+    if 'request_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    timings = metrics.end_request()
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    metrics.observe_route(route, request.method, response.status_code, elapsed)
+    if config.get('server_timing_header'):
+        response.headers['Server-Timing'] = metrics.server_timing(timings, elapsed)
+    return response
+
+
+# to make sure both access tokens of the session can be used, see fresh_tokens() in main.py; a refresh (rare) runs in a thread
+async def fresh_tokens():
+    current_session = session._get_current_object()
+    webex_username = current_session.get('webex_username')
+    for provider, on_refresh in (("webex", lambda: webex_username and ticket_cache.invalidate_user(webex_username)), ("o365", None)):
+        if services.token_manager.expires_soon(current_session, provider):
+            fresh = await asyncio.to_thread(services.token_manager.ensure_fresh, current_session, provider, on_refresh)
+        else:
+            fresh = provider + '_access_token' in current_session
+        if not fresh:
+            return False
+    return True
+
+
+# Webex Meetings XML API session tickets come from the same cache as in the sync mode; concurrent coroutines share one renewal
+_ticket_renewals = {}
+
+
+async def webex_authenticate_user(webex_username, webex_access_token):
+    data = webex_xml.authenticate_user(webex_username, config['webex_site'], webex_access_token)
+    response = await async_upstream.post(WEBEX_MEETINGS_API_URL, content=data, endpoint="webex.AuthenticateUser")
+    values = webex_xml.extract(response.text, [webex_xml.SESSION_TICKET, webex_xml.TIME_TO_LIVE])
+    time_to_live = webex_xml.first(values, webex_xml.TIME_TO_LIVE)
+    return webex_xml.first(values, webex_xml.SESSION_TICKET), int(time_to_live) if time_to_live else None
+
+
+async def webex_meetings_session_ticket(webex_username, webex_access_token):
+    key = (webex_username, config['webex_site'])
+    ticket = ticket_cache.peek(key)
+    if ticket is not None:
+        return ticket
+    renewal = _ticket_renewals.get(key)
+    if renewal is None:
+        renewal = _ticket_renewals[key] = asyncio.ensure_future(webex_authenticate_user(webex_username, webex_access_token))
+        renewal.add_done_callback(lambda future: _ticket_renewals.pop(key, None))
+    ticket, ttl = await asyncio.shield(renewal)
+    ticket_cache.put(key, ticket, ttl)
+    return ticket
+
+
+# see scheduler.webex_xml_request()
+async def webex_xml_request(webex_username, webex_access_token, build_body, paths, repeated=(), endpoint="webex.XMLService"):
+    webex_session_ticket = await webex_meetings_session_ticket(webex_username, webex_access_token)
+    response = await async_upstream.post(WEBEX_MEETINGS_API_URL, content=build_body(webex_session_ticket), endpoint=endpoint)
+    try:
+        return response, webex_xml.extract(response.text, paths, repeated)
+    except webex_xml.WebexSessionTicketError:
+        ticket_cache.invalidate((webex_username, config['webex_site']), webex_session_ticket)
+    webex_session_ticket = await webex_meetings_session_ticket(webex_username, webex_access_token)
+    response = await async_upstream.post(WEBEX_MEETINGS_API_URL, content=build_body(webex_session_ticket), endpoint=endpoint)
+    return response, webex_xml.extract(response.text, paths, repeated)
+
+
+async def webex_host_permissions(webex_username, webex_access_token):
+    try:
+        response, values = await webex_xml_request(webex_username, webex_access_token,
+                                                   lambda webex_session_ticket: webex_xml.get_user(webex_username, webex_session_ticket, config['webex_site']),
+                                                   [webex_xml.SCHEDULE_FOR], repeated=[webex_xml.SCHEDULE_FOR], endpoint="webex.GetUser")
+    except webex_xml.WebexXMLError: # if the user cannot be read, no other host can be chosen
+        return []
+    return values[webex_xml.SCHEDULE_FOR]
+
+
+async def webex_username_for(webex_access_token):
+    response = await async_upstream.get(WEBEX_LOGIN_API_URL + '/people/me', headers={'Authorization': 'Bearer ' + webex_access_token},
+                                        endpoint="webex.people_me")
+    response.raise_for_status()
+    return response.json()['emails'][0]
+
+
+async def o365_calendars_for(o365_access_token):
+    response = await async_upstream.get(MS_GRAPH_API_URL + "/v1.0/me/calendars", headers={"Authorization": "Bearer " + o365_access_token},
+                                        endpoint="graph.calendars")
+    response.raise_for_status()
+    return response.json()
+
+
+# the local group directory is read from SQLite (and its first sync blocks on Graph), so it is checked in a thread
+async def ensure_directory_synced(o365_access_token):
+    await asyncio.to_thread(directory.ensure_synced, o365_access_token)
+
+
+@app.route('/')
+async def mainpage_login():
+    return await render_template('mainpage_login.html')
+
+
+@app.route('/webexlogin', methods=['POST'])
+async def webexlogin():
+    WEBEX_USER_AUTH_URL = WEBEX_LOGIN_API_URL + "/authorize?client_id={client_id}&response_type=code&redirect_uri={redirect_uri}&response_mode=query&scope={scope}".format(
+        client_id=urllib.parse.quote(config['webex_integration_client_id']),
+        redirect_uri=urllib.parse.quote(config['webex_integration_redirect_uri']),
+        scope=urllib.parse.quote(config['webex_integration_scope'])
+    )
+
+    return redirect(WEBEX_USER_AUTH_URL)
+
+
+@app.route('/webexoauth', methods=['GET'])
+async def webexoauth():
+    body = {
+        'client_id': config['webex_integration_client_id'],
+        'code': request.args.get('code'),
+        'redirect_uri': config['webex_integration_redirect_uri'],
+        'grant_type': 'authorization_code',
+        'client_secret': config['webex_integration_client_secret']
+    }
+    get_token = await async_upstream.post(WEBEX_LOGIN_API_URL + "/access_token", data=body, endpoint="webex.access_token")
+
+    services.token_manager.store(session, "webex", get_token.json())
+
+    return redirect(url_for('.o365login'))
+
+
+@app.route("/o365login")
+async def o365login():
+    MS_USER_AUTH_URL = MS_LOGIN_API_URL + "/authorize?client_id={client_id}&response_type=code&redirect_uri={redirect_uri}&response_mode=query&scope={scope}".format(
+        client_id=config['azure_client_id'],
+        redirect_uri=config['azure_client_redirect_uri'],
+        scope=config['azure_permissions'])
+
+    return redirect(MS_USER_AUTH_URL)
+
+
+@app.route('/o365oauth', methods=['GET'])
+async def o365_oauth():
+    body = {
+        'client_id': config['azure_client_id'],
+        'scope': config['azure_permissions'],
+        'code': request.args.get('code'),
+        'redirect_uri': config['azure_client_redirect_uri'],
+        'grant_type': 'authorization_code',
+        'client_secret': config['azure_client_secret']
+    }
+    get_token = await async_upstream.post(MS_LOGIN_API_URL + "/token", data=body, endpoint="ms.token")
+
+    services.token_manager.store(session, "o365", get_token.json())
+
+    return redirect(url_for('.mainpage'))
+
+
+@app.route('/mainpage')
+async def mainpage():
+    if not await fresh_tokens():
+        return redirect(url_for('.mainpage_login'))
+    webex_access_token = session['webex_access_token']
+    o365_access_token = session['o365_access_token']
+
+    # if Webex or O365 cannot be reached, the results of the user's last page load are used (see main.py)
+    async def webex_lookups():
+        webex_username, username_stale = await circuit.with_fallback_async(session, 'webex_username', webex_username_for, webex_access_token)
+        owner_choice_webex, permissions_stale = await circuit.with_fallback_async(session, 'webex_host_permissions', webex_host_permissions,
+                                                                                  webex_username, webex_access_token)
+        return webex_username, owner_choice_webex, username_stale, permissions_stale
+
+    # the O365 lookups and the Webex lookups run concurrently in the event loop
+    (webex_username, owner_choice_webex, username_stale, permissions_stale), (o365_owner, calendars_stale), _ = await asyncio.gather(
+        webex_lookups(),
+        circuit.with_fallback_async(session, 'o365_owner', o365_calendars_for, o365_access_token),
+        ensure_directory_synced(o365_access_token))
+    session['owner_choice'] = [webex_username] + eligible_owners(o365_owner, owner_choice_webex, exclude=webex_username) # own calendar is always an option
+    stale_since = min([stale for stale in (username_stale, permissions_stale, calendars_stale) if stale is not None], default=None)
+
+    job_id = session.pop('pending_job', None)
+
+    return await render_template('mainpage.html', default_owner=webex_username, job_id=job_id, submit_key=issue_submit_key(session),
+                                 stale_since=time.strftime("%H:%M", time.localtime(stale_since)) if stale_since is not None else None)
+
+
+# the group search checks the version of the SQLite copy of the directory, so it runs in a thread; the host search only reads
+# an in-memory index and runs in the event loop
+@app.route('/search/groups', methods=['GET'])
+async def search_groups():
+    if 'webex_username' not in session:
+        return jsonify({"error": "not logged in"}), 401
+    try:
+        page = await asyncio.to_thread(directory.search, *search_index.search_arguments(request.args))
+    except ValueError:
+        return jsonify({"error": "offset and limit must be numbers"}), 400
+    page['results'] = [{"mail": group['mail'], "displayName": group['displayName']} for group in page['results']]
+    return jsonify(page)
+
+
+@app.route('/search/hosts', methods=['GET'])
+async def search_hosts():
+    if 'owner_choice' not in session:
+        return jsonify({"error": "not logged in"}), 401
+    try:
+        return jsonify(search_index.host_index(tuple(session['owner_choice'])).search(*search_index.search_arguments(request.args)))
+    except ValueError:
+        return jsonify({"error": "offset and limit must be numbers"}), 400
+
+
+@app.route('/submit', methods=['POST'])
+async def submit():
+    form = await request.form
+    meeting_data = meeting_data_from_form(form)
+
+    if 'o365_owner' not in session or 'webex_username' not in session or not await fresh_tokens():
+        return redirect(url_for('.mainpage_login'))
+    try:
+        meeting_data = validate_meeting_data(meeting_data)
+        await asyncio.to_thread(check_form_choices, meeting_data, session)
+    except ValueError as e:
+        abort(400, str(e))
+    job_id = await asyncio.to_thread(enqueue_meeting, services.job_queue, meeting_data, form.get('submit_key'), session)
+    session['jobs'] = (session.get('jobs') or [])[-19:] + [job_id]
+    session['pending_job'] = job_id
+    return redirect(url_for('.mainpage'))
+
+
+# the getSchedule calls of the availability check are sent by the blocking Graph client, in a thread
+@app.route('/availability', methods=['POST'])
+async def availability_check():
+    if 'webex_username' not in session or not await fresh_tokens():
+        return jsonify({"error": "not logged in"}), 401
+    try:
+        meeting_data = meeting_data_from_form(await request.form)
+        await asyncio.to_thread(check_form_choices, meeting_data, session)
+        return jsonify(await asyncio.to_thread(availability_for, meeting_data, session['o365_access_token']))
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except (GraphBatchError, requests.RequestException) as e: # incl. circuit.CircuitOpenError
+        return jsonify({"error": str(e)}), 502
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+async def job_status(job_id):
+    job = await asyncio.to_thread(services.job_queue.get, job_id) if job_id in (session.get('jobs') or []) else None
+    if job == None:
+        return jsonify({"error": "unknown job"}), 404
+    return jsonify(job)
+
+
+@app.route('/assets/<path:filename>', methods=['GET'])
+async def static_asset(filename):
+    status, headers, body = services.assets.response(filename, request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match'))
+    if status == 404:
+        abort(404)
+    return Response(body, status=status, headers=headers)
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics_endpoint():
+    if config.get('metrics_token') and request.headers.get('Authorization') != "Bearer " + config['metrics_token']:
+        abort(401)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/healthz', methods=['GET'])
+async def healthz():
+    return jsonify({"status": "ok"})
+
+
+@app.route('/readyz', methods=['GET'])
+async def readyz():
+    return jsonify(services.warmup.status()), 200 if services.warmup.ready.is_set() else 503
+
+
+if __name__ == "__main__":
+    app.run()
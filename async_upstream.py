@@ -0,0 +1,99 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import asyncio, time, metrics, throttle, circuit
+from settings import config
+
+try:
+    import httpx
+except ImportError as e:
+    raise ImportError("the async mode needs httpx with HTTP/2 support, install it with: pip install -r requirements-async.txt") from e
+
+# async counterpart of upstream.py for the async mode (async_main.py): one httpx client per process, which multiplexes the calls
+# to a host over one HTTP/2 connection where the host supports it (Graph and Webex do) and keeps HTTP/1.1 connections alive otherwise;
+# calls are recorded in the metrics and go through the same rate limiters as the calls of the threads (background jobs, directory sync)
+
+_client = None
+
+
+def client():
+    global _client
+    if _client is None:
+        limits = httpx.Limits(max_connections=config.get('async_max_connections') or 100,
+                              max_keepalive_connections=config.get('upstream_pool_size') or 10)
+        # connection errors are retried, as nothing has been sent yet
+        transport = httpx.AsyncHTTPTransport(http2=True, limits=limits, retries=config.get('upstream_retries', 2))
+        _client = httpx.AsyncClient(transport=transport,
+                                    timeout=httpx.Timeout(config.get('upstream_read_timeout', 30), connect=config.get('upstream_connect_timeout', 3.05)))
+    return _client
+
+
+# to send a request to an upstream service, see upstream.request(); keyword arguments are those of httpx (e.g. content= for a raw body)
+async def request(method, url, endpoint=None, **kwargs):
+    breaker = circuit.breaker_for(endpoint or httpx.URL(url).host)
+    probe = breaker.before_call()
+    success = False
+    try:
+        response = await _send(method, url, endpoint, **kwargs)
+        success = response.status_code < 500
+        return response
+    except (throttle.ThrottledError, asyncio.CancelledError):
+        success = None
+        raise
+    finally:
+        breaker.record(success, probe)
+
+
+async def _send(method, url, endpoint, **kwargs):
+    host = httpx.URL(url).host
+    limiter = throttle.limiter_for(endpoint)
+    max_retries = config.get('throttle_max_retries', 3)
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            await limiter.acquire_async(throttle.current_priority(), config.get('throttle_queue_timeout') or 60)
+        started = time.perf_counter()
+        try:
+            response = await client().request(method, url, **kwargs)
+        except BaseException as e:
+            # the slot is also given back if the call was cancelled (a CancelledError is no Exception), e.g. when the client went away
+            if limiter is not None:
+                limiter.release()
+            if isinstance(e, Exception):
+                metrics.observe_upstream(endpoint or host, time.perf_counter() - started, error=e)
+            raise
+        metrics.observe_upstream(endpoint or host, time.perf_counter() - started, response)
+        throttled = throttle.is_throttled(method, response)
+        if limiter is not None:
+            limiter.release(throttled, throttle.retry_after(response) if throttled else None)
+        if not throttled or attempt == max_retries:
+            return response
+        await asyncio.sleep(throttle.backoff(response, attempt))
+
+
+async def get(url, **kwargs):
+    return await request("GET", url, **kwargs)
+
+
+async def post(url, **kwargs):
+    return await request("POST", url, **kwargs)
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,101 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import threading, time, graph_batch
+from settings import MS_GRAPH_API_URL
+
+GROUP_MEMBERS_URL = MS_GRAPH_API_URL + "/v1.0/groups/{group_id}/transitiveMembers?$select=mail,displayName&$top=999"
+
+
+# to resolve the O365 groups chosen in the HTML form into the attendees of the O365 invite
+# members of nested groups are included, every address is invited once, and required attendees win over optional ones
+class AttendeeResolver:
+    def __init__(self, directory, ttl=300):
+        self.directory = directory
+        self.ttl = ttl
+        self._members = {}
+        self._lock = threading.Lock()
+
+    def _cached_members(self, group_id):
+        entry = self._members.get(group_id)
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+        return None
+
+    # to get all (transitive) members with a mail address of several groups; the pages of all groups are fetched together
+    # in one Graph batch per round, following @odata.nextLink until every group is complete
+    def _fetch_group_members(self, group_ids, access_token):
+        members = {group_id: [] for group_id in group_ids}
+        next_urls = {group_id: GROUP_MEMBERS_URL.format(group_id=group_id) for group_id in group_ids}
+        while next_urls:
+            pending = list(next_urls.items())
+            responses = graph_batch.send([{"method": "GET", "url": url} for _, url in pending], access_token,
+                                         endpoint="graph.group_members")
+            next_urls = {}
+            for (group_id, _), response in zip(pending, responses):
+                response.raise_for_status()
+                page = response.json()
+                for member in page['value']:
+                    # nested groups are already expanded by transitiveMembers, so only their members are invited
+                    if member.get('@odata.type') == "#microsoft.graph.group" or not member.get('mail'):
+                        continue
+                    members[group_id].append({"address": member['mail'], "name": member.get('displayName')})
+                if page.get('@odata.nextLink'):
+                    next_urls[group_id] = page['@odata.nextLink']
+        return members
+
+    # to get the members of several groups, from the cache where possible
+    def group_members(self, group_ids, access_token):
+        members = {group_id: self._cached_members(group_id) for group_id in group_ids}
+        missing = [group_id for group_id, group_members in members.items() if group_members is None]
+        if missing:
+            fetched = self._fetch_group_members(missing, access_token)
+            with self._lock:
+                for group_id, group_members in fetched.items():
+                    self._members[group_id] = (time.time() + self.ttl, group_members)
+            members.update(fetched)
+        return members
+
+    # to get the attendees for the required and optional group mail addresses (either may be None)
+    # raises ValueError for a group that is not in the directory, instead of inviting nobody
+    def resolve(self, required_group_mail, optional_group_mail, access_token):
+        lookups = []
+        for group_mail, attendee_type in ((required_group_mail, "required"), (optional_group_mail, "optional")):
+            if group_mail == None:
+                continue
+            group = self.directory.group_by_mail(group_mail)
+            if group == None:
+                raise ValueError("unknown O365 group " + group_mail)
+            lookups.append((group['id'], attendee_type))
+
+        # to fetch the memberships of both groups at the same time
+        memberships = self.group_members([group_id for group_id, _ in lookups], access_token)
+
+        attendees = {}
+        for group_id, attendee_type in lookups:
+            for member in memberships[group_id]:
+                key = member['address'].lower()
+                if key in attendees: # required is resolved first, so an address stays required if it is in both groups
+                    continue
+                attendees[key] = {
+                    "emailAddress": {
+                        "address": member['address'],
+                        "name": member['name']
+                    },
+                    "type": attendee_type
+                }
+        return list(attendees.values())
@@ -0,0 +1,229 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import bisect, datetime, graph_batch
+from settings import config
+
+# free/busy check of the attendees before a meeting is scheduled: the schedules of all attendees are fetched with Graph getSchedule
+# (many attendees per call, the calls sent together in $batch requests), their busy periods are merged into sorted interval indexes,
+# and the chosen time is checked against them, incl. the next occurrences of a repeated meeting
+
+TIME_ZONE = "W. Europe Standard Time"
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+BUSY_STATUSES = ("busy", "oof", "tentative")
+# Graph answers getSchedule for a period of at most 62 days
+MAX_PERIOD_DAYS = 62
+
+SCHEDULES_PER_REQUEST = config.get('availability_schedules_per_request') or 50
+SUGGESTIONS = config.get('availability_suggestions') or 5
+SEARCH_DAYS = config.get('availability_search_days') or 14
+OCCURRENCES = config.get('availability_occurrences') or 4
+SLOT_STEP = datetime.timedelta(minutes=config.get('availability_slot_step') or 30)
+WORKING_HOURS = (config.get('availability_working_hours') or "08:00-18:00").split("-")
+WORKING_DAYS = range(5) # Monday to Friday
+
+
+# sorted, non-overlapping intervals (start, end), built from possibly overlapping ones; back-to-back intervals do not overlap
+class IntervalIndex:
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(intervals):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    # to get the position of the first interval that overlaps start to end, or None
+    def first_overlap(self, start, end):
+        i = bisect.bisect_right(self.ends, start)
+        if i < len(self.starts) and self.starts[i] < end:
+            return i
+        return None
+
+    # to get all intervals that overlap start to end
+    def overlapping(self, start, end):
+        i = bisect.bisect_right(self.ends, start)
+        j = bisect.bisect_left(self.starts, end, lo=i)
+        return list(zip(self.starts[i:j], self.ends[i:j]))
+
+
+def _add_months(date, months):
+    year, month = divmod(date.month - 1 + months, 12)
+    try:
+        return date.replace(year=date.year + year, month=month + 1)
+    except ValueError: # the day does not exist in that month
+        return None
+
+
+# to get the start times of a meeting and of its next occurrences (repeat pattern as in the HTML form), up to count and not after until
+def occurrences(start, pattern, count, until):
+    starts = []
+    for n in range(count if pattern != None else 1):
+        if pattern == "daily":
+            occurrence = start + datetime.timedelta(days=n)
+        elif pattern == "weekly":
+            occurrence = start + datetime.timedelta(weeks=n)
+        elif pattern == "monthly":
+            occurrence = _add_months(start, n)
+        elif pattern == "yearly":
+            occurrence = _add_months(start, 12 * n)
+        else:
+            occurrence = start
+        if occurrence is None:
+            continue
+        if occurrence > until:
+            break
+        starts.append(occurrence)
+    return starts
+
+
+# to get the busy periods per attendee address (lowercase) between start and end, None for addresses whose schedule is not available
+# (e.g. external addresses); every getSchedule call asks for SCHEDULES_PER_REQUEST attendees, all calls go out in $batch requests
+def busy_periods(addresses, start, end, access_token):
+    chunks = [addresses[i:i + SCHEDULES_PER_REQUEST] for i in range(0, len(addresses), SCHEDULES_PER_REQUEST)]
+    requests = [{
+        "method": "POST",
+        "url": "/me/calendar/getSchedule",
+        # the busy periods are returned in the time zone of the meetings
+        "headers": {"Prefer": 'outlook.timezone="{}"'.format(TIME_ZONE)},
+        "body": {
+            "schedules": chunk,
+            "startTime": {"dateTime": start.strftime(DATETIME_FORMAT), "timeZone": TIME_ZONE},
+            "endTime": {"dateTime": end.strftime(DATETIME_FORMAT), "timeZone": TIME_ZONE},
+            "availabilityViewInterval": int(SLOT_STEP.total_seconds() // 60)
+        }
+    } for chunk in chunks]
+
+    periods = {address.lower(): None for address in addresses}
+    for response in graph_batch.send(requests, access_token, endpoint="graph.get_schedule"):
+        response.raise_for_status()
+        for schedule in response.json()['value']:
+            if schedule.get('error'):
+                continue
+            periods[schedule['scheduleId'].lower()] = [
+                (datetime.datetime.strptime(item['start']['dateTime'][:19], DATETIME_FORMAT),
+                 datetime.datetime.strptime(item['end']['dateTime'][:19], DATETIME_FORMAT))
+                for item in schedule.get('scheduleItems') or [] if item.get('status') in BUSY_STATUSES]
+    return periods
+
+
+# to step through the working hours from first_start on, in SLOT_STEP steps, and find the first count slots of the given duration
+# at which none of the occurrences overlaps a busy period of the index
+def free_slots(index, first_start, duration, pattern, count, last_day, until):
+    work_start = datetime.datetime.strptime(WORKING_HOURS[0], "%H:%M").time()
+    work_end = datetime.datetime.strptime(WORKING_HOURS[1], "%H:%M").time()
+    slots = []
+    start = first_start
+    while len(slots) < count and start.date() <= last_day:
+        day_start = datetime.datetime.combine(start.date(), work_start)
+        if start.weekday() not in WORKING_DAYS or start + duration > datetime.datetime.combine(start.date(), work_end):
+            start = day_start + datetime.timedelta(days=1)
+            continue
+        if start < day_start:
+            start = day_start
+            continue
+
+        blocked_until = None
+        for occurrence in occurrences(start, pattern, OCCURRENCES, until):
+            i = index.first_overlap(occurrence, occurrence + duration)
+            if i is not None:
+                # the slot cannot start before this busy period has ended
+                blocked_until = start + (index.ends[i] - occurrence)
+                break
+        if blocked_until is None:
+            slots.append(start)
+            blocked_until = start + duration
+        # to continue at the next step of the working hours, counted from their start
+        steps = -((day_start - blocked_until) // SLOT_STEP)
+        start = day_start + steps * SLOT_STEP
+    return slots
+
+
+def _slot(start, duration):
+    return {"date": start.strftime("%Y-%m-%d"), "starttime": start.strftime("%H:%M"), "endtime": (start + duration).strftime("%H:%M")}
+
+
+# to get how far the occurrences checked for a repeated meeting reach beyond its first one
+def _recurrence_span(pattern):
+    days = {"daily": 1, "weekly": 7, "monthly": 31, "yearly": 0}.get(pattern, 0)
+    return datetime.timedelta(days=days * (OCCURRENCES - 1))
+
+
+# to check the availability of the attendees (as resolved for the O365 invite) and of the meeting owner for the date and time of
+# the meeting data; returns the attendees that are busy at the chosen time or at one of its next occurrences, the attendees
+# whose schedule is not available, and the next free slots of the same duration for all required attendees and the owner
+def check_availability(meeting_data, attendees, access_token):
+    try:
+        start = datetime.datetime.strptime(meeting_data['input_date'] + " " + meeting_data['input_time_start'], "%Y-%m-%d %H:%M")
+        end = datetime.datetime.strptime(meeting_data['input_date'] + " " + meeting_data['input_time_end'], "%Y-%m-%d %H:%M")
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("invalid date or time, expected YYYY-MM-DD and HH:MM")
+    if end <= start:
+        raise ValueError("the meeting must end after it starts")
+    duration = end - start
+    pattern = meeting_data.get('input_repeatmeeting_pattern')
+
+    # the owner is required in their own meeting
+    attendee_types = {}
+    if meeting_data.get('input_owner'):
+        attendee_types[meeting_data['input_owner'].lower()] = ("required", meeting_data['input_owner'], None)
+    for attendee in attendees:
+        address = attendee['emailAddress']['address']
+        attendee_types.setdefault(address.lower(), (attendee['type'], address, attendee['emailAddress'].get('name')))
+
+    # one period covers the chosen time, the days searched for free slots and the occurrences checked for each of them
+    period_start = datetime.datetime.combine(start.date(), datetime.time())
+    period_end = min(period_start + datetime.timedelta(days=SEARCH_DAYS + 1) + _recurrence_span(pattern),
+                     period_start + datetime.timedelta(days=MAX_PERIOD_DAYS))
+    periods = busy_periods([address for _, address, _ in attendee_types.values()], period_start, period_end, access_token)
+
+    chosen = [(occurrence, occurrence + duration) for occurrence in occurrences(start, pattern, OCCURRENCES, period_end - duration)]
+    conflicts = []
+    unavailable = []
+    required = []
+    for key, (attendee_type, address, name) in attendee_types.items():
+        if periods.get(key) is None:
+            unavailable.append(address)
+            continue
+        index = IntervalIndex(periods[key])
+        busy = [interval for occurrence_start, occurrence_end in chosen for interval in index.overlapping(occurrence_start, occurrence_end)]
+        if busy:
+            conflicts.append({"address": address, "name": name, "type": attendee_type,
+                              "busy": [{"start": s.strftime(DATETIME_FORMAT), "end": e.strftime(DATETIME_FORMAT)} for s, e in busy]})
+        if attendee_type == "required":
+            required.extend(periods[key])
+    # required attendees first
+    conflicts.sort(key=lambda conflict: conflict['type'] != "required")
+
+    # the free slots only depend on when any required attendee is busy, so all their periods are merged into one index
+    slots = free_slots(IntervalIndex(required), start + SLOT_STEP, duration, pattern, SUGGESTIONS,
+                       (period_start + datetime.timedelta(days=SEARCH_DAYS)).date(), period_end - duration)
+
+    return {
+        "meeting": _slot(start, duration),
+        "attendees": len(attendee_types),
+        "occurrences_checked": len(chosen),
+        "conflicts": conflicts,
+        "unavailable": unavailable,
+        "suggestions": [_slot(slot, duration) for slot in slots]
+    }
+
@@ -0,0 +1,247 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import argparse, json, logging, os, sys, tempfile, threading, time, yaml, requests
+from benchmark import stub_server
+
+# load driver of the offline benchmark: starts the stub server and the app (configured to use the stub instead of Microsoft and Webex),
+# then runs the full user flow login -> /mainpage -> /submit -> /jobs/<id> (until the meeting is scheduled) with N concurrent users
+# and reports the latency percentiles per step and the throughput, e.g.
+#   python -m benchmark.load --users 20 --iterations 5 --latency-ms 80 --groups 1000
+# run it from the root directory of the repository
+
+STEPS = ("login", "mainpage", "submit", "scheduled", "flow")
+
+
+# to write the app configuration that points all upstream URLs at the stub server; the SQLite files and the static build go into a temporary directory
+def write_config(directory, stub_url, app_port, args):
+    config = {
+        "azure_client_id": "benchmark-client",
+        "azure_client_redirect_uri": "http://127.0.0.1:{}/o365oauth".format(app_port),
+        "azure_client_secret": "benchmark-secret",
+        "azure_client_tenant": "benchmark-tenant",
+        "azure_permissions": "Calendars.ReadWrite Directory.Read.All offline_access",
+        "webex_integration_client_id": "benchmark-client",
+        "webex_integration_client_secret": "benchmark-secret",
+        "webex_integration_redirect_uri": "http://127.0.0.1:{}/webexoauth".format(app_port),
+        "webex_integration_scope": "spark:all meeting:schedules_write",
+        "webex_site": "benchmark",
+        "flask_secret_key": "benchmark",
+        "ms_login_base_url": stub_url,
+        "ms_graph_base_url": stub_url,
+        "webex_api_base_url": stub_url + "/v1",
+        "webex_meetings_api_url": stub_url + "/WBXService/XMLService",
+        "session_backend": args.session_backend,
+        "session_sqlite_path": os.path.join(directory, "sessions.sqlite3"),
+        "directory_sqlite_path": os.path.join(directory, "directory.sqlite3"),
+        "jobs_sqlite_path": os.path.join(directory, "jobs.sqlite3"),
+        "idempotency_sqlite_path": os.path.join(directory, "idempotency.sqlite3"),
+        "static_build_path": os.path.join(directory, "static_build"),
+        "join_details_source": args.join_details_source,
+        "upstream_pool_size": max(10, args.users * 2),
+        # the client-side rate limits of the app would otherwise cap the throughput long before the app itself does
+        "throttle_limits": {service: {"rate": args.client_rate_limit, "burst": args.client_rate_limit, "concurrency": max(16, args.users * 2)}
+                            for service in ("graph", "webex")},
+        "job_workers": args.job_workers
+    }
+    path = os.path.join(directory, "credentials.yml")
+    with open(path, "w") as config_file:
+        yaml.safe_dump(config, config_file)
+    return path
+
+
+# to start the app in this process with a threaded server, configured with the given file; returns its base URL
+def start_app(config_path, port):
+    os.environ['WEBSCHEDULER_CONFIG'] = config_path
+    from werkzeug.serving import make_server
+    import main
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", port, main.create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return "http://127.0.0.1:{}".format(port)
+
+
+# to start the async mode of the app (async_main.py) in this process with hypercorn; returns its base URL
+def start_async_app(config_path, port):
+    os.environ['WEBSCHEDULER_CONFIG'] = config_path
+    import asyncio, async_main
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+    hypercorn_config = Config()
+    hypercorn_config.bind = ["127.0.0.1:{}".format(port)]
+    # hypercorn cannot install its signal handlers outside of the main thread, it runs until the benchmark ends
+    threading.Thread(target=lambda: asyncio.run(serve(async_main.app, hypercorn_config, shutdown_trigger=asyncio.Event().wait)), daemon=True).start()
+    return "http://127.0.0.1:{}".format(port)
+
+
+# to wait until the app reports ready at /readyz (its startup warm-up is done), like a load balancer would before sending it users
+def wait_until_ready(app_url, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if requests.get(app_url + "/readyz", timeout=1).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError("the app at {} did not become ready within {} seconds".format(app_url, timeout))
+
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# to run the flow of one user; the timings of each step are appended to timings (step -> list of seconds), failures to errors
+def run_user(app_url, args, timings, errors, lock):
+    def record(step, started):
+        with lock:
+            timings[step].append(time.perf_counter() - started)
+
+    for iteration in range(args.iterations):
+        browser = requests.Session()
+        try:
+            flow_started = time.perf_counter()
+            started = time.perf_counter()
+            response = browser.post(app_url + "/webexlogin", timeout=60)
+            response.raise_for_status()
+            record("login", started)
+
+            started = time.perf_counter()
+            response = browser.get(app_url + "/mainpage", timeout=60)
+            response.raise_for_status()
+            record("mainpage", started)
+
+            form = {"title": "Benchmark meeting", "agenda": "Load test", "date": "2030-01-15", "starttime": "10:00", "endtime": "11:00",
+                    "owner": args.owner or stub_server.host_email(0)}
+            if args.recipients:
+                form.update({"notifyrecipients": "on", "recipients": "group0@stub.test", "notifyCCrecipients": "on", "CCrecipients": "group1@stub.test"})
+            # like a browser, the redirect back to the main page is followed, which carries the id of the job
+            started = time.perf_counter()
+            response = browser.post(app_url + "/submit", data=form, allow_redirects=False, timeout=60)
+            if response.status_code != 302:
+                raise RuntimeError("submit returned HTTP {}".format(response.status_code))
+            job_id = browser.get(app_url + "/mainpage", timeout=60).text.split("var job_id = ", 1)[1].split(";", 1)[0].strip().strip('"')
+            record("submit", started)
+
+            started = time.perf_counter()
+            while True:
+                job = browser.get(app_url + "/jobs/" + job_id, timeout=60).json()
+                if job['status'] in ("success", "failure"):
+                    break
+                time.sleep(args.poll_interval)
+            if job['status'] != "success":
+                raise RuntimeError("job failed: {}".format(job.get('result')))
+            record("scheduled", started)
+            record("flow", flow_started)
+        except Exception as e:
+            with lock:
+                errors.append("user iteration {}: {}".format(iteration, e))
+        finally:
+            browser.close()
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def report(timings, errors, elapsed, startup, args):
+    flows = len(timings['flow'])
+    summary = {"users": args.users, "iterations": args.iterations, "completed_flows": flows, "errors": len(errors),
+               "elapsed_seconds": round(elapsed, 3), "flows_per_second": round(flows / elapsed, 3) if elapsed else None,
+               "startup_seconds": round(startup, 3) if startup is not None else None, "steps": {}}
+    for step in STEPS:
+        values = timings[step]
+        summary['steps'][step] = {"count": len(values)}
+        for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            value = percentile(values, fraction)
+            summary['steps'][step][name + "_ms"] = round(value * 1000, 1) if value is not None else None
+    return summary
+
+
+def print_report(summary, errors):
+    print("{users} users x {iterations} iterations: {completed_flows} flows in {elapsed_seconds}s ({flows_per_second} flows/s), {errors} errors".format(**summary))
+    print("{:<10} {:>6} {:>10} {:>10} {:>10}".format("step", "count", "p50 ms", "p95 ms", "p99 ms"))
+    for step in STEPS:
+        values = summary['steps'][step]
+        print("{:<10} {:>6} {:>10} {:>10} {:>10}".format(step, values['count'], str(values['p50_ms']), str(values['p95_ms']), str(values['p99_ms'])))
+    if summary['startup_seconds'] is not None:
+        print("startup until ready: {}s".format(summary['startup_seconds']))
+    for error in errors[:10]:
+        print("error: " + error)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test of the web scheduler against local stand-ins for Microsoft and Webex.")
+    parser.add_argument("--users", type=int, default=10, help="number of concurrent users (default: 10)")
+    parser.add_argument("--iterations", type=int, default=3, help="number of flows per user (default: 3)")
+    parser.add_argument("--app-url", help="base URL of an app that is already running (and configured to use the stub server); by default the app is started here")
+    parser.add_argument("--stub-url", help="base URL of a stub server that is already running; by default the stub server is started here")
+    parser.add_argument("--owner", help="meeting host/owner for the submitted meetings (default: the first calendar owner of the stub)")
+    parser.add_argument("--no-recipients", dest="recipients", action="store_false", help="do not invite groups, so no group members are expanded")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="seconds between two polls of a job (default: 0.05)")
+    parser.add_argument("--session-backend", default="memory", choices=("memory", "sqlite"))
+    parser.add_argument("--join-details-source", default="local", choices=("local", "ical"))
+    parser.add_argument("--job-workers", type=int, default=4)
+    parser.add_argument("--client-rate-limit", type=float, default=1000, help="calls per second the app allows itself to Graph and to Webex (default: 1000)")
+    parser.add_argument("--async", dest="async_mode", action="store_true", help="run the async mode of the app (async_main.py, needs requirements-async.txt)")
+    parser.add_argument("--json", dest="json_output", help="also write the report as JSON to this file")
+    stub_server.add_options_arguments(parser)
+    args = parser.parse_args(argv)
+
+    stub_url = args.stub_url
+    if not stub_url:
+        stub = stub_server.start(stub_server.options_from_arguments(args))
+        stub_url = "http://127.0.0.1:{}".format(stub.server_port)
+    app_url = args.app_url
+    startup = None
+    if not app_url:
+        app_port = free_port()
+        config_path = write_config(tempfile.mkdtemp(prefix="webscheduler-benchmark-"), stub_url, app_port, args)
+        started = time.perf_counter()
+        app_url = (start_async_app if args.async_mode else start_app)(config_path, app_port)
+        wait_until_ready(app_url)
+        startup = time.perf_counter() - started
+    else:
+        wait_until_ready(app_url)
+
+    timings = {step: [] for step in STEPS}
+    errors = []
+    lock = threading.Lock()
+    threads = [threading.Thread(target=run_user, args=(app_url, args, timings, errors, lock)) for i in range(args.users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    summary = report(timings, errors, elapsed, startup, args)
+    print_report(summary, errors)
+    if args.json_output:
+        with open(args.json_output, "w") as output:
+            json.dump(summary, output, indent=2)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import argparse, hashlib, json, random, re, threading, time, uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+# local stand-in for the upstream services of the web scheduler, all served from one port:
+# - login.microsoftonline.com: /<tenant>/oauth2/v2.0/authorize and /token
+# - graph.microsoft.com: /v1.0/groups/delta, /v1.0/groups/<id>/transitiveMembers, /v1.0/me/calendars, /v1.0/me/calendars/<id>/events,
+#   /v1.0/me/calendar/getSchedule and /v1.0/$batch
+# - webexapis.com: /v1/authorize, /v1/access_token and /v1/people/me
+# - api.webex.com: /WBXService/XMLService (AuthenticateUser, GetUser, CreateMeeting)
+# - the iCalendar URL of created meetings: /ical/<meeting key>
+# the tenant size (groups, members per group, calendars) and the latency of every response can be configured
+
+
+class StubOptions:
+    def __init__(self, latency_ms=50, jitter_ms=0, groups=200, members=50, calendars=5, page_size=100, token_ttl=3600, graph_rate_limit=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.groups = groups
+        self.members = members
+        self.calendars = calendars
+        self.page_size = page_size
+        self.token_ttl = token_ttl
+        self.graph_rate_limit = graph_rate_limit
+
+
+XML_RESPONSE = """<?xml version="1.0" encoding="UTF-8"?>
+<serv:message xmlns:serv="http://www.webex.com/schemas/2002/06/service" xmlns:com="http://www.webex.com/schemas/2002/06/common"
+    xmlns:use="http://www.webex.com/schemas/2002/06/service/user" xmlns:meet="http://www.webex.com/schemas/2002/06/service/meeting">
+    <serv:header>
+        <serv:response>
+            <serv:result>SUCCESS</serv:result>
+            <serv:gsbStatus>PRIMARY</serv:gsbStatus>
+        </serv:response>
+    </serv:header>
+    <serv:body>
+        <serv:bodyContent>{body}</serv:bodyContent>
+    </serv:body>
+</serv:message>"""
+
+ICAL = """BEGIN:VCALENDAR\r
+VERSION:2.0\r
+PRODID:stub\r
+BEGIN:VEVENT\r
+UID:{meeting_key}\r
+SUMMARY:Webex meeting\r
+X-ALT-DESC;FMTTYPE=text/html:<html><body>Join meeting {meeting_key}. Please obtain your meeting password from your host.</body></html>\r
+END:VEVENT\r
+END:VCALENDAR\r
+"""
+
+
+def host_email(index):
+    return "host{}@stub.test".format(index)
+
+
+def group_id(index):
+    return "group-{:06d}".format(index)
+
+
+# fixed one-second window of Graph requests, to answer with 429 once graph_rate_limit is exceeded
+_graph_window = [0, 0]
+_graph_window_lock = threading.Lock()
+
+
+def graph_throttled(limit):
+    if not limit:
+        return False
+    with _graph_window_lock:
+        second = int(time.time())
+        if _graph_window[0] != second:
+            _graph_window[:] = [second, 0]
+        _graph_window[1] += 1
+        return _graph_window[1] > limit
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, which must not be held back waiting for a delayed ACK
+    disable_nagle_algorithm = True
+    options = StubOptions()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _delay(self):
+        delay = self.options.latency_ms + random.uniform(0, self.options.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        if not isinstance(body, (str, bytes)):
+            body = json.dumps(body)
+        if isinstance(body, str):
+            body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _base_url(self):
+        return "http://" + self.headers.get("Host")
+
+    def do_GET(self):
+        self._delay()
+        status, body, content_type, headers = self.route("GET", self.path, None)
+        self._send(status, body, content_type, headers)
+
+    def do_POST(self):
+        payload = self._body()
+        self._delay()
+        status, body, content_type, headers = self.route("POST", self.path, payload)
+        self._send(status, body, content_type, headers)
+
+    # to get the response (status, body, content type, headers) for a request; also used for the requests of a Graph batch
+    def route(self, method, path, payload):
+        url = urlsplit(path)
+        query = parse_qs(url.query)
+        route = url.path
+
+        # OAuth authorization: redirect straight back to the app with a code
+        if route.endswith("/authorize"):
+            location = query['redirect_uri'][0] + "?" + urlencode({"code": uuid.uuid4().hex})
+            return 302, "", "text/plain", {"Location": location}
+        if route.endswith("/access_token") or route.endswith("/oauth2/v2.0/token"):
+            token = ("webex-" if route.endswith("/access_token") else "o365-") + uuid.uuid4().hex
+            return 200, {"access_token": token, "refresh_token": "refresh-" + token, "expires_in": self.options.token_ttl, "token_type": "Bearer"}, "application/json", None
+
+        # Webex REST API
+        if route == "/v1/people/me":
+            token = (self.headers.get("Authorization") or "").split(" ")[-1]
+            user = "user-" + hashlib.sha1(token.encode()).hexdigest()[:8]
+            return 200, {"id": user, "emails": [user + "@stub.test"], "displayName": user}, "application/json", None
+
+        # Webex Meetings XML API
+        if route == "/WBXService/XMLService":
+            return self.xml_service(payload.decode())
+        if route.startswith("/ical/"):
+            return 200, ICAL.format(meeting_key=route[len("/ical/"):]), "text/calendar", None
+
+        # Microsoft Graph
+        if route.startswith("/v1.0/") and route != "/v1.0/$batch" and graph_throttled(self.options.graph_rate_limit):
+            return 429, {"error": {"code": "TooManyRequests", "message": "throttled"}}, "application/json", {"Retry-After": "1"}
+        if route == "/v1.0/$batch":
+            responses = []
+            for request in json.loads(payload)['requests']:
+                sub_payload = json.dumps(request['body']).encode() if 'body' in request else None
+                status, body, _, headers = self.route(request['method'], "/v1.0" + request['url'], sub_payload)
+                responses.append({"id": request['id'], "status": status, "headers": headers or {}, "body": body})
+            return 200, {"responses": responses}, "application/json", None
+        if route == "/v1.0/groups/delta":
+            return self.groups_delta(query)
+        match = re.match(r"^/v1.0/groups/([^/]+)/(transitiveMembers|members)$", route)
+        if match:
+            return self.group_members(match.group(1), query)
+        if route == "/v1.0/me/calendars":
+            calendars = [{"id": "calendar-{}".format(i), "name": "Calendar", "canEdit": True, "owner": {"name": host_email(i), "address": host_email(i)}}
+                         for i in range(self.options.calendars)]
+            return 200, {"value": calendars}, "application/json", None
+        if method == "POST" and re.match(r"^/v1.0/me/calendars/[^/]+/events$", route):
+            return 201, {"id": "event-" + uuid.uuid4().hex}, "application/json", None
+        if method == "POST" and route == "/v1.0/me/calendar/getSchedule":
+            return self.get_schedule(json.loads(payload))
+        return 404, {"error": {"code": "NotFound", "message": route}}, "application/json", None
+
+    def xml_service(self, payload):
+        if "AuthenticateUser" in payload:
+            body = "<use:sessionTicket>ticket-{}</use:sessionTicket><use:createTime>{}</use:createTime><use:timeToLive>5400</use:timeToLive>".format(
+                uuid.uuid4().hex, int(time.time() * 1000))
+        elif "GetUser" in payload:
+            body = "<use:scheduleFor>" + "".join("<use:webExID>{}</use:webExID>".format(host_email(i)) for i in range(self.options.calendars)) + "</use:scheduleFor>"
+        elif "CreateMeeting" in payload:
+            meeting_key = str(random.randint(100000000, 999999999))
+            password = re.search(r"<meetingPassword>(.*?)</meetingPassword>", payload).group(1)
+            body = ("<meet:meetingkey>{key}</meet:meetingkey><meet:meetingPassword>{password}</meet:meetingPassword>"
+                    "<meet:iCalendarURL><serv:host>{base}/ical/{key}</serv:host><serv:attendee>{base}/ical/{key}</serv:attendee></meet:iCalendarURL>"
+                    "<meet:guestToken>{token}</meet:guestToken>").format(key=meeting_key, password=password, base=self._base_url(), token=uuid.uuid4().hex)
+        else:
+            return 200, XML_RESPONSE.replace("SUCCESS", "FAILURE").format(body=""), "text/xml", None
+        return 200, XML_RESPONSE.format(body=body), "text/xml", None
+
+    # to page through the groups; the delta link returns no changes
+    def groups_delta(self, query):
+        base = self._base_url() + "/v1.0/groups/delta"
+        if "$deltatoken" in query:
+            return 200, {"value": [], "@odata.deltaLink": base + "?$deltatoken=latest"}, "application/json", None
+        start = int(query.get("$skiptoken", ["0"])[0])
+        end = min(start + self.options.page_size, self.options.groups)
+        page = {"value": [{"id": group_id(i), "mail": "group{}@stub.test".format(i), "displayName": "Group {}".format(i)} for i in range(start, end)]}
+        if end < self.options.groups:
+            page['@odata.nextLink'] = base + "?$skiptoken={}".format(end)
+        else:
+            page['@odata.deltaLink'] = base + "?$deltatoken=latest"
+        return 200, page, "application/json", None
+
+    def group_members(self, group, query):
+        start = int(query.get("$skiptoken", ["0"])[0])
+        end = min(start + self.options.page_size, self.options.members)
+        page = {"value": [{"@odata.type": "#microsoft.graph.user", "mail": "member{}.{}@stub.test".format(i, group), "displayName": "Member {}".format(i)}
+                          for i in range(start, end)]}
+        if end < self.options.members:
+            page['@odata.nextLink'] = self._base_url() + "/v1.0/groups/{}/transitiveMembers?$skiptoken={}".format(group, end)
+        return 200, page, "application/json", None
+
+    # every attendee is busy in the first hour of the requested period
+    def get_schedule(self, request):
+        start = request['startTime']['dateTime']
+        end = request['endTime']['dateTime']
+        busy_end = start[:11] + "{:02d}".format(min(int(start[11:13]) + 1, 23)) + start[13:]
+        schedules = [{"scheduleId": address, "availabilityView": "",
+                      "scheduleItems": [{"status": "busy", "start": {"dateTime": start, "timeZone": request['startTime'].get('timeZone')},
+                                         "end": {"dateTime": min(busy_end, end), "timeZone": request['startTime'].get('timeZone')}}]}
+                     for address in request['schedules']]
+        return 200, {"value": schedules}, "application/json", None
+
+
+# to start the stub server in a background thread; returns the server, whose base URL is http://<host>:<server.server_port>
+def start(options, host="127.0.0.1", port=0):
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"options": options})
+    # the default listen backlog of 5 would drop connections under load
+    server_class = type("StubHTTPServer", (ThreadingHTTPServer,), {"request_queue_size": 256})
+    server = server_class((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_options_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=50, help="latency of every upstream response (default: 50)")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="random extra latency of up to this many ms")
+    parser.add_argument("--groups", type=int, default=200, help="number of O365 groups in the tenant")
+    parser.add_argument("--members", type=int, default=50, help="number of members per group")
+    parser.add_argument("--calendars", type=int, default=5, help="number of calendars the user can edit (and hosts the user may schedule for)")
+    parser.add_argument("--page-size", type=int, default=100, help="number of groups/members per Graph page")
+    parser.add_argument("--graph-rate-limit", type=int, default=0, help="Graph requests per second before answering 429 with Retry-After (default: no limit)")
+    parser.add_argument("--token-ttl", type=int, default=3600, help="lifetime of the issued access tokens in seconds, a short one makes the app refresh them")
+
+
+def options_from_arguments(args):
+    return StubOptions(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, groups=args.groups, members=args.members,
+                       calendars=args.calendars, page_size=args.page_size, token_ttl=args.token_ttl,
+                       graph_rate_limit=args.graph_rate_limit)
+
+
+# to run the stub server on its own, e.g. python -m benchmark.stub_server --port 8900
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Microsoft and Webex services used by the web scheduler.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_options_arguments(parser)
+    args = parser.parse_args()
+    server = start(options_from_arguments(args), args.host, args.port)
+    print("stub server listening on http://{}:{}".format(args.host, server.server_port))
+    threading.Event().wait()
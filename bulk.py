@@ -0,0 +1,174 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import argparse, collections, csv, io, json, logging, sys
+from concurrent.futures import ThreadPoolExecutor
+from settings import config
+import graph_batch
+from scheduler import validate_meeting_data, validate_groups, prepare_meeting, event_result, webex_username_for, o365_calendars_for, directory, outcomes
+from idempotency import submission_key
+
+logger = logging.getLogger(__name__)
+
+
+# to read the meetings of a CSV file (with a header row) or a JSON list; both use the same fields as the HTML form (input_title, input_date, ...)
+def parse_meetings(text, file_format):
+    if file_format == "json":
+        rows = json.loads(text)
+        if not isinstance(rows, list):
+            raise ValueError("expected a JSON list of meetings")
+    elif file_format == "csv":
+        rows = list(csv.DictReader(io.StringIO(text)))
+    else:
+        raise ValueError("unsupported format " + str(file_format))
+    max_rows = config.get('bulk_max_rows') or 1000
+    if len(rows) > max_rows:
+        raise ValueError("{} meetings given, at most {} are allowed".format(len(rows), max_rows))
+    return rows
+
+
+# to create the Webex Meeting of a row and prepare its O365 event; the completed steps are recorded under the idempotency key
+# of the row (see scheduler.schedule_meeting), so that a row that was scheduled before is not scheduled again
+def _schedule_row(index, meeting_data, idempotency_key, webex_username, webex_access_token, o365_access_token, o365_calendars):
+    report = {"row": index, "title": meeting_data['input_title']}
+    completed = outcomes.get(idempotency_key)
+    if 'event' in completed:
+        report.update(completed['event'])
+        return report
+
+    def webex_meeting_created(webex_meeting):
+        outcomes.record(idempotency_key, 'webex_meeting', webex_meeting)
+        report['meeting_key'] = webex_meeting['meeting_key']
+
+    if 'webex_meeting' in completed:
+        report['meeting_key'] = completed['webex_meeting']['meeting_key']
+    try:
+        result = prepare_meeting(meeting_data, webex_username, webex_access_token, o365_access_token, o365_calendars,
+                                 webex_meeting=completed.get('webex_meeting'), on_webex_meeting_created=webex_meeting_created)
+    except Exception as e: # one failing row must not stop the other rows
+        logger.exception("bulk row %s failed", index)
+        result = {"status": "failure", "error": str(e)}
+    if result['status'] == "prepared":
+        # Graph does not create a second event with the same transactionId, in case a batch failed after creating it
+        result['event_request']['body']['transactionId'] = idempotency_key
+    report.update(result)
+    return report
+
+
+# to get the result of a row from the response of its O365 event request (None if its batch failed as a whole)
+def _event_report(report, idempotency_key, response, batch_error):
+    if response is None:
+        result = {"status": "failure", "error": batch_error}
+    else:
+        result = event_result(response)
+    if result['status'] == "success":
+        result['event_id'] = (response.json() or {}).get('id')
+        outcomes.record(idempotency_key, 'event', result)
+    elif 'meeting_key' in report:
+        result['error'] = "Webex Meeting {} was created, but not its O365 event ({}); run the file again to create only the event".format(
+            report['meeting_key'], result['error'])
+    report.update(result)
+
+
+# to schedule all meetings: the Webex Meetings are created with at most concurrency meetings in progress at the same time,
+# then the O365 events are created with Graph batches of up to 20 events; returns one report per row, in row order
+# every row has an idempotency key derived from the user and the meeting data, so running the same file again (within
+# idempotency_ttl) only completes the rows that failed: a created Webex Meeting is reused, and a created event is not created twice
+def schedule_meetings(rows, webex_username, webex_access_token, o365_access_token, o365_calendars=None, concurrency=None):
+    concurrency = concurrency or config.get('bulk_concurrency') or 4
+    if o365_calendars == None:
+        o365_calendars = o365_calendars_for(o365_access_token)
+    # the groups of the rows are looked up in the local directory, which has no groups before its first sync
+    directory.ensure_synced(o365_access_token)
+    reports = {}
+    keys = {}
+    occurrences = collections.Counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bulk") as pool:
+        futures = {}
+        for index, row in enumerate(rows, start=1):
+            try:
+                meeting_data = validate_meeting_data(row)
+                validate_groups(meeting_data)
+            except Exception as e:
+                reports[index] = {"row": index, "title": row.get('input_title') if isinstance(row, dict) else None,
+                                  "status": "failure", "error": str(e)}
+                continue
+            # the same meeting given twice in a file is scheduled twice
+            fingerprint = json.dumps(meeting_data, sort_keys=True)
+            occurrences[fingerprint] += 1
+            keys[index] = submission_key(webex_username, "bulk:{}".format(occurrences[fingerprint]), meeting_data)
+            futures[index] = pool.submit(_schedule_row, index, meeting_data, keys[index], webex_username, webex_access_token,
+                                         o365_access_token, o365_calendars)
+        for index, future in futures.items():
+            reports[index] = future.result()
+    reports = [reports[index] for index in sorted(reports)]
+
+    # every batch is sent and reported on its own, so a failed batch does not fail the rows of the other batches
+    prepared = [report for report in reports if report['status'] == "prepared"]
+    for start in range(0, len(prepared), graph_batch.MAX_BATCH_SIZE):
+        chunk = prepared[start:start + graph_batch.MAX_BATCH_SIZE]
+        responses, batch_error = [None] * len(chunk), None
+        try:
+            responses = graph_batch.send([report.pop('event_request') for report in chunk], o365_access_token, endpoint="graph.create_event")
+        except Exception as e:
+            logger.exception("bulk O365 event creation failed")
+            batch_error = str(e)
+        for report, response in zip(chunk, responses):
+            _event_report(report, keys[report['row']], response, batch_error)
+    return reports
+
+
+# to run a bulk upload on the job queue (see main.py); the result holds the report of every row
+def run_job(rows, webex_username, webex_access_token, o365_access_token, o365_calendars):
+    reports = schedule_meetings(rows, webex_username, webex_access_token, o365_access_token, o365_calendars=o365_calendars)
+    failed = len([report for report in reports if report['status'] != "success"])
+    result = {"status": "failure" if failed else "success", "reports": reports}
+    if failed:
+        result['error'] = "{} of {} meetings could not be scheduled".format(failed, len(reports))
+    return result
+
+
+# command line entry point, e.g. python bulk.py meetings.csv --webex-token ... --o365-token ...
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Schedule Webex Meetings incl. O365 invites from a CSV or JSON file.")
+    parser.add_argument("file", help="CSV (with header row) or JSON file with the meetings, using the fields of the web form (input_title, input_agenda, input_date, ...)")
+    parser.add_argument("--format", choices=("csv", "json"), help="file format (default: from the file extension)")
+    parser.add_argument("--webex-token", required=True, help="Webex access token of the scheduling user")
+    parser.add_argument("--o365-token", required=True, help="O365 access token of the scheduling user")
+    parser.add_argument("--concurrency", type=int, help="number of meetings scheduled at the same time (default: bulk_concurrency)")
+    parser.add_argument("--output", help="file for the JSON report (default: stdout)")
+    args = parser.parse_args(argv)
+
+    file_format = args.format or ("json" if args.file.lower().endswith(".json") else "csv")
+    with open(args.file, encoding="utf-8-sig") as f:
+        rows = parse_meetings(f.read(), file_format)
+
+    webex_username = webex_username_for(args.webex_token)
+    reports = schedule_meetings(rows, webex_username, args.webex_token, args.o365_token, concurrency=args.concurrency)
+
+    output = json.dumps(reports, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0 if all(report['status'] == "success" for report in reports) else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig()
+    sys.exit(main())
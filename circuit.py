@@ -0,0 +1,162 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import collections, logging, threading, time, requests, metrics
+from settings import config
+
+logger = logging.getLogger(__name__)
+
+# circuit breakers per upstream endpoint (e.g. "graph.calendars", "webex.GetUser"), so that a degraded service is not called
+# by every page load and every job until each call has timed out:
+# - closed: calls go through, and the outcomes of the last `window` calls are kept,
+# - open: once at least min_calls of them were made and failure_rate of them failed (connection errors, timeouts, HTTP 5xx),
+#   calls fail right away with CircuitOpenError for open_seconds,
+# - half-open: then up to `probes` calls go through again; if they succeed the breaker closes, otherwise it opens again
+
+CLOSED = 0
+HALF_OPEN = 1
+OPEN = 2
+STATE_NAMES = {CLOSED: "closed", HALF_OPEN: "half-open", OPEN: "open"}
+
+DEFAULT_SETTINGS = {"window": 20, "min_calls": 10, "failure_rate": 0.5, "open_seconds": 30, "probes": 1}
+
+circuit_state = metrics.Gauge("webscheduler_upstream_circuit_state", "Circuit breaker state by endpoint (0 closed, 1 half-open, 2 open).", ("endpoint",))
+rejected_calls = metrics.Counter("webscheduler_upstream_circuit_rejected_total", "Calls failed fast by an open circuit breaker.", ("endpoint",))
+metrics.REGISTRY.extend([circuit_state, rejected_calls])
+
+
+# raised instead of calling an endpoint whose circuit is open; a RequestException, so callers treat it like any other failed call
+class CircuitOpenError(requests.exceptions.RequestException):
+    def __init__(self, endpoint, retry_in):
+        super().__init__("{} is currently unavailable, please try again in {} seconds".format(endpoint, max(1, int(retry_in + 0.5))))
+        self.endpoint = endpoint
+
+
+class CircuitBreaker:
+    def __init__(self, name, window=20, min_calls=10, failure_rate=0.5, open_seconds=30, probes=1):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.state = CLOSED
+        self._outcomes = collections.deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+        circuit_state.set(CLOSED, name)
+
+    def _set_state(self, state):
+        if state != self.state:
+            logger.warning("circuit of %s is now %s", self.name, STATE_NAMES[state])
+        self.state = state
+        circuit_state.set(state, self.name)
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._set_state(OPEN)
+
+    # to check whether a call may start, raises CircuitOpenError if not; returns True if the call is a half-open probe
+    def before_call(self):
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self._opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    rejected_calls.inc(self.name)
+                    raise CircuitOpenError(self.name, remaining)
+                self._probes_in_flight = 0
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight >= self.probes:
+                    rejected_calls.inc(self.name)
+                    raise CircuitOpenError(self.name, self.open_seconds)
+                self._probes_in_flight += 1
+                return True
+            return False
+
+    # to record the outcome of a call: success True or False, or None if it says nothing about the endpoint (e.g. the call
+    # was never sent because of the client-side rate limit); probe is what before_call returned
+    def record(self, success, probe=False):
+        with self._lock:
+            if probe:
+                self._probes_in_flight -= 1
+                if success:
+                    self._outcomes.clear()
+                    self._set_state(CLOSED)
+                elif success is not None:
+                    self._open()
+                return
+            if success is None:
+                return
+            self._outcomes.append(not success)
+            if (self.state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and sum(self._outcomes) >= self.failure_rate * len(self._outcomes)):
+                self._open()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+# to get the circuit breaker of an endpoint, created on first use with the circuit_breaker settings of credentials.yml
+def breaker_for(endpoint):
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(endpoint)
+            if breaker is None:
+                settings = dict(DEFAULT_SETTINGS)
+                settings.update(config.get('circuit_breaker') or {})
+                breaker = _breakers[endpoint] = CircuitBreaker(endpoint, **settings)
+    return breaker
+
+
+# to keep the result of a read lookup in a store (e.g. the user's session) as its last known good result
+def remember(store, key, value):
+    store[key] = value
+    store['known_good_at'] = dict(store.get('known_good_at') or {}, **{key: time.time()})
+
+
+# to get the last known good result of a failed read lookup from the store, as (result, time it was stored);
+# the error is raised again if there is none
+def fallback(store, key, error):
+    stored_at = (store.get('known_good_at') or {}).get(key)
+    if stored_at is None or key not in store:
+        raise error
+    logger.warning("%s could not be refreshed (%s), using the result from %s", key, error, time.ctime(stored_at))
+    return store[key], stored_at
+
+
+# to run a read lookup and remember its result, or to fall back to the last known good result if it fails;
+# returns (result, None) or (stale result, time it was stored)
+def with_fallback(store, key, lookup, *args):
+    try:
+        value = lookup(*args)
+    except Exception as e:
+        return fallback(store, key, e)
+    remember(store, key, value)
+    return value, None
+
+
+# the same for a lookup that is a coroutine function, in the async mode
+async def with_fallback_async(store, key, lookup, *args):
+    try:
+        value = await lookup(*args)
+    except Exception as e:
+        return fallback(store, key, e)
+    remember(store, key, value)
+    return value, None
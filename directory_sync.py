@@ -0,0 +1,164 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import sqlite3, threading, time, logging, upstream
+from search_index import SearchIndex
+from settings import MS_GRAPH_API_URL
+
+logger = logging.getLogger(__name__)
+
+GROUPS_DELTA_URL = MS_GRAPH_API_URL + "/v1.0/groups/delta?$select=id,mail,displayName"
+
+
+# local copy of the O365 groups (id, mail, displayName), kept in SQLite and served from an in-memory index
+# the groups are synchronized with Graph delta queries: one full pass through all pages, then only the changes since the last delta link
+class GroupDirectory:
+    def __init__(self, path, sync_interval=300):
+        self.sync_interval = sync_interval
+        self._sync_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self.use(path)
+
+    # to switch to the SQLite file at path, e.g. the one of the app's configuration (see scheduler.configure); the file is only
+    # created on first use, so that importing the app writes nothing
+    def use(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._snapshot_version = None
+        self._groups = []
+        self._groups_by_mail = {}
+        self._search_index = None
+        self._last_sync = 0
+
+    # to open one connection per thread, as SQLite connections must not be shared between threads
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS groups (id TEXT PRIMARY KEY, mail TEXT, display_name TEXT)")
+            connection.execute("CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, value TEXT)")
+            connection.commit()
+            self._local.connection = connection
+        return connection
+
+    def _state(self, name):
+        row = self._connection().execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    # to reload the in-memory index if the SQLite copy was changed (by this or another worker process)
+    def _refresh_snapshot(self):
+        version = self._state('version')
+        if version == self._snapshot_version:
+            return
+        with self._snapshot_lock:
+            if version == self._snapshot_version:
+                return
+            rows = self._connection().execute("SELECT id, mail, display_name FROM groups ORDER BY lower(mail)").fetchall()
+            groups = [{'id': row[0], 'mail': row[1], 'displayName': row[2]} for row in rows]
+            self._groups_by_mail = {group['mail'].lower(): group for group in groups if group['mail']}
+            self._groups = groups
+            self._search_index = None
+            self._snapshot_version = version
+
+    def is_synced(self):
+        return self._state('delta_link') is not None
+
+    def groups(self):
+        self._refresh_snapshot()
+        return self._groups
+
+    # to get the mail addresses of all mail-enabled groups, e.g. for the participant fields of the HTML form
+    def group_mails(self):
+        return [group['mail'] for group in self.groups() if group['mail']]
+
+    def group_by_mail(self, mail):
+        self._refresh_snapshot()
+        return self._groups_by_mail.get((mail or "").lower())
+
+    # to search the mail-enabled groups by mail address and display name (see search_index.py); the index is built on the first
+    # search after each change of the snapshot
+    def search(self, query, offset=0, limit=20):
+        self._refresh_snapshot()
+        index = self._search_index
+        if index is None:
+            with self._snapshot_lock:
+                if self._search_index is None:
+                    self._search_index = SearchIndex([group for group in self._groups if group['mail']],
+                                                     lambda group: (group['mail'], group['displayName']))
+                index = self._search_index
+        return index.search(query, offset, limit)
+
+    # to apply one page of a delta response; updated groups may only contain the changed properties
+    def _apply_page(self, connection, page, seen_ids):
+        for item in page.get('value', []):
+            if '@removed' in item:
+                connection.execute("DELETE FROM groups WHERE id = ?", (item['id'],))
+                continue
+            seen_ids.add(item['id'])
+            row = connection.execute("SELECT mail, display_name FROM groups WHERE id = ?", (item['id'],)).fetchone()
+            mail, display_name = row if row else (None, None)
+            connection.execute("INSERT OR REPLACE INTO groups (id, mail, display_name) VALUES (?, ?, ?)",
+                               (item['id'], item.get('mail', mail), item.get('displayName', display_name)))
+
+    # to synchronize the groups with Graph; a full sync is run if there is no delta link yet or the delta link has expired
+    def sync(self, access_token):
+        headers = {"Authorization": "Bearer " + access_token}
+        delta_link = self._state('delta_link')
+        full_sync = delta_link is None
+        url = GROUPS_DELTA_URL if full_sync else delta_link
+        connection = self._connection()
+        seen_ids = set()
+        while url:
+            response = upstream.get(url, headers=headers, endpoint="graph.groups")
+            if response.status_code == 410 and not full_sync: # delta token expired, start over with a full sync
+                logger.info("group delta link expired, running a full directory sync")
+                full_sync, url, seen_ids = True, GROUPS_DELTA_URL, set()
+                continue
+            response.raise_for_status()
+            page = response.json()
+            with connection:
+                self._apply_page(connection, page, seen_ids)
+            url = page.get('@odata.nextLink')
+            delta_link = page.get('@odata.deltaLink', delta_link)
+        with connection:
+            # a full sync returns every group, so groups that were not returned no longer exist
+            if full_sync:
+                known_ids = [row[0] for row in connection.execute("SELECT id FROM groups")]
+                connection.executemany("DELETE FROM groups WHERE id = ?", [(group_id,) for group_id in known_ids if group_id not in seen_ids])
+            connection.execute("INSERT OR REPLACE INTO sync_state (name, value) VALUES ('delta_link', ?)", (delta_link,))
+            connection.execute("INSERT OR REPLACE INTO sync_state (name, value) VALUES ('version', ?)", (str(time.time()),))
+        self._last_sync = time.time()
+
+    def _sync_in_background(self, access_token):
+        try:
+            self.sync(access_token)
+        except Exception:
+            logger.exception("background directory sync failed")
+        finally:
+            self._sync_lock.release()
+
+    # to make sure the directory is available: the first sync is run right away, later ones in the background once sync_interval has passed
+    def ensure_synced(self, access_token):
+        if not self.is_synced():
+            with self._sync_lock:
+                if not self.is_synced():
+                    self.sync(access_token)
+            return
+        if time.time() - self._last_sync > self.sync_interval and self._sync_lock.acquire(blocking=False):
+            self._last_sync = time.time()
+            threading.Thread(target=self._sync_in_background, args=(access_token,), daemon=True).start()
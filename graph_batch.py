@@ -0,0 +1,125 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import json, upstream, metrics, throttle
+from settings import MS_GRAPH_API_URL
+
+GRAPH_API_BASE_URL = MS_GRAPH_API_URL + "/v1.0"
+BATCH_URL = GRAPH_API_BASE_URL + "/$batch"
+# Graph accepts at most 20 requests per JSON batch
+MAX_BATCH_SIZE = 20
+THROTTLED_STATUS_CODES = (429, 503)
+FAILED_DEPENDENCY = 424
+
+
+# the response of one request of a batch, with the attributes of a requests response that the app uses
+class BatchResponse:
+    def __init__(self, status_code, headers=None, body=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body) if isinstance(self.body, str) else self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise GraphBatchError(self)
+
+
+class GraphBatchError(Exception):
+    def __init__(self, response):
+        super().__init__("Graph request failed with HTTP {}".format(response.status_code))
+        self.response = response
+
+
+# to turn an absolute Graph URL (e.g. an @odata.nextLink) into the URL relative to /v1.0 that a batch expects
+def relative_url(url):
+    return url[len(GRAPH_API_BASE_URL):] if url.startswith(GRAPH_API_BASE_URL) else url
+
+
+# to send one request of a batch on its own; upstream.request() waits for and honors Retry-After while it is throttled
+def _send_single(request, access_token, endpoint):
+    headers = {"Authorization": "Bearer " + access_token}
+    headers.update(request.get('headers') or {})
+    response = upstream.request(request['method'], GRAPH_API_BASE_URL + relative_url(request['url']), headers=headers, json=request.get('body'),
+                                endpoint=endpoint)
+    try:
+        body = response.json()
+    except ValueError:
+        body = response.text
+    return BatchResponse(response.status_code, dict(response.headers), body)
+
+
+# to send one $batch with at most MAX_BATCH_SIZE requests; earlier holds the responses of the earlier batches
+# a dependency on a request of an earlier batch is dropped if that request succeeded; if it failed, the request is not sent
+# and gets a 424 response, as Graph answers for a failed dependency within a batch
+def _send_batch(requests, indexes, access_token, endpoint, earlier):
+    in_batch = set(indexes)
+    batch_requests = []
+    responses = {}
+    for index in indexes:
+        request = requests[index]
+        if any(earlier[dependency].status_code >= 400 for dependency in request.get('dependsOn') or [] if dependency not in in_batch):
+            responses[index] = BatchResponse(FAILED_DEPENDENCY, body={"error": {"code": "FailedDependency", "message": "a request it depends on failed"}})
+            continue
+        sub_request = {"id": str(index), "method": request['method'], "url": relative_url(request['url'])}
+        if request.get('body') != None:
+            sub_request['body'] = request['body']
+            sub_request['headers'] = {"Content-Type": "application/json"}
+        if request.get('headers'):
+            sub_request.setdefault('headers', {}).update(request['headers'])
+        depends_on = [str(dependency) for dependency in request.get('dependsOn') or [] if dependency in in_batch]
+        if depends_on:
+            sub_request['dependsOn'] = depends_on
+        batch_requests.append(sub_request)
+    if not batch_requests:
+        return responses
+    # a throttled batch as a whole has not been run, so upstream.request() sends it again
+    response = upstream.post(BATCH_URL, headers={"Authorization": "Bearer " + access_token}, json={"requests": batch_requests},
+                             endpoint=endpoint + ".batch")
+    response.raise_for_status()
+    batch_responses = {int(item['id']): BatchResponse(item['status'], item.get('headers'), item.get('body')) for item in response.json()['responses']}
+    responses.update(batch_responses)
+    limiter = throttle.limiter_for(endpoint)
+    for batch_response in batch_responses.values():
+        metrics.batched_requests.inc(endpoint, str(batch_response.status_code))
+        # throttled requests inside a batch slow down the following calls just like a throttled call of its own
+        if batch_response.status_code in THROTTLED_STATUS_CODES and limiter is not None:
+            limiter.throttled(throttle.retry_after(batch_response))
+    return responses
+
+
+# to send Graph requests in as few round trips as possible; each request is a dict with method, url (absolute or relative to /v1.0),
+# optional headers and body, and optional dependsOn (indexes of requests in the list that must succeed first)
+# requests are sent in batches of MAX_BATCH_SIZE in list order, so dependencies must come before the requests depending on them
+# throttled requests (and the requests that failed because they depended on one) are retried one by one, after the rate limiter allows it
+# endpoint is the name of the requests in the metrics, a $batch round trip is recorded as "<endpoint>.batch"
+# returns one BatchResponse per request, in list order
+def send(requests, access_token, endpoint="graph.batch"):
+    if len(requests) == 1:
+        return [_send_single(requests[0], access_token, endpoint)]
+    responses = {}
+    for start in range(0, len(requests), MAX_BATCH_SIZE):
+        indexes = list(range(start, min(start + MAX_BATCH_SIZE, len(requests))))
+        responses.update(_send_batch(requests, indexes, access_token, endpoint, responses))
+        for index in indexes:
+            if responses[index].status_code in THROTTLED_STATUS_CODES + (FAILED_DEPENDENCY,):
+                dependencies = requests[index].get('dependsOn') or []
+                if all(responses[dependency].status_code < 400 for dependency in dependencies):
+                    responses[index] = _send_single(requests[index], access_token, endpoint)
+    return [responses[index] for index in range(len(requests))]
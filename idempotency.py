@@ -0,0 +1,67 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import hashlib, json, sqlite3, threading, time
+
+
+# to derive the key a submission is deduplicated by: the key the form was rendered with, for this user and exactly this meeting data,
+# so that a resubmitted form is recognized, but a form that was changed (e.g. after going back in the browser) is a new submission
+def submission_key(webex_username, form_key, meeting_data):
+    fingerprint = json.dumps(meeting_data, sort_keys=True)
+    return hashlib.sha256("\n".join((webex_username, form_key, fingerprint)).encode("utf-8")).hexdigest()
+
+
+# outcomes of the steps of scheduling a meeting (the created Webex Meeting, the created O365 event) by idempotency key, kept in SQLite
+# for ttl seconds, so that a repeated submission returns the stored result and a failed one resumes at the step that failed
+class OutcomeStore:
+    def __init__(self, path, ttl=86400):
+        self.ttl = ttl
+        self._last_purge = 0
+        self.use(path)
+
+    # to switch to the SQLite file at path, e.g. the one of the app's configuration (see scheduler.configure); the file is only
+    # created on first use, so that importing the app writes nothing
+    def use(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    # to open one connection per thread, as SQLite connections must not be shared between threads
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS outcomes (key TEXT NOT NULL, step TEXT NOT NULL, outcome TEXT NOT NULL, expires REAL NOT NULL, PRIMARY KEY (key, step))")
+            self._local.connection = connection
+        return connection
+
+    # to remove expired outcomes at most once per minute
+    def _purge(self, now):
+        if now - self._last_purge > 60:
+            self._last_purge = now
+            self._connection().execute("DELETE FROM outcomes WHERE expires < ?", (now,))
+
+    # to get the recorded outcomes of a key as {step: outcome}
+    def get(self, key):
+        rows = self._connection().execute("SELECT step, outcome FROM outcomes WHERE key = ? AND expires >= ?", (key, time.time())).fetchall()
+        return {step: json.loads(outcome) for step, outcome in rows}
+
+    def record(self, key, step, outcome):
+        now = time.time()
+        self._connection().execute("INSERT OR REPLACE INTO outcomes (key, step, outcome, expires) VALUES (?, ?, ?, ?)",
+                                   (key, step, json.dumps(outcome), now + self.ttl))
+        self._purge(now)
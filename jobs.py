@@ -0,0 +1,186 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import json, logging, os, sqlite3, threading, time, uuid
+
+logger = logging.getLogger(__name__)
+
+
+# persistent job queue in SQLite, processed by a pool of background worker threads
+# a job is claimed with a lease, which is renewed while the job runs: if the process dies while running it, another worker
+# (of this or another process) runs it again once the lease has expired, up to max_attempts times
+# the payload (incl. the access tokens of the user) is kept in the database file until the job has finished, so the file is only
+# readable by the user running the app
+class JobQueue:
+    def __init__(self, path, handler, workers=4, lease=600, max_attempts=2, retention=86400):
+        self.path = path
+        self.handler = handler
+        self.workers = workers
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._connection().execute("""CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT, result TEXT,
+                                      attempts INTEGER NOT NULL DEFAULT 0, lease_until REAL, created REAL NOT NULL, updated REAL NOT NULL,
+                                      idempotency_key TEXT)""")
+        self._connection().execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+        # job queues created before submissions were deduplicated have no idempotency_key column yet
+        if 'idempotency_key' not in [row[1] for row in self._connection().execute("PRAGMA table_info(jobs)")]:
+            try:
+                self._connection().execute("ALTER TABLE jobs ADD COLUMN idempotency_key TEXT")
+            except sqlite3.OperationalError: # added by another process in the meantime
+                pass
+        self._connection().execute("CREATE UNIQUE INDEX IF NOT EXISTS jobs_idempotency_key ON jobs (idempotency_key)")
+
+    # to open one connection per thread, as SQLite connections must not be shared between threads
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            if not os.path.exists(self.path):
+                os.close(os.open(self.path, os.O_CREAT | os.O_WRONLY, 0o600))
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    # to add a job and return its id right away
+    # a job enqueued again with the same idempotency_key (while the first one is kept) is not added twice: the id of the first job
+    # is returned, and if that job has failed, it is queued again with the new payload
+    def enqueue(self, payload, idempotency_key=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = None
+            if idempotency_key != None:
+                row = connection.execute("SELECT id, status FROM jobs WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+            if row is None:
+                connection.execute("INSERT INTO jobs (id, status, payload, created, updated, idempotency_key) VALUES (?, 'queued', ?, ?, ?, ?)",
+                                   (job_id, json.dumps(payload), now, now, idempotency_key))
+            else:
+                job_id = row[0]
+                if row[1] == 'failure':
+                    connection.execute("UPDATE jobs SET status = 'queued', payload = ?, result = NULL, attempts = 0, updated = ? WHERE id = ?",
+                                       (json.dumps(payload), now, job_id))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        self._wakeup.set()
+        return job_id
+
+    # to get the status ("queued", "running", "success" or "failure") and the result of a job, or None if there is no such job
+    def get(self, job_id):
+        row = self._connection().execute("SELECT status, result, created, updated FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {"id": job_id, "status": row[0], "created": row[2], "updated": row[3]}
+        if row[1] is not None:
+            job['result'] = json.loads(row[1])
+        return job
+
+    # to claim the oldest queued job, or a running job whose lease has expired
+    def _claim(self):
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("""SELECT id, payload, attempts FROM jobs
+                                        WHERE status = 'queued' OR (status = 'running' AND lease_until < ?)
+                                        ORDER BY created LIMIT 1""", (now,)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, updated = ? WHERE id = ?",
+                                   (now + self.lease, now, row[0]))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return row
+
+    def _finish(self, job_id, result):
+        self._connection().execute("UPDATE jobs SET status = ?, result = ?, payload = NULL, lease_until = NULL, updated = ? WHERE id = ?",
+                                   (result['status'], json.dumps(result), time.time(), job_id))
+
+    def _purge(self):
+        self._connection().execute("DELETE FROM jobs WHERE status IN ('success', 'failure') AND updated < ?", (time.time() - self.retention,))
+
+    def _run_one(self):
+        row = self._claim()
+        if row is None:
+            return False
+        job_id, payload, attempts = row
+        if attempts >= self.max_attempts:
+            self._finish(job_id, {"status": "failure", "error": "job was interrupted too often"})
+            return True
+        with self._running_lock:
+            self._running.add(job_id)
+        try:
+            result = self.handler(**json.loads(payload))
+        except Exception as e:
+            logger.exception("job %s failed", job_id)
+            result = {"status": "failure", "error": str(e)}
+        finally:
+            with self._running_lock:
+                self._running.discard(job_id)
+        self._finish(job_id, result)
+        return True
+
+    # to renew the leases of the jobs running in this process, so that a slow job (e.g. waiting for the rate limiter) is not
+    # claimed by a second worker while it is still running
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.lease / 3)
+            with self._running_lock:
+                job_ids = list(self._running)
+            if not job_ids:
+                continue
+            try:
+                lease_until = time.time() + self.lease
+                self._connection().executemany("UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running'",
+                                               [(lease_until, job_id) for job_id in job_ids])
+            except Exception:
+                logger.exception("job lease renewal failed")
+
+    def _work(self):
+        last_purge = 0
+        while True:
+            try:
+                if self._run_one():
+                    continue
+                if time.time() - last_purge > 3600:
+                    last_purge = time.time()
+                    self._purge()
+            except Exception:
+                logger.exception("job worker error")
+            # to wait for a new job, but also look for expired leases from time to time
+            self._wakeup.wait(timeout=5)
+            self._wakeup.clear()
+
+    # to start the worker threads; queued jobs left over from a previous run are picked up right away
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name="job-worker-{}".format(i), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True).start()
@@ -0,0 +1,126 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import functools, logging, requests, upstream
+from html import escape
+from settings import config
+
+logger = logging.getLogger(__name__)
+
+PASSWORD_PLACEHOLDER = "Please obtain your meeting password from your host."
+DEFAULT_JOIN_URL = "https://{site}.webex.com/{site}/m.php?MK={meeting_key}"
+
+_TEMPLATE = """<html><body>
+<p>When it's time, join the Webex meeting here.</p>
+<p><a href="{join_url}">Join meeting</a></p>
+<p>Meeting number (access code): {meeting_key}<br>
+Meeting password: {meeting_password}</p>
+<p>Join from a video system or application: dial {meeting_key}@{site}.webex.com</p>
+</body></html>"""
+
+
+# to get the HTML template of the join details of a site, with everything that only depends on the site filled in once;
+# the join URL comes from webex_join_url_template, in which {site} and {meeting_key} are replaced
+@functools.lru_cache(maxsize=32)
+def _site_template(site):
+    join_url = escape((config.get('webex_join_url_template') or DEFAULT_JOIN_URL).replace("{site}", site))
+    return _TEMPLATE.replace("{join_url}", join_url.replace("{meeting_key}", "{meeting_key_url}")).replace("{site}", escape(site))
+
+
+# to build the join details of a meeting for the O365 invite from the fields of the CreateMeeting response
+def render(site, meeting_key, meeting_password):
+    return _site_template(site).format(meeting_key=escape(meeting_key or ""),
+                                       meeting_key_url=escape(requests.utils.quote(meeting_key or "")),
+                                       meeting_password=escape(meeting_password or ""))
+
+
+# to unescape an iCalendar TEXT value
+def _unescape(value):
+    out = []
+    chars = iter(value)
+    for char in chars:
+        if char == "\\":
+            char = next(chars, "")
+            out.append("\n" if char in ("n", "N") else char)
+        else:
+            out.append(char)
+    return "".join(out)
+
+
+# to split a content line into its name and its value, the value starts after the first colon outside of quoted parameter values
+def _split_content_line(line):
+    quoted = False
+    for index, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ":" and not quoted:
+            return line[:index].split(";", 1)[0].upper(), line[index + 1:]
+    return line.upper(), ""
+
+
+# to unfold the content lines of an iCalendar file (a line starting with a space or tab continues the previous line)
+def _unfold(lines):
+    current = None
+    for line in lines:
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+# to get the X-ALT-DESC of the first VEVENT from the lines of an iCalendar file, reading no further than needed; returns None if there is none
+def extract_alt_desc(lines):
+    in_event = False
+    for line in _unfold(lines):
+        name, value = _split_content_line(line)
+        if name == "BEGIN" and value.strip().upper() == "VEVENT":
+            in_event = True
+        elif in_event and name == "END" and value.strip().upper() == "VEVENT":
+            return None
+        elif in_event and name == "X-ALT-DESC":
+            return _unescape(value)
+    return None
+
+
+# to download the iCalendar file of a meeting and extract the X-ALT-DESC of its first VEVENT, the download stops once it has been read
+def fetch_ical_alt_desc(ical_url):
+    response = upstream.get(ical_url, stream=True, endpoint="ical.fetch")
+    try:
+        if response.status_code != requests.codes.ok:
+            return None
+        response.encoding = response.encoding or "utf-8"
+        return extract_alt_desc(response.iter_lines(decode_unicode=True))
+    finally:
+        response.close()
+
+
+# to get the join details for the O365 invite: built locally by default, or taken from the meeting's iCalendar file
+# (join_details_source: ical) with the locally built details as fallback if the file cannot be read
+def join_details(site, meeting_key, meeting_password, ical_url=None):
+    if config.get('join_details_source') == "ical" and ical_url:
+        try:
+            alt_desc = fetch_ical_alt_desc(ical_url)
+        except requests.RequestException:
+            logger.warning("could not fetch the iCalendar file of meeting %s", meeting_key, exc_info=True)
+            alt_desc = None
+        if alt_desc:
+            return alt_desc.replace(PASSWORD_PLACEHOLDER, meeting_password or "")
+    return render(site, meeting_key, meeting_password)
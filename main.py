@@ -15,192 +15,129 @@ IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
 or implied.
 '''
 
-import yaml, datetime, string, random, icalendar, requests, urllib
-from xmltodict import parse as xml_to_dict
-from flask import Flask, request, redirect, url_for, render_template
-
-# global variables
-o365_access_token = None
-webex_access_token = None
-webex_username = None
-webex_session_ticket = None
-redirected = None
-o365_groups = {}
-o365_owner = {}
-meeting_data = {}
-config = yaml.safe_load(open("credentials.yml"))
-
-MS_LOGIN_API_URL = "https://login.microsoftonline.com/{tenant}/oauth2/v2.0".format(tenant=config['azure_client_tenant'])
-MS_GRAPH_API_URL = "https://graph.microsoft.com"
-WEBEX_LOGIN_API_URL = "https://webexapis.com/v1"
-WEBEX_MEETINGS_API_URL = "https://api.webex.com/WBXService/XMLService"
-
-# Flask app
-app = Flask(__name__)
-
-# to retrieve a Webex Meeings XML API session ticket from a Webex access token
-def webex_meetings_session_ticket(webex_username):
-    session_ticket_xml = """
-    <?xml version="1.0" encoding="UTF-8"?>
-        <serv:message xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
-            <header>
-                <securityContext>
-                    <webExID>{webex_username}</webExID>
-                    <siteName>{webex_site}</siteName>
-                </securityContext>
-            </header>
-            <body>
-                <bodyContent xsi:type="java:com.webex.service.binding.user.AuthenticateUser">
-                    <accessToken>{webex_access_token}</accessToken>
-                </bodyContent>
-            </body>
-        </serv:message>
-    """
-    data = session_ticket_xml.format(webex_username=webex_username,
-                                     webex_site=config['webex_site'],
-                                     webex_access_token=webex_access_token)
-    get_session_ticket = requests.post(WEBEX_MEETINGS_API_URL, data=data)
-    get_session_ticket_text = xml_to_dict(get_session_ticket.text)
-    global webex_session_ticket
-    webex_session_ticket = get_session_ticket_text['serv:message']['serv:body']['serv:bodyContent']['use:sessionTicket']
-    return webex_session_ticket
-
-# to get Webex host permissions from a user
-def webex_host_permissions():
-    host_permission_xml = '''
-        <?xml version="1.0" encoding="UTF-8"?>
-        <serv:message xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
-            <header>
-                <securityContext>
-                    <webExID>{webex_username}</webExID>
-                    <sessionTicket>{webex_session_ticket}</sessionTicket>
-                    <siteName>{webex_site_name}</siteName>
-                </securityContext>
-            </header>
-            <body>
-                <bodyContent xsi:type="java:com.webex.service.binding.user.GetUser">
-                        <webExId>{webex_username}</webExId>
-                </bodyContent>
-            </body>
-        </serv:message>
-        '''
-    body = host_permission_xml.format(webex_username=webex_username,
-                                      webex_session_ticket=webex_session_ticket,
-                                      webex_site_name=config['webex_site'])
-    request = requests.post(WEBEX_MEETINGS_API_URL, data=body)
-    d = xml_to_dict(request.text)
-    owner_choice_webex = []
-    try:
-        host_permissions = d['serv:message']['serv:body']['serv:bodyContent']['use:scheduleFor']['use:webExID']
-        if isinstance(host_permissions, str): # if only one, the email address is stored in a string
-            owner_choice_webex.append(host_permissions)
-        elif isinstance(host_permissions, list): # if multiple, email addresses are stored in a list of strings
-            for webex_email in host_permissions:
-                owner_choice_webex.append(webex_email)
-    except: # if none, an error will be thrown
-        pass
-    return owner_choice_webex
-
-
-# to create the Webex Meetings XML body, depending on whether the meeting is repeated or not
-def create_meetings_xml(input_repeatmeeting_pattern):
-    create_meetings_xml_pt1 = """<?xml version="1.0" encoding="UTF-8"?>
-        <serv:message xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
-            <header>
-                <securityContext>
-                    <webExID>{webex_username}</webExID>
-                    <sessionTicket>{webex_session_ticket}</sessionTicket>
-                    <siteName>{webex_site_name}</siteName>
-                </securityContext>
-            </header>
-            <body>
-                <bodyContent
-                    xsi:type="java:com.webex.service.binding.meeting.CreateMeeting">
-                    <accessControl>
-                        <meetingPassword>{meeting_password}</meetingPassword>
-                    </accessControl>
-                    <metaData>
-                        <confName>{meeting_name}</confName>
-                        <meetingType>3</meetingType>
-                        <agenda>{meeting_agenda}</agenda>
-                    </metaData>
-                    <participants>
-                        <maxUserNumber>100</maxUserNumber>
-                    </participants>
-                    <enableOptions>
-                        <chat>true</chat>
-                        <poll>true</poll>
-                        <audioVideo>true</audioVideo>
-                        <supportE2E>false</supportE2E>
-                        <autoRecord>false</autoRecord>
-                    </enableOptions>
-                    <schedule>
-                        <startDate>{start_date}</startDate>
-                        <openTime>900</openTime>
-                        <joinTeleconfBeforeHost>false</joinTeleconfBeforeHost>
-                        <duration>{duration_minutes}</duration>
-                        <timeZoneID>22</timeZoneID>
-                        <hostWebExID>{owner}</hostWebExID>
-                    </schedule>
-                    """
-    create_meetings_xml_pt3 = """
-                </bodyContent>
-            </body>
-        </serv:message>
-    """
-    if input_repeatmeeting_pattern == None:
-        create_meetings_xml = create_meetings_xml_pt1 + create_meetings_xml_pt3
-    elif input_repeatmeeting_pattern == "daily":
-        create_meetings_xml_pt2 = """
-                    <repeat>
-                        <repeatType>{pattern}</repeatType>
-                        <interval>1</interval>
-                    </repeat>
-        """
-        create_meetings_xml = create_meetings_xml_pt1 + create_meetings_xml_pt2 + create_meetings_xml_pt3
-    elif input_repeatmeeting_pattern == "weekly":
-        create_meetings_xml_pt2 = """
-                    <repeat>
-                        <repeatType>{pattern}</repeatType>
-                        <interval>1</interval>
-                        <dayInWeek>
-                            <day>{dayInWeek}</day>
-                        </dayInWeek>
-                    </repeat>
-        """
-        create_meetings_xml = create_meetings_xml_pt1 + create_meetings_xml_pt2 + create_meetings_xml_pt3
-    elif input_repeatmeeting_pattern == "monthly":
-        create_meetings_xml_pt2 = """
-                    <repeat>
-                        <repeatType>{pattern}</repeatType>
-                        <interval>1</interval>
-                        <dayInMonth>{dayInMonth}</dayInMonth>
-                    </repeat>
-        """
-        create_meetings_xml = create_meetings_xml_pt1 + create_meetings_xml_pt2 + create_meetings_xml_pt3
-    elif input_repeatmeeting_pattern == "yearly":
-        create_meetings_xml_pt2 = """
-                    <repeat>
-                        <repeatType>{pattern}</repeatType>
-                        <monthInYear>{monthInYear}</monthInYear>
-                        <dayInMonth>{dayInMonth}</dayInMonth>
-                    </repeat>
-        """
-        create_meetings_xml = create_meetings_xml_pt1 + create_meetings_xml_pt2 + create_meetings_xml_pt3
-
-    return create_meetings_xml
+import os, time, urllib, uuid, requests, upstream, warmup, bulk, metrics, throttle, availability, search_index, static_assets, circuit, scheduler
+from flask import Flask, Blueprint, request, redirect, url_for, render_template, session, jsonify, g, abort, Response, current_app
+from settings import config, MS_LOGIN_API_URL, WEBEX_LOGIN_API_URL
+from session_store import create_session_store, ServerSideSessionInterface
+from tokens import TokenManager
+from scheduler import ticket_cache, directory, attendee_resolver, webex_host_permissions, webex_username_for, o365_calendars_for, schedule_meeting, validate_meeting_data, validate_groups
+from jobs import JobQueue
+from profiler import request_profiler
+from idempotency import submission_key
+from graph_batch import GraphBatchError
+
+# the pages of the app, registered on the Flask app by create_app()
+web = Blueprint('web', __name__)
+
+STATIC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+
+# the services of an app, built from its configuration by create_app() (and by async_main.py); nothing runs before start()
+class Services:
+    def __init__(self, app_config, jinja_env):
+        # the local copy of the O365 groups and the idempotency outcomes are kept in the files of app_config, opened on first use
+        scheduler.configure(app_config)
+        # submitted meetings are scheduled by background workers, from a queue that survives restarts
+        self.job_queue = JobQueue(app_config.get('jobs_sqlite_path') or "jobs.sqlite3", run_job,
+                                  workers=app_config.get('job_workers') or 4,
+                                  lease=app_config.get('job_lease') or 600)
+        # the OAuth tokens are refreshed shortly before they expire, instead of sending the user through both logins again
+        self.token_manager = TokenManager(refresh_margin=app_config.get('token_refresh_margin') or 300)
+        # fingerprinted and precompressed copies of the files in static/ (see static_assets.py), built on the first start and then reused
+        self.assets = static_assets.build(STATIC_PATH, app_config.get('static_build_path') or "static_build")
+        # the startup warm-up (see warmup.py), in the background with warmup_in_background (the default), so that /healthz answers right away
+        self.warmup = warmup.Warmup(warmup.tasks_for(app_config, jinja_env))
+        self.warmup_in_background = app_config.get('warmup_in_background', True)
+
+    # to start the job workers and the warm-up
+    def start(self):
+        self.job_queue.start()
+        self.warmup.start(background=self.warmup_in_background)
+
+
+# to run a job of the job queue: a submitted meeting, or the meetings of a bulk upload (see bulk.run_job)
+def run_job(kind="meeting", **payload):
+    if kind == "bulk":
+        return bulk.run_job(**payload)
+    return schedule_meeting(**payload)
+
+
+# to get the services of the app that handles the current request
+def services():
+    return current_app.extensions['webscheduler']
+
+
+# to get the URL of a file in static/ for the templates, its fingerprinted copy can be cached by browsers forever
+@web.app_template_global()
+def asset_url(filename):
+    path = services().assets.url_path(filename)
+    if path is None:
+        return url_for('static', filename=filename)
+    return url_for('web.static_asset', filename=path)
+
+
+# to time every request per route, incl. the upstream calls made for it; with server_timing_header: true in credentials.yml,
+# the breakdown is sent back in a Server-Timing header (shown e.g. in the network tab of the browser's developer tools)
+@web.before_app_request
+def start_timing():
+    g.request_started = time.perf_counter()
+    metrics.start_request()
+    # the upstream calls made for a page go ahead of background work in the rate limiter
+    throttle.set_priority(throttle.INTERACTIVE)
+    # with profiler_enabled in credentials.yml, the call stacks of the request are sampled (see profiler.py)
+    if request_profiler is not None:
+        g.profile = request_profiler.begin(request.url_rule.rule if request.url_rule is not None else "unmatched", request.method)
+
+
+@web.after_app_request
+def record_timing(response):
+    if 'request_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    timings = metrics.end_request()
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    metrics.observe_route(route, request.method, response.status_code, elapsed)
+    g.response_status = response.status_code
+    if config.get('server_timing_header'):
+        response.headers['Server-Timing'] = metrics.server_timing(timings, elapsed)
+    return response
+
+
+# the profile is ended when the request has been torn down, also if it failed with an exception
+@web.teardown_app_request
+def end_profile(exception=None):
+    if 'profile' in g:
+        request_profiler.end(g.pop('profile'), g.get('response_status', 500))
+
+
+# to make sure both access tokens of the session can be used, refreshing them if needed; returns False if the user has to log in again
+# the Webex session tickets were obtained with the old Webex access token, so they are renewed after it has been refreshed
+def fresh_tokens():
+    webex_username = session.get('webex_username')
+    token_manager = services().token_manager
+    return (token_manager.ensure_fresh(session, "webex", on_refresh=lambda: webex_username and ticket_cache.invalidate_user(webex_username))
+            and token_manager.ensure_fresh(session, "o365"))
+
+
+# to get the owners of the O365 calendars the user can edit and that the user may also schedule Webex Meetings for, in calendar order
+def eligible_owners(o365_calendars, owner_choice_webex, exclude=None):
+    webex_allowed_emails = set(owner_choice_webex)
+    owners = {}
+    for calendar in o365_calendars['value']:
+        email = calendar['owner']['address']
+        if calendar['canEdit'] == True and email in webex_allowed_emails and email != exclude:
+            owners[email] = True
+    return list(owners)
 
 
 # login page
-@app.route('/')
+@web.route('/')
 def mainpage_login():
-    global redirected
-    redirected = None
     return render_template('mainpage_login.html')
 
 
 # login redirects to Webex for user to provide login data
-@app.route('/webexlogin', methods=['POST'])
+@web.route('/webexlogin', methods=['POST'])
 def webexlogin():
     WEBEX_USER_AUTH_URL = WEBEX_LOGIN_API_URL + "/authorize?client_id={client_id}&response_type=code&redirect_uri={redirect_uri}&response_mode=query&scope={scope}".format(
         client_id=urllib.parse.quote(config['webex_integration_client_id']),
@@ -212,7 +149,7 @@ def webexlogin():
 
 
 # based on Webex login information, a Webex access token is retrieved
-@app.route('/webexoauth', methods=['GET'])
+@web.route('/webexoauth', methods=['GET'])
 def webexoauth():
     webex_code = request.args.get('code')
 
@@ -226,16 +163,15 @@ def webexoauth():
         'grant_type': 'authorization_code',
         'client_secret': config['webex_integration_client_secret']
     }
-    get_token = requests.post(WEBEX_LOGIN_API_URL + "/access_token?", headers=headers_token, data=body)
+    get_token = upstream.post(WEBEX_LOGIN_API_URL + "/access_token?", headers=headers_token, data=body, endpoint="webex.access_token")
 
-    global webex_access_token
-    webex_access_token = get_token.json()['access_token']
+    services().token_manager.store(session, "webex", get_token.json())
 
     return redirect(url_for('.o365login'))
 
 
 # login to O365, same workflow as with Webex (will not be visible to user if Webex SSO login uses Microsoft Azure as IdP)
-@app.route("/o365login")
+@web.route("/o365login")
 def o365login():
     MS_USER_AUTH_URL = MS_LOGIN_API_URL + "/authorize?client_id={client_id}&response_type=code&redirect_uri={redirect_uri}&response_mode=query&scope={scope}".format(
         client_id=config['azure_client_id'],
@@ -245,7 +181,7 @@ def o365login():
     return redirect(MS_USER_AUTH_URL)
 
 
-@app.route('/o365oauth', methods=['GET'])
+@web.route('/o365oauth', methods=['GET'])
 def o365_oauth():
     o365_code = request.args.get('code')
 
@@ -260,72 +196,73 @@ def o365_oauth():
         'grant_type': 'authorization_code',
         'client_secret': config['azure_client_secret']
     }
-    get_token = requests.post(MS_LOGIN_API_URL + "/token?", headers=headers_token, data=body)
+    get_token = upstream.post(MS_LOGIN_API_URL + "/token?", headers=headers_token, data=body, endpoint="ms.token")
 
-    global o365_access_token
-    o365_access_token = get_token.json()['access_token']
+    services().token_manager.store(session, "o365", get_token.json())
 
     return redirect(url_for('.mainpage'))
 
 
 # main page for the user to provide meeting information in the HTML form
-@app.route('/mainpage')
+@web.route('/mainpage')
 def mainpage():
-    # to get the username of the Webex user, here equal to email address
-    global webex_username
-    webex_me_details = requests.get('https://webexapis.com/v1/people/me', headers={'Authorization': 'Bearer ' + webex_access_token}).json()
-    webex_username = webex_me_details['emails'][0]
-
-    # to get a session ticket from the Webex access token and that is required for using the Webex XML API
-    global webex_session_ticket
-    webex_session_ticket = webex_meetings_session_ticket(webex_username)
+    # to send the user back to the login page if the session has expired
+    if not fresh_tokens():
+        return redirect(url_for('.mainpage_login'))
+    webex_access_token = session['webex_access_token']
+    o365_access_token = session['o365_access_token']
 
     # to collect information for the meeting form that are based on the user's O365 and Webex permissions
-    headers_group = {
-        "Authorization": "Bearer " + o365_access_token
-    }
+    # the O365 lookups do not depend on the Webex user, so they run concurrently with the Webex lookups below
+    directory_future = upstream.submit(directory.ensure_synced, o365_access_token)
+    calendars_future = upstream.submit(o365_calendars_for, o365_access_token)
 
-    # to populate the required and optional participant field in the HTML form, based on O365 email groups
-    global o365_groups
-    group_choice = []
-    o365_groups = requests.get(MS_GRAPH_API_URL + "/v1.0/groups", headers=headers_group)
-    for group in o365_groups.json()['value']:
-        email = group['mail']
-        group_choice.append(email)
-
-    # to populate the meeting host/owner field in the HTML form, requirement: user must have editing rights to the O365 calendar and Webex scheduling permissions
-    global o365_owner
-    o365_owner = requests.get(MS_GRAPH_API_URL + "/v1.0/me/calendars", headers=headers_group).json()
-    owner_choice_o365 = []
-    for calendar in o365_owner['value']:
-        if calendar['canEdit'] == True:
-            owner_choice_o365_email = calendar['owner']['address']
-            owner_choice_o365.append(owner_choice_o365_email)
-    # to only allow owners/hosts of calendars users have both O365 edit rights and Webex scheduling permissions
-    owner_choice_webex = webex_host_permissions()
-    owner_choice = [webex_username] # own calendar is always an option
-    for o365_allowed_email in owner_choice_o365:
-        for webex_allowed_email in owner_choice_webex:
-            if o365_allowed_email == webex_allowed_email:
-                z = webex_allowed_email
-                owner_choice.append(z)
-
-    # to check if it is a redirect from a submitted form
-    if redirected == "success":
-        alert = 1
-    elif redirected == "failure":
-        alert = 2
-    else:
-        alert = None
+    # to get the username of the Webex user, here equal to email address, and the users the Webex user may schedule meetings for
+    # if Webex or O365 cannot be reached, the results of the user's last page load are used and the page says so (stale_since)
+    webex_username, username_stale = circuit.with_fallback(session, 'webex_username', webex_username_for, webex_access_token)
+    owner_choice_webex, permissions_stale = circuit.with_fallback(session, 'webex_host_permissions', webex_host_permissions, webex_username, webex_access_token)
 
-    return render_template('mainpage.html', group_choice=group_choice, owner_choice=owner_choice, alert=alert)
+    # the required and optional participant fields of the HTML form search the O365 email groups (see /search/groups)
+    directory_future.result()
 
+    # the meeting host/owner field searches the eligible hosts (see /search/hosts), requirement: user must have editing rights to the O365 calendar and Webex scheduling permissions
+    o365_owner, calendars_stale = circuit.with_fallback(session, 'o365_owner', calendars_future.result)
+    session['owner_choice'] = [webex_username] + eligible_owners(o365_owner, owner_choice_webex, exclude=webex_username) # own calendar is always an option
+    stale_since = min([stale for stale in (username_stale, permissions_stale, calendars_stale) if stale is not None], default=None)
 
-# to retrieve the information from the HTML form after the form is submitted
-@app.route('/submit', methods=['POST'])
-def submit():
-    req = request.form
+    # to check if it is a redirect from a submitted form, the page then polls the status of the job
+    job_id = session.pop('pending_job', None)
+
+    return render_template('mainpage.html', default_owner=webex_username, job_id=job_id, submit_key=issue_submit_key(session),
+                           stale_since=time.strftime("%H:%M", time.localtime(stale_since)) if stale_since is not None else None)
 
+
+# typeahead search over the O365 email groups for the participant fields of the HTML form, query arguments q, offset and limit
+@web.route('/search/groups', methods=['GET'])
+def search_groups():
+    if 'webex_username' not in session:
+        return jsonify({"error": "not logged in"}), 401
+    try:
+        page = directory.search(*search_index.search_arguments(request.args))
+    except ValueError:
+        return jsonify({"error": "offset and limit must be numbers"}), 400
+    page['results'] = [{"mail": group['mail'], "displayName": group['displayName']} for group in page['results']]
+    return jsonify(page)
+
+
+# typeahead search over the hosts the user may schedule meetings for, as found when the main page was loaded
+@web.route('/search/hosts', methods=['GET'])
+def search_hosts():
+    if 'owner_choice' not in session:
+        return jsonify({"error": "not logged in"}), 401
+    try:
+        return jsonify(search_index.host_index(tuple(session['owner_choice'])).search(*search_index.search_arguments(request.args)))
+    except ValueError:
+        return jsonify({"error": "offset and limit must be numbers"}), 400
+
+
+# to get the meeting data from the submitted HTML form (also used by the async mode, see async_main.py)
+def meeting_data_from_form(req):
     # to check whether checkboxes were ticked in the HTML form and store the values accordingly
     if "repeatmeeting" in req.keys():
         input_repeatmeeting_pattern = req["pattern"]
@@ -341,8 +278,6 @@ def submit():
     else:
         input_CCrecipients_dropdown = None
 
-    # to make the information globally available
-    global meeting_data
     meeting_data = {
         "input_title": req["title"],
         "input_agenda": req["agenda"],
@@ -354,247 +289,198 @@ def submit():
         "input_recipients_dropdown": input_recipients_dropdown,
         "input_CCrecipients_dropdown": input_CCrecipients_dropdown
     }
-
-    return redirect(url_for('.invite'))
-
-
-# to prepare and send the O365 meeting invite, incl. Webex Meetings details
-@app.route('/invite', methods=['GET'])
-def invite():
-    # to get the information required for the O365 and Webex invite and prepare it for the right format
-    input_title = meeting_data['input_title']
-    input_agenda = meeting_data['input_agenda']
-    input_date = meeting_data['input_date']
-    input_date_year = int(input_date[:4])
-    input_date_month = int(input_date[5:7])
-    input_date_day = int(input_date[8:10])
-    weekdays = ("MONDAY", "TUESDAY", "WEDNESDAY", "THURSDAY", "FRIDAY", "SATURDAY", "SUNDAY")
-    input_date_weekday = weekdays[datetime.date(input_date_year, input_date_month, input_date_day).weekday()]
-    input_time_start = meeting_data['input_time_start']
-    input_time_start_hour = int(input_time_start[:2])
-    input_time_start_minute = int(input_time_start[3:])
-    input_time_start_outlook = str(input_date + "T" + input_time_start + ":00")
-    input_time_start_webex = str(input_date_month) + "/" + str(input_date_day) + "/" + str(input_date_year) + " " + str(input_time_start) + ":00"
-    input_time_end = meeting_data['input_time_end']
-    input_time_end_hour = int(input_time_end[:2])
-    input_time_end_minute = int(input_time_end[3:])
-    input_time_end_outlook = str(input_date + "T" + input_time_end + ":00")
-    input_repeatmeeting_pattern = meeting_data["input_repeatmeeting_pattern"]
-    input_owner = meeting_data["input_owner"]
-    input_recipients_dropdown = meeting_data['input_recipients_dropdown']
-    input_CCrecipients_dropdown = meeting_data['input_CCrecipients_dropdown']
-    input_meeting_duration = datetime.datetime(input_date_year, input_date_month, input_date_day, input_time_end_hour, input_time_end_minute) - datetime.datetime(input_date_year, input_date_month, input_date_day, input_time_start_hour, input_time_start_minute)
-    input_meeting_duration_int = int(input_meeting_duration.seconds / 60)
-
-    # to create a valid Webex Meetings password
-    meeting_password_criteria = string.ascii_lowercase + "".join([str(i) for i in range(0, 11)])
-    meeting_password = ''.join(random.choice(meeting_password_criteria) for i in range(8))
-
-    # to schedule a Webex Meeting
-    webex_meetings_xml = create_meetings_xml(input_repeatmeeting_pattern)
-    if input_repeatmeeting_pattern == None:
-        body = webex_meetings_xml.format(webex_username=webex_username,
-                                         webex_session_ticket=webex_session_ticket,
-                                         webex_site_name=config['webex_site'],
-                                         meeting_password=meeting_password,
-                                         meeting_name=input_title,
-                                         meeting_agenda=input_agenda,
-                                         start_date=input_time_start_webex,
-                                         duration_minutes=input_meeting_duration_int,
-                                         owner=input_owner
-                                         )
-    elif input_repeatmeeting_pattern == "daily":
-        body = webex_meetings_xml.format(webex_username=webex_username,
-                                         webex_session_ticket=webex_session_ticket,
-                                         webex_site_name=config['webex_site'],
-                                         meeting_password=meeting_password,
-                                         meeting_name=input_title,
-                                         meeting_agenda=input_agenda,
-                                         start_date=input_time_start_webex,
-                                         duration_minutes=input_meeting_duration_int,
-                                         owner=input_owner,
-                                         pattern=input_repeatmeeting_pattern.upper()
-                                         )
-    elif input_repeatmeeting_pattern == "weekly":
-        body = webex_meetings_xml.format(webex_username=webex_username,
-                                         webex_session_ticket=webex_session_ticket,
-                                         webex_site_name=config['webex_site'],
-                                         meeting_password=meeting_password,
-                                         meeting_name=input_title,
-                                         meeting_agenda=input_agenda,
-                                         start_date=input_time_start_webex,
-                                         duration_minutes=input_meeting_duration_int,
-                                         owner=input_owner,
-                                         pattern=input_repeatmeeting_pattern.upper(),
-                                         dayInWeek=input_date_weekday
-                                         )
-    elif input_repeatmeeting_pattern == "monthly":
-        body = webex_meetings_xml.format(webex_username=webex_username,
-                                         webex_session_ticket=webex_session_ticket,
-                                         webex_site_name=config['webex_site'],
-                                         meeting_password=meeting_password,
-                                         meeting_name=input_title,
-                                         meeting_agenda=input_agenda,
-                                         start_date=input_time_start_webex,
-                                         duration_minutes=input_meeting_duration_int,
-                                         owner=input_owner,
-                                         pattern=input_repeatmeeting_pattern.upper(),
-                                         dayInMonth=input_date_day
-                                         )
-    elif input_repeatmeeting_pattern == "yearly":
-        body = webex_meetings_xml.format(webex_username=webex_username,
-                                         webex_session_ticket=webex_session_ticket,
-                                         webex_site_name=config['webex_site'],
-                                         meeting_password=meeting_password,
-                                         meeting_name=input_title,
-                                         meeting_agenda=input_agenda,
-                                         start_date=input_time_start_webex,
-                                         duration_minutes=input_meeting_duration_int,
-                                         owner=input_owner,
-                                         pattern=input_repeatmeeting_pattern.upper(),
-                                         monthInYear=input_date_month,
-                                         dayInMonth=input_date_day
-                                         )
-    meeting_creation_xml = requests.post(WEBEX_MEETINGS_API_URL, data=body)
-
-    # to prepare the Webex Meeting to send in the O365 invite
-    if meeting_creation_xml.status_code == requests.codes.ok:
-        d = xml_to_dict(meeting_creation_xml.text)
-
-        meeting_password = d['serv:message']['serv:body']['serv:bodyContent']['meet:meetingPassword']
-
-        # Extract meeting link from iCal
-        ical_link = d['serv:message']['serv:body']['serv:bodyContent']['meet:iCalendarURL']['serv:host']
-
-        resp_ical = requests.get(ical_link)
-
-        if resp_ical.status_code == requests.codes.ok:
-            ics_cal = icalendar.Calendar.from_ical(resp_ical.text)
-
-            # Extract meeting
-            for comp in ics_cal.walk():
-                if comp.name == "VEVENT":
-                    descr = comp.get('X-ALT-DESC')
-                    # Add the meeting password
-                    descr = descr.replace("Please obtain your meeting password from your host.",
-                                          meeting_password)
-                    outlook_content = descr
-
-    # to define the headers for O365 API calls
-    headers_event = {
-        "Content-type": "application/json",
-        "Authorization": "Bearer " + o365_access_token
+    return meeting_data
+
+
+# to check the host and the groups of a submitted form (also used by the async mode, see async_main.py): the host must be one of the
+# hosts found for the user by mainpage() and the groups must be in the directory; raises ValueError if not, before anything is scheduled
+def check_form_choices(meeting_data, user_session):
+    if meeting_data['input_owner'] not in (user_session.get('owner_choice') or []):
+        raise ValueError("you may not schedule meetings for " + meeting_data['input_owner'])
+    directory.ensure_synced(user_session['o365_access_token'])
+    validate_groups(meeting_data)
+
+
+# to issue the idempotency key of a rendered HTML form, the keys of the last forms shown to the user are kept in the session
+def issue_submit_key(user_session):
+    submit_key = uuid.uuid4().hex
+    user_session['submit_keys'] = (user_session.get('submit_keys') or [])[-19:] + [submit_key]
+    return submit_key
+
+
+# to add the job that schedules the meeting of a submitted form (also used by the async mode, see async_main.py)
+# a form that is submitted again with the same key and data, e.g. by a browser refresh or a retry, gets the job of its first submission
+def enqueue_meeting(job_queue, meeting_data, submit_key, user_session):
+    payload = {
+        "meeting_data": meeting_data,
+        "webex_username": user_session['webex_username'],
+        "webex_access_token": user_session['webex_access_token'],
+        "o365_access_token": user_session['o365_access_token'],
+        "o365_calendars": user_session['o365_owner']
     }
+    idempotency_key = None
+    if submit_key and submit_key in (user_session.get('submit_keys') or []):
+        idempotency_key = payload['idempotency_key'] = submission_key(user_session['webex_username'], submit_key, meeting_data)
+    return job_queue.enqueue(payload, idempotency_key=idempotency_key)
 
-    # to get the email addresses of people as part of the O365 group if chosen as required and/or optional participants in the HTML form
-    attendees = []
-    if input_recipients_dropdown != None:
-        for item in o365_groups.json()['value']:
-            if item['mail'] == input_recipients_dropdown:
-                group_id = item['id']
-                recipient_group_required = requests.get(MS_GRAPH_API_URL + "/v1.0/groups/" + group_id + "/members",
-                                               headers=headers_event)
-                for mail in recipient_group_required.json()['value']:
-                    mail_address = mail['mail']
-                    recipient_name = mail['displayName']
-                    attendees.append(
-                        {
-                            "emailAddress": {
-                                "address": mail_address,
-                                "name": recipient_name
-                            },
-                            "type": "required"
-                        }
-                    )
-    if input_CCrecipients_dropdown != None:
-        for item in o365_groups.json()['value']:
-            if item['mail'] == input_CCrecipients_dropdown:
-                group_id = item['id']
-                recipient_group_optional = requests.get(MS_GRAPH_API_URL + "/v1.0/groups/" + group_id + "/members",
-                                               headers=headers_event)
-                for mail in recipient_group_optional.json()['value']:
-                    mail_address = mail['mail']
-                    recipient_name = mail['displayName']
-                    attendees.append(
-                        {
-                            "emailAddress": {
-                                "address": mail_address,
-                                "name": recipient_name
-                            },
-                            "type": "optional"
-                        }
-                    )
-
-    # to prepare the O365 meeting invite body based on the information provided and gathered above
-    o365_invite = {
-        "subject": input_title,
-        "body": {
-            "contentType": "HTML",
-            "content": input_agenda + "\n" + outlook_content
-        },
-        "start": {
-            "dateTime": input_time_start_outlook,
-            "timeZone": "W. Europe Standard Time"
-        },
-        "end": {
-            "dateTime": input_time_end_outlook,
-            "timeZone": "W. Europe Standard Time"
-        },
-        "location": {
-            "displayName": "@webex"
-        },
-        "attendees": attendees,
-        "allowNewTimeProposals": True
-    }
 
-    # to add recurrence information to the O365 invite if it is a repeated meeting
-    if input_repeatmeeting_pattern != None:
-        if input_repeatmeeting_pattern == "daily":
-            pattern = {
-                "type": "daily",
-                "interval": 1,
-            }
-        elif input_repeatmeeting_pattern == "weekly":
-            pattern = {
-                "type": "daily",
-                "interval": 7
-            }
-        elif input_repeatmeeting_pattern == "monthly":
-            pattern = {
-                "type": "absoluteMonthly",
-                "interval": 1,
-                "dayOfMonth": input_date_day,
-            }
-        elif input_repeatmeeting_pattern == "yearly":
-            pattern = {
-                "type": "absoluteYearly",
-                "interval": 1,
-                "dayOfMonth": input_date_day,
-                "month": input_date_month
-            }
-        range_noEnd = {
-            "type": "noEnd",
-            "startDate": input_date,
-        }
-        o365_invite['recurrence'] = {"pattern": pattern, "range": range_noEnd}
-
-    # to get the correct calendar to schedule the meeting for, depending on the information of the meeting host/owner in the HTML form
-    for calendar in o365_owner['value']:
-        if calendar['canEdit'] == True:
-            if calendar['owner']['address'] == input_owner:
-                calendar_id = calendar['id']
-
-    # to send the API call to create the O365 meeting with the information provided and gathered before
-    outlook_invite = requests.post(MS_GRAPH_API_URL + '/v1.0/me/calendars/' + calendar_id +  '/events', headers=headers_event, json=o365_invite)
-
-    # to provide the correct feedback to the user when having submitted the form
-    global redirected
-    if outlook_invite.status_code == requests.codes.created:
-        redirected = "success"
-    else:
-        redirected = "failure"
+# to retrieve the information from the HTML form after the form is submitted
+@web.route('/submit', methods=['POST'])
+def submit():
+    meeting_data = meeting_data_from_form(request.form)
+
+    # to send the O365 meeting invite in the background; the user is sent back to the main page, which polls the status of the job
+    if 'o365_owner' not in session or 'webex_username' not in session or not fresh_tokens():
+        return redirect(url_for('.mainpage_login'))
+    # a form with a missing field or an invalid date is rejected here, instead of becoming a job that fails
+    try:
+        meeting_data = validate_meeting_data(meeting_data)
+        check_form_choices(meeting_data, session)
+    except ValueError as e:
+        abort(400, str(e))
+    job_id = enqueue_meeting(services().job_queue, meeting_data, request.form.get('submit_key'), session)
+    session['jobs'] = (session.get('jobs') or [])[-19:] + [job_id]
+    session['pending_job'] = job_id
     return redirect(url_for('.mainpage'))
 
 
+# to check the availability of the owner and of the members of the chosen groups (see availability.py) for the meeting data
+# of the HTML form (also used by the async mode, see async_main.py)
+def availability_for(meeting_data, o365_access_token):
+    directory.ensure_synced(o365_access_token)
+    attendees = attendee_resolver.resolve(meeting_data['input_recipients_dropdown'], meeting_data['input_CCrecipients_dropdown'], o365_access_token)
+    return availability.check_availability(meeting_data, attendees, o365_access_token)
+
+
+# to check the availability for the filled in HTML form before it is submitted; responds with the conflicts and the next free slots
+@web.route('/availability', methods=['POST'])
+def availability_check():
+    if 'webex_username' not in session or not fresh_tokens():
+        return jsonify({"error": "not logged in"}), 401
+    try:
+        meeting_data = meeting_data_from_form(request.form)
+        check_form_choices(meeting_data, session)
+        return jsonify(availability_for(meeting_data, session['o365_access_token']))
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except (GraphBatchError, requests.RequestException) as e: # incl. circuit.CircuitOpenError
+        return jsonify({"error": str(e)}), 502
+
+
+# to get the status of a submitted meeting, only for the user who submitted it
+@web.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = services().job_queue.get(job_id) if job_id in (session.get('jobs') or []) else None
+    if job == None:
+        return jsonify({"error": "unknown job"}), 404
+    return jsonify(job)
+
+
+# to schedule several meetings at once from an uploaded CSV or JSON file (form field "file"), or a JSON list in the request body
+# the meetings are scheduled by a background job, as that can take minutes; responds with the job (202), whose result at /jobs/<id>
+# holds one report per meeting
+@web.route('/bulk', methods=['POST'])
+def bulk_schedule():
+    if 'o365_owner' not in session or 'webex_username' not in session or not fresh_tokens():
+        return jsonify({"error": "not logged in"}), 401
+
+    try:
+        if request.is_json:
+            rows = bulk.parse_meetings(request.get_data(as_text=True), "json")
+        elif 'file' in request.files:
+            upload = request.files['file']
+            file_format = request.form.get('format') or ("json" if upload.filename.lower().endswith(".json") else "csv")
+            rows = bulk.parse_meetings(upload.read().decode("utf-8-sig"), file_format)
+        else:
+            raise ValueError("no meetings given")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    job_id = services().job_queue.enqueue({
+        "kind": "bulk",
+        "rows": rows,
+        "webex_username": session['webex_username'],
+        "webex_access_token": session['webex_access_token'],
+        "o365_access_token": session['o365_access_token'],
+        "o365_calendars": session['o365_owner']
+    })
+    session['jobs'] = (session.get('jobs') or [])[-19:] + [job_id]
+    return jsonify({"job_id": job_id, "status_url": url_for('.job_status', job_id=job_id)}), 202
+
+
+# fingerprinted static files, compressed as the browser accepts it; a browser that revalidates one gets a 304
+@web.route('/assets/<path:filename>', methods=['GET'])
+def static_asset(filename):
+    status, headers, body = services().assets.response(filename, request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match'))
+    if status == 404:
+        abort(404)
+    return Response(body, status=status, headers=headers)
+
+
+# metrics of this process in the Prometheus text format; if metrics_token is set in credentials.yml, it must be sent as bearer token
+@web.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if config.get('metrics_token') and request.headers.get('Authorization') != "Bearer " + config['metrics_token']:
+        abort(401)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+# to check the bearer token of the admin endpoints; they are only available if admin_token is set in credentials.yml
+def require_admin():
+    if not config.get('admin_token') or request.headers.get('Authorization') != "Bearer " + config['admin_token']:
+        abort(404 if not config.get('admin_token') else 401)
+
+
+# the profiles captured by the profiler of this worker process (see profiler.py), newest first
+@web.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    require_admin()
+    return jsonify(request_profiler.profiles() if request_profiler is not None else [])
+
+
+# a captured profile in the collapsed-stack format, e.g. for flamegraph.pl or https://www.speedscope.app
+@web.route('/admin/profiles/<name>', methods=['GET'])
+def download_profile(name):
+    require_admin()
+    path = request_profiler.profile_path(name) if request_profiler is not None else None
+    if path is None:
+        abort(404)
+    with open(path) as f:
+        return Response(f.read(), mimetype="text/plain", headers={"Content-Disposition": "attachment; filename=" + name})
+
+
+# liveness probe: the process answers requests
+@web.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({"status": "ok"})
+
+
+# readiness probe for the load balancer: 503 until the startup warm-up (see warmup.py) is done
+@web.route('/readyz', methods=['GET'])
+def readyz():
+    startup = services().warmup
+    return jsonify(startup.status()), 200 if startup.ready.is_set() else 503
+
+
+# to create the Flask app, with the per-user state (tokens, session ticket, O365 data, form data) kept in a server-side session,
+# and to start its job workers and warm-up; app_config defaults to credentials.yml (see settings.py)
+# app_config is used for the app and its services; the upstream URLs, rate limits, circuit breakers and caches are shared
+# by the whole process and are read by their modules from settings.py
+# the WSGI app is created by wsgi.py (e.g. gunicorn wsgi:app); flask run finds this factory itself
+def create_app(app_config=None):
+    started = time.perf_counter()
+    app_config = app_config if app_config is not None else config
+    app = Flask(__name__)
+    # the secret key must be set in credentials.yml when running several worker processes, so that all of them accept the same session cookie
+    app.secret_key = app_config.get('flask_secret_key') or os.urandom(32)
+    app.session_interface = ServerSideSessionInterface(create_session_store(app_config))
+    app.register_blueprint(web)
+
+    app.extensions['webscheduler'] = Services(app_config, app.jinja_env)
+    app.extensions['webscheduler'].start()
+    warmup.startup_seconds.set(time.perf_counter() - started, "create_app")
+    return app
+
+
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    create_app().run()
\ No newline at end of file
@@ -0,0 +1,186 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import bisect, contextvars, threading
+
+# in-process metrics of the app (upstream calls by endpoint name, Flask routes), exposed in the Prometheus text format
+# every worker process has its own metrics, so with several workers each of them has to be scraped
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = ['{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} counter".format(self.name)]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append("{}{} {}".format(self.name, _labels(self.labels, label_values), _number(value)))
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = "# TYPE {} gauge".format(self.name)
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    # the counts are kept per bucket and only made cumulative when rendered
+    def observe(self, value, *label_values):
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} histogram".format(self.name)]
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    le = 'le="{}"'.format(bound if bound == "+Inf" else _number(bound))
+                    lines.append("{}_bucket{} {}".format(self.name, _labels(self.labels, label_values, le), cumulative))
+                lines.append("{}_sum{} {}".format(self.name, _labels(self.labels, label_values), _number(total)))
+                lines.append("{}_count{} {}".format(self.name, _labels(self.labels, label_values), count))
+        return lines
+
+
+upstream_duration = Histogram("webscheduler_upstream_request_duration_seconds",
+                              "Latency of the calls to Microsoft and Webex (until the response headers for streamed downloads).", ("endpoint",))
+upstream_requests = Counter("webscheduler_upstream_requests_total", "Calls to Microsoft and Webex by HTTP status.", ("endpoint", "code"))
+upstream_faults = Counter("webscheduler_upstream_faults_total", "Calls to Microsoft and Webex that failed without a response.", ("endpoint", "error"))
+upstream_request_size = Histogram("webscheduler_upstream_request_size_bytes", "Size of the request bodies sent to Microsoft and Webex.",
+                                  ("endpoint",), SIZE_BUCKETS)
+upstream_response_size = Histogram("webscheduler_upstream_response_size_bytes", "Size of the response bodies received from Microsoft and Webex.",
+                                   ("endpoint",), SIZE_BUCKETS)
+batched_requests = Counter("webscheduler_graph_batched_requests_total", "Requests sent inside a Graph $batch by HTTP status.", ("endpoint", "code"))
+route_duration = Histogram("webscheduler_http_request_duration_seconds", "Latency of the app's own routes.", ("route", "method"))
+route_requests = Counter("webscheduler_http_requests_total", "Requests to the app's own routes by HTTP status.", ("route", "method", "code"))
+
+REGISTRY = [upstream_duration, upstream_requests, upstream_faults, upstream_request_size, upstream_response_size, batched_requests,
+            route_duration, route_requests]
+
+
+# the upstream calls of the current Flask request, for the Server-Timing header: a list of (endpoint, seconds), or None outside of a request
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def start_request():
+    _request_timings.set([])
+
+
+def end_request():
+    timings = _request_timings.get()
+    _request_timings.set(None)
+    return timings or []
+
+
+def _body_size(body):
+    if body is None:
+        return 0
+    return len(body.encode() if isinstance(body, str) else body) if isinstance(body, (str, bytes)) else 0
+
+
+# to record an upstream call; response is None if the call failed with error (an exception)
+def observe_upstream(endpoint, seconds, response=None, error=None, streamed=False):
+    upstream_duration.observe(seconds, endpoint)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((endpoint, seconds))
+    if response is None:
+        upstream_faults.inc(endpoint, type(error).__name__)
+        return
+    upstream_requests.inc(endpoint, str(response.status_code))
+    # requests keeps the sent body in request.body, httpx (async mode) in request.content
+    request = response.request
+    upstream_request_size.observe(_body_size(getattr(request, 'body', None) if hasattr(request, 'body') else getattr(request, 'content', None)), endpoint)
+    if streamed:
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit():
+            upstream_response_size.observe(int(length), endpoint)
+    else:
+        upstream_response_size.observe(len(response.content or b""), endpoint)
+
+
+def observe_route(route, method, status_code, seconds):
+    route_duration.observe(seconds, route, method)
+    route_requests.inc(route, method, str(status_code))
+
+
+# to build the Server-Timing header value of a request from its upstream calls (summed up per endpoint) and its total time
+def server_timing(timings, total_seconds):
+    per_endpoint = {}
+    for endpoint, seconds in timings:
+        entry = per_endpoint.setdefault(endpoint, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+    parts = ['{};dur={:.1f};desc="{} call{}"'.format(endpoint, seconds * 1000, count, "" if count == 1 else "s")
+             for endpoint, (seconds, count) in per_endpoint.items()]
+    parts.append("total;dur={:.1f}".format(total_seconds * 1000))
+    return ", ".join(parts)
+
+
+# to render all metrics in the Prometheus text exposition format
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
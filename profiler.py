@@ -0,0 +1,161 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import collections, contextvars, os, random, re, sys, threading, time
+from settings import config
+
+# opt-in sampling profiler for the routes of the app: while a request runs, a background thread records the call stack of the
+# thread handling it (and of the threads working for it, see run) every interval seconds; the profile of a request is kept if the
+# request was slower than slow_threshold seconds, or for a random sample_rate share of all requests
+# profiles are written in the collapsed-stack format ("frame;frame;frame <samples>" per line, as read by flamegraph.pl or speedscope)
+# to a folder that keeps the last max_profiles of them; when the profiler is not enabled, none of this runs
+
+PROFILE_NAME = re.compile(r"^(\d{13})_([A-Z]+)_([\w.-]+?)_(\d{3})_(\d+)ms\.folded$")
+
+_current = contextvars.ContextVar("profile", default=None)
+
+
+class Profile:
+    def __init__(self, route, method, sampled):
+        self.route = route
+        self.method = method
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.created = time.time()
+        self.stacks = collections.Counter()
+
+
+class Profiler:
+    def __init__(self, path, interval=0.01, sample_rate=0.01, slow_threshold=2.0, max_profiles=50):
+        self.path = path
+        self.interval = interval
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.max_profiles = max_profiles
+        self._threads = {} # thread ident -> (profile, root frame name)
+        self._labels = {}
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    def _start_sampler(self):
+        with self._lock:
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+                self._sampler.start()
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = "{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+        return label
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            if not self._threads:
+                continue
+            frames = sys._current_frames()
+            for ident, (profile, root) in list(self._threads.items()):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                if stack:
+                    stack.append(root)
+                    profile.stacks[";".join(reversed(stack))] += 1
+
+    # to start profiling the request handled by the current thread, returns the profile to pass to end
+    def begin(self, route, method):
+        self._start_sampler()
+        profile = Profile(route, method, random.random() < self.sample_rate)
+        self._threads[threading.get_ident()] = (profile, "request")
+        _current.set(profile)
+        return profile
+
+    # to stop profiling the request, and to write its profile if it is kept
+    def end(self, profile, status):
+        self._threads.pop(threading.get_ident(), None)
+        _current.set(None)
+        duration = time.perf_counter() - profile.started
+        if profile.stacks and (profile.sampled or duration >= self.slow_threshold):
+            # a copy, as the sampler may still be adding a last sample
+            self._write(profile, dict(profile.stacks), status, duration)
+
+    # to run a function for the profiled request of the context, e.g. in a thread of upstream.submit, sampling this thread as well
+    def run(self, function, *args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return function(*args, **kwargs)
+        ident = threading.get_ident()
+        self._threads[ident] = (profile, "worker")
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self._threads.pop(ident, None)
+
+    # to write a profile; the name holds its metadata, so that listing the profiles does not need to read them
+    def _write(self, profile, stacks, status, duration):
+        os.makedirs(self.path, exist_ok=True)
+        name = "{}_{}_{}_{}_{}ms.folded".format(int(profile.created * 1000), profile.method,
+                                                re.sub(r"[^\w.-]+", "-", profile.route).strip("-") or "-", status, int(duration * 1000))
+        temporary = os.path.join(self.path, name + ".tmp")
+        with open(temporary, "w") as f:
+            for stack, samples in sorted(stacks.items(), key=lambda item: item[1], reverse=True):
+                f.write("{} {}\n".format(stack, samples))
+        os.replace(temporary, os.path.join(self.path, name))
+        for old_name in [stored['name'] for stored in self.profiles()][self.max_profiles:]:
+            try:
+                os.remove(os.path.join(self.path, old_name))
+            except OSError: # removed by another worker process in the meantime
+                pass
+
+    # to list the stored profiles, newest first
+    def profiles(self):
+        if not os.path.isdir(self.path):
+            return []
+        profiles = []
+        for name in os.listdir(self.path):
+            match = PROFILE_NAME.match(name)
+            if match:
+                profiles.append({"name": name, "created": int(match.group(1)) / 1000, "method": match.group(2), "route": match.group(3),
+                                 "status": int(match.group(4)), "duration_ms": int(match.group(5))})
+        return sorted(profiles, key=lambda profile: profile['created'], reverse=True)
+
+    # to get the path of a stored profile, or None if there is no profile of that name
+    def profile_path(self, name):
+        if not PROFILE_NAME.match(name or ""):
+            return None
+        path = os.path.join(self.path, name)
+        return path if os.path.isfile(path) else None
+
+
+# the profiler of this process, None unless profiler_enabled is set in credentials.yml
+request_profiler = None
+if config.get('profiler_enabled'):
+    request_profiler = Profiler(config.get('profiler_path') or "profiles",
+                                interval=config.get('profiler_interval') or 0.01,
+                                sample_rate=config.get('profiler_sample_rate') or 0,
+                                slow_threshold=config.get('profiler_slow_threshold') or 2.0,
+                                max_profiles=config.get('profiler_max_profiles') or 50)
+
+
+# to run a function in another thread for the current request (see upstream.submit)
+def run(function, *args, **kwargs):
+    if request_profiler is None:
+        return function(*args, **kwargs)
+    return request_profiler.run(function, *args, **kwargs)
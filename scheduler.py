@@ -0,0 +1,317 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import datetime, string, random, requests, upstream, webex_xml, graph_batch, join_details
+from settings import config, MS_GRAPH_API_URL, WEBEX_LOGIN_API_URL, WEBEX_MEETINGS_API_URL
+from ticket_cache import TicketCache
+from directory_sync import GroupDirectory
+from attendees import AttendeeResolver
+from idempotency import OutcomeStore
+
+REPEAT_PATTERNS = ("daily", "weekly", "monthly", "yearly")
+
+# Webex Meetings XML API session tickets are reused until shortly before they expire
+webex_xml.session_ticket_exception_ids.update(config.get('webex_ticket_expired_exception_ids') or [])
+ticket_cache = TicketCache(default_ttl=config.get('webex_session_ticket_ttl') or 5400)
+
+# local copy of the O365 groups, kept up to date with Graph delta queries instead of being fetched on every page load
+directory = GroupDirectory(config.get('directory_sqlite_path') or "directory.sqlite3",
+                           sync_interval=config.get('directory_sync_interval') or 300)
+
+# group memberships are expanded (incl. nested groups) and cached for group_members_cache_ttl seconds
+attendee_resolver = AttendeeResolver(directory, ttl=config.get('group_members_cache_ttl') or 300)
+
+# the steps a submission has completed are kept for idempotency_ttl seconds, so that it is never scheduled twice
+outcomes = OutcomeStore(config.get('idempotency_sqlite_path') or "idempotency.sqlite3", ttl=config.get('idempotency_ttl') or 86400)
+
+
+# to use the directory copy and the outcome store of an app's configuration (see main.Services) instead of those of credentials.yml
+def configure(app_config):
+    directory.use(app_config.get('directory_sqlite_path') or "directory.sqlite3")
+    directory.sync_interval = app_config.get('directory_sync_interval') or 300
+    outcomes.use(app_config.get('idempotency_sqlite_path') or "idempotency.sqlite3")
+    outcomes.ttl = app_config.get('idempotency_ttl') or 86400
+
+
+# to retrieve a new Webex Meeings XML API session ticket and its lifetime (if provided) from a Webex access token
+def webex_authenticate_user(webex_username, webex_access_token):
+    data = webex_xml.authenticate_user(webex_username, config['webex_site'], webex_access_token)
+    get_session_ticket = upstream.post(WEBEX_MEETINGS_API_URL, data=data, endpoint="webex.AuthenticateUser")
+    values = webex_xml.extract(get_session_ticket.text, [webex_xml.SESSION_TICKET, webex_xml.TIME_TO_LIVE])
+    webex_session_ticket = webex_xml.first(values, webex_xml.SESSION_TICKET)
+    time_to_live = webex_xml.first(values, webex_xml.TIME_TO_LIVE)
+    return webex_session_ticket, int(time_to_live) if time_to_live else None
+
+# to get a Webex Meeings XML API session ticket, from the cache if there is a valid one
+def webex_meetings_session_ticket(webex_username, webex_access_token):
+    return ticket_cache.get((webex_username, config['webex_site']),
+                            lambda: webex_authenticate_user(webex_username, webex_access_token))
+
+# to send a request to the Webex Meetings XML API with a (cached) session ticket and extract the given paths from the response;
+# build_body() creates the XML body for a given ticket; if the ticket turns out to be expired, it is renewed and the request is sent once more
+# endpoint is the name of the call in the metrics, e.g. "webex.CreateMeeting"
+def webex_xml_request(webex_username, webex_access_token, build_body, paths, repeated=(), endpoint="webex.XMLService"):
+    webex_session_ticket = webex_meetings_session_ticket(webex_username, webex_access_token)
+    response = upstream.post(WEBEX_MEETINGS_API_URL, data=build_body(webex_session_ticket), endpoint=endpoint)
+    try:
+        return response, webex_xml.extract(response.text, paths, repeated)
+    except webex_xml.WebexSessionTicketError:
+        ticket_cache.invalidate((webex_username, config['webex_site']), webex_session_ticket)
+    webex_session_ticket = webex_meetings_session_ticket(webex_username, webex_access_token)
+    response = upstream.post(WEBEX_MEETINGS_API_URL, data=build_body(webex_session_ticket), endpoint=endpoint)
+    return response, webex_xml.extract(response.text, paths, repeated)
+
+# to get Webex host permissions from a user, i.e. the users the user may schedule meetings for
+def webex_host_permissions(webex_username, webex_access_token):
+    try:
+        request, values = webex_xml_request(webex_username, webex_access_token,
+                                            lambda webex_session_ticket: webex_xml.get_user(webex_username, webex_session_ticket, config['webex_site']),
+                                            [webex_xml.SCHEDULE_FOR], repeated=[webex_xml.SCHEDULE_FOR], endpoint="webex.GetUser")
+    except webex_xml.WebexXMLError: # if the user cannot be read, no other host can be chosen
+        return []
+    return values[webex_xml.SCHEDULE_FOR]
+
+# to get the username of a Webex user, here equal to email address
+def webex_username_for(webex_access_token):
+    response = upstream.get(WEBEX_LOGIN_API_URL + '/people/me', headers={'Authorization': 'Bearer ' + webex_access_token}, endpoint="webex.people_me")
+    response.raise_for_status()
+    return response.json()['emails'][0]
+
+
+# to get the O365 calendars of a user, incl. the calendars shared with the user
+def o365_calendars_for(o365_access_token):
+    response = upstream.get(MS_GRAPH_API_URL + "/v1.0/me/calendars", headers={"Authorization": "Bearer " + o365_access_token},
+                            endpoint="graph.calendars")
+    response.raise_for_status()
+    return response.json()
+
+
+# to check and complete the meeting data of the HTML form or of an imported row (same fields as the form), raises ValueError if invalid
+def validate_meeting_data(meeting_data):
+    for field in ("input_title", "input_date", "input_time_start", "input_time_end", "input_owner"):
+        if not meeting_data.get(field):
+            raise ValueError("missing " + field)
+    meeting_data = dict(meeting_data)
+    for field in ("input_agenda",):
+        meeting_data[field] = meeting_data.get(field) or ""
+    for field in ("input_repeatmeeting_pattern", "input_recipients_dropdown", "input_CCrecipients_dropdown"):
+        meeting_data[field] = meeting_data.get(field) or None
+    if meeting_data['input_repeatmeeting_pattern'] not in (None,) + REPEAT_PATTERNS:
+        raise ValueError("invalid input_repeatmeeting_pattern " + meeting_data['input_repeatmeeting_pattern'])
+    try:
+        datetime.datetime.strptime(meeting_data['input_date'] + " " + meeting_data['input_time_start'], "%Y-%m-%d %H:%M")
+        datetime.datetime.strptime(meeting_data['input_date'] + " " + meeting_data['input_time_end'], "%Y-%m-%d %H:%M")
+    except ValueError:
+        raise ValueError("invalid date or time, expected YYYY-MM-DD and HH:MM")
+    return meeting_data
+
+
+# to check that the groups of the meeting data are known O365 groups of the local directory, raises ValueError if not
+def validate_groups(meeting_data):
+    for field in ("input_recipients_dropdown", "input_CCrecipients_dropdown"):
+        if meeting_data.get(field) and directory.group_by_mail(meeting_data[field]) is None:
+            raise ValueError("unknown O365 group " + meeting_data[field])
+
+
+# to schedule the Webex Meeting and prepare the Graph request that creates the O365 meeting invite, incl. Webex Meetings details
+# webex_meeting is a meeting created before (as passed to on_webex_meeting_created), which is then used instead of creating a new one
+# returns the result {"status": "prepared", "event_request": <Graph request for graph_batch.send>}, or a failure result
+def prepare_meeting(meeting_data, webex_username, webex_access_token, o365_access_token, o365_calendars, webex_meeting=None,
+                    on_webex_meeting_created=None):
+    # to get the information required for the O365 and Webex invite and prepare it for the right format
+    input_title = meeting_data['input_title']
+    input_agenda = meeting_data['input_agenda']
+    input_date = meeting_data['input_date']
+    input_date_year = int(input_date[:4])
+    input_date_month = int(input_date[5:7])
+    input_date_day = int(input_date[8:10])
+    weekdays = ("MONDAY", "TUESDAY", "WEDNESDAY", "THURSDAY", "FRIDAY", "SATURDAY", "SUNDAY")
+    input_date_weekday = weekdays[datetime.date(input_date_year, input_date_month, input_date_day).weekday()]
+    input_time_start = meeting_data['input_time_start']
+    input_time_start_hour = int(input_time_start[:2])
+    input_time_start_minute = int(input_time_start[3:])
+    input_time_start_outlook = str(input_date + "T" + input_time_start + ":00")
+    input_time_start_webex = str(input_date_month) + "/" + str(input_date_day) + "/" + str(input_date_year) + " " + str(input_time_start) + ":00"
+    input_time_end = meeting_data['input_time_end']
+    input_time_end_hour = int(input_time_end[:2])
+    input_time_end_minute = int(input_time_end[3:])
+    input_time_end_outlook = str(input_date + "T" + input_time_end + ":00")
+    input_repeatmeeting_pattern = meeting_data["input_repeatmeeting_pattern"]
+    input_owner = meeting_data["input_owner"]
+    input_recipients_dropdown = meeting_data['input_recipients_dropdown']
+    input_CCrecipients_dropdown = meeting_data['input_CCrecipients_dropdown']
+    input_meeting_duration = datetime.datetime(input_date_year, input_date_month, input_date_day, input_time_end_hour, input_time_end_minute) - datetime.datetime(input_date_year, input_date_month, input_date_day, input_time_start_hour, input_time_start_minute)
+    input_meeting_duration_int = int(input_meeting_duration.seconds / 60)
+
+    # to get the correct calendar to schedule the meeting for, depending on the information of the meeting host/owner in the HTML form
+    calendar_id = None
+    for calendar in o365_calendars['value']:
+        if calendar['canEdit'] == True:
+            if calendar['owner']['address'] == input_owner:
+                calendar_id = calendar['id']
+
+    # the calendar and the attendees are looked up before the Webex Meeting is created, so that no Webex Meeting is left without its invite
+    if calendar_id == None:
+        return {"status": "failure", "error": "no editable O365 calendar of " + input_owner}
+
+    # to get the email addresses of people as part of the O365 group if chosen as required and/or optional participants in the HTML form
+    try:
+        attendees = attendee_resolver.resolve(input_recipients_dropdown, input_CCrecipients_dropdown, o365_access_token)
+    except ValueError as e:
+        return {"status": "failure", "error": str(e)}
+
+    # to schedule the Webex Meeting, unless it was already created by an earlier attempt of the same submission
+    if webex_meeting is None:
+        # to create a valid Webex Meetings password
+        meeting_password_criteria = string.ascii_lowercase + "".join([str(i) for i in range(0, 11)])
+        meeting_password = ''.join(random.choice(meeting_password_criteria) for i in range(8))
+
+        # to schedule a Webex Meeting
+        meeting_fields = {
+            "webex_username": webex_username,
+            "webex_site_name": config['webex_site'],
+            "meeting_password": meeting_password,
+            "meeting_name": input_title,
+            "meeting_agenda": input_agenda,
+            "start_date": input_time_start_webex,
+            "duration_minutes": input_meeting_duration_int,
+            "owner": input_owner
+        }
+        if input_repeatmeeting_pattern != None:
+            meeting_fields['pattern'] = input_repeatmeeting_pattern.upper()
+        if input_repeatmeeting_pattern == "weekly":
+            meeting_fields['dayInWeek'] = input_date_weekday
+        elif input_repeatmeeting_pattern == "monthly":
+            meeting_fields['dayInMonth'] = input_date_day
+        elif input_repeatmeeting_pattern == "yearly":
+            meeting_fields['monthInYear'] = input_date_month
+            meeting_fields['dayInMonth'] = input_date_day
+        try:
+            meeting_creation_xml, values = webex_xml_request(webex_username, webex_access_token,
+                                                             lambda webex_session_ticket: webex_xml.create_meeting(input_repeatmeeting_pattern,
+                                                                                                                   webex_session_ticket=webex_session_ticket,
+                                                                                                                   **meeting_fields),
+                                                             [webex_xml.MEETING_KEY, webex_xml.MEETING_PASSWORD, webex_xml.ICALENDAR_HOST_URL],
+                                                             endpoint="webex.CreateMeeting")
+        except webex_xml.WebexXMLError as e:
+            return {"status": "failure", "error": str(e)}
+
+        # to prepare the Webex Meeting to send in the O365 invite
+        if meeting_creation_xml.status_code != requests.codes.ok:
+            return {"status": "failure", "error": "Webex Meeting could not be created (HTTP {})".format(meeting_creation_xml.status_code)}
+        webex_meeting = {
+            "meeting_key": webex_xml.first(values, webex_xml.MEETING_KEY),
+            "meeting_password": webex_xml.first(values, webex_xml.MEETING_PASSWORD) or meeting_password,
+            "ical_url": webex_xml.first(values, webex_xml.ICALENDAR_HOST_URL)
+        }
+        if on_webex_meeting_created is not None:
+            on_webex_meeting_created(webex_meeting)
+    outlook_content = join_details.join_details(config['webex_site'],
+                                                webex_meeting['meeting_key'],
+                                                webex_meeting['meeting_password'],
+                                                ical_url=webex_meeting['ical_url'])
+
+    # to prepare the O365 meeting invite body based on the information provided and gathered above
+    o365_invite = {
+        "subject": input_title,
+        "body": {
+            "contentType": "HTML",
+            "content": input_agenda + "\n" + outlook_content
+        },
+        "start": {
+            "dateTime": input_time_start_outlook,
+            "timeZone": "W. Europe Standard Time"
+        },
+        "end": {
+            "dateTime": input_time_end_outlook,
+            "timeZone": "W. Europe Standard Time"
+        },
+        "location": {
+            "displayName": "@webex"
+        },
+        "attendees": attendees,
+        "allowNewTimeProposals": True
+    }
+
+    # to add recurrence information to the O365 invite if it is a repeated meeting
+    if input_repeatmeeting_pattern != None:
+        if input_repeatmeeting_pattern == "daily":
+            pattern = {
+                "type": "daily",
+                "interval": 1,
+            }
+        elif input_repeatmeeting_pattern == "weekly":
+            pattern = {
+                "type": "daily",
+                "interval": 7
+            }
+        elif input_repeatmeeting_pattern == "monthly":
+            pattern = {
+                "type": "absoluteMonthly",
+                "interval": 1,
+                "dayOfMonth": input_date_day,
+            }
+        elif input_repeatmeeting_pattern == "yearly":
+            pattern = {
+                "type": "absoluteYearly",
+                "interval": 1,
+                "dayOfMonth": input_date_day,
+                "month": input_date_month
+            }
+        range_noEnd = {
+            "type": "noEnd",
+            "startDate": input_date,
+        }
+        o365_invite['recurrence'] = {"pattern": pattern, "range": range_noEnd}
+
+    # the API call to create the O365 meeting with the information provided and gathered before
+    return {"status": "prepared", "event_request": {"method": "POST", "url": "/me/calendars/" + calendar_id + "/events", "body": o365_invite}}
+
+
+# to get the result of a meeting from the response of its O365 event request
+def event_result(outlook_invite):
+    if outlook_invite.status_code == requests.codes.created:
+        return {"status": "success"}
+    return {"status": "failure", "error": "O365 event could not be created (HTTP {})".format(outlook_invite.status_code)}
+
+
+# to schedule the Webex Meeting and send the O365 meeting invite, incl. Webex Meetings details, for the given meeting data
+# with an idempotency_key, every completed step is recorded: a repeated submission returns the recorded result without calling
+# Webex or Graph again, and a submission that failed or was interrupted resumes at the step that did not complete
+# returns a result with the status "success" or "failure" (and the error)
+def schedule_meeting(meeting_data, webex_username, webex_access_token, o365_access_token, o365_calendars, idempotency_key=None):
+    completed = outcomes.get(idempotency_key) if idempotency_key != None else {}
+    if 'event' in completed:
+        return completed['event']
+
+    def webex_meeting_created(webex_meeting):
+        if idempotency_key != None:
+            outcomes.record(idempotency_key, 'webex_meeting', webex_meeting)
+
+    result = prepare_meeting(meeting_data, webex_username, webex_access_token, o365_access_token, o365_calendars,
+                             webex_meeting=completed.get('webex_meeting'), on_webex_meeting_created=webex_meeting_created)
+    if result['status'] != "prepared":
+        return result
+    if idempotency_key != None:
+        # Graph does not create a second event with the same transactionId, in case the response to the first one was lost
+        result['event_request']['body']['transactionId'] = idempotency_key
+    outlook_invite, = graph_batch.send([result['event_request']], o365_access_token, endpoint="graph.create_event")
+    result = event_result(outlook_invite)
+    if result['status'] == "success" and idempotency_key != None:
+        result['event_id'] = (outlook_invite.json() or {}).get('id')
+        outcomes.record(idempotency_key, 'event', result)
+    return result
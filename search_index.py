@@ -0,0 +1,102 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import bisect, functools, re
+
+# in-memory typeahead search over the O365 groups and the eligible meeting hosts, so that the HTML form does not have to contain them all
+# matches are ranked: texts (mail address, display name) starting with the query, then words starting with it, then texts containing it;
+# prefixes are found by binary search in a sorted word list, other substrings through an index of the trigrams (3 characters) of each text
+
+MAX_PAGE_SIZE = 100
+WORD_SEPARATORS = re.compile(r"[^\w]+")
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    # items are the search results (e.g. group dicts), texts(item) the strings an item can be found by, in the order of the items
+    def __init__(self, items, texts):
+        self.items = list(items)
+        self._texts = []
+        words = []
+        self._trigrams = {}
+        for position, item in enumerate(self.items):
+            item_texts = [text.lower() for text in texts(item) if text]
+            self._texts.append(item_texts)
+            for text in item_texts:
+                # the rank of a prefix match: 0 for the whole text, 1 for one of its words
+                words.append((text, 0, position))
+                words.extend((word, 1, position) for word in WORD_SEPARATORS.split(text) if word and word != text)
+                for trigram in _trigrams(text):
+                    self._trigrams.setdefault(trigram, set()).add(position)
+        words.sort()
+        self._words = [word for word, _, _ in words]
+        self._word_ranks = [(rank, position) for _, rank, position in words]
+
+    def __len__(self):
+        return len(self.items)
+
+    # to get the positions of the items with a text or a word starting with the query, with the rank of their best match
+    def _prefix_matches(self, query):
+        matches = {}
+        for i in range(bisect.bisect_left(self._words, query), len(self._words)):
+            if not self._words[i].startswith(query):
+                break
+            rank, position = self._word_ranks[i]
+            matches[position] = min(rank, matches.get(position, rank))
+        return matches
+
+    # to get the positions of the items with a text containing the query (of at least 3 characters)
+    def _substring_matches(self, query):
+        candidates = None
+        for trigram in sorted(_trigrams(query), key=lambda trigram: len(self._trigrams.get(trigram, ()))):
+            positions = self._trigrams.get(trigram, set())
+            candidates = positions if candidates is None else candidates & positions
+            if not candidates:
+                return set()
+        return {position for position in candidates if any(query in text for text in self._texts[position])}
+
+    # to get one page of the items matching the query, best matches first and otherwise in the order of the items
+    # returns {"results": [...], "total": <number of matches>, "next_offset": <offset of the next page, or None>}
+    def search(self, query, offset=0, limit=20):
+        query = (query or "").strip().lower()
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        offset = max(0, offset)
+        if not query:
+            positions = range(len(self.items))
+        else:
+            matches = self._prefix_matches(query)
+            if len(query) >= 3:
+                for position in self._substring_matches(query):
+                    matches.setdefault(position, 2)
+            positions = sorted(matches, key=lambda position: (matches[position], position))
+        page = [self.items[position] for position in positions[offset:offset + limit]]
+        next_offset = offset + limit if offset + limit < len(positions) else None
+        return {"results": page, "total": len(positions), "next_offset": next_offset}
+
+
+# the eligible hosts differ per user, but most users share the same list, so their indexes are kept for the most recent lists
+@functools.lru_cache(maxsize=256)
+def host_index(hosts):
+    return SearchIndex(hosts, lambda host: (host,))
+
+
+# to read the paging arguments of a search request (q, offset, limit), raises ValueError if they are not numbers
+def search_arguments(args):
+    return args.get('q') or "", int(args.get('offset') or 0), int(args.get('limit') or 20)
@@ -0,0 +1,175 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import json, sqlite3, threading, time, uuid
+from collections import OrderedDict
+from itsdangerous import Signer, BadSignature
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+# in-memory session backend, evicting the least recently used sessions and sessions idle for longer than the TTL
+class MemorySessionStore:
+    def __init__(self, ttl=3600, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires < time.time():
+                del self._sessions[sid]
+                return None
+            self._sessions.move_to_end(sid)
+            return json.loads(data)
+
+    def set(self, sid, data):
+        # to store a serialized copy, so that a session is never shared between two requests by reference
+        with self._lock:
+            self._sessions[sid] = (time.time() + self.ttl, json.dumps(data))
+            self._sessions.move_to_end(sid)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+
+    def touch(self, sid):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is not None:
+                self._sessions[sid] = (time.time() + self.ttl, entry[1])
+                self._sessions.move_to_end(sid)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+
+# SQLite session backend, to share sessions between several worker processes on the same host
+class SQLiteSessionStore:
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._last_purge = 0
+        self._connection().execute("CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)")
+
+    # to open one connection per thread, as SQLite connections must not be shared between threads
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    # to remove expired sessions at most once per minute
+    def _purge(self, now):
+        if now - self._last_purge > 60:
+            self._last_purge = now
+            self._connection().execute("DELETE FROM sessions WHERE expires < ?", (now,))
+
+    def get(self, sid):
+        now = time.time()
+        row = self._connection().execute("SELECT data FROM sessions WHERE sid = ? AND expires >= ?", (sid, now)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def set(self, sid, data):
+        now = time.time()
+        self._connection().execute("INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+                                   (sid, json.dumps(data), now + self.ttl))
+        self._purge(now)
+
+    def touch(self, sid):
+        self._connection().execute("UPDATE sessions SET expires = ? WHERE sid = ?", (time.time() + self.ttl, sid))
+
+    def delete(self, sid):
+        self._connection().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+
+# to create the session backend configured in credentials.yml
+def create_session_store(config):
+    ttl = config.get('session_ttl') or 3600
+    if config.get('session_backend') == "sqlite":
+        return SQLiteSessionStore(config.get('session_sqlite_path') or "sessions.sqlite3", ttl=ttl)
+    return MemorySessionStore(ttl=ttl, max_entries=config.get('session_max_entries') or 10000)
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+# Flask session interface that keeps the session data server-side and only sends the signed session id to the browser
+class ServerSideSessionInterface(SessionInterface):
+    salt = "webscheduler-session"
+
+    def __init__(self, store):
+        self.store = store
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt, key_derivation='hmac')
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(app.config['SESSION_COOKIE_NAME'])
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                data = self.store.get(sid)
+                if data is not None:
+                    return ServerSideSession(data, sid=sid)
+        return ServerSideSession(sid=uuid.uuid4().hex, new=True)
+
+    def save_session(self, app, session, response):
+        cookie_name = app.config['SESSION_COOKIE_NAME']
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        # to drop the session once it has been emptied
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(cookie_name, domain=domain, path=path)
+            return
+
+        if session.modified:
+            self.store.set(session.sid, dict(session))
+        else:
+            self.store.touch(session.sid)
+
+        if session.new or self.should_set_cookie(app, session):
+            response.set_cookie(cookie_name,
+                                self._signer(app).sign(session.sid.encode()).decode(),
+                                expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app),
+                                domain=domain,
+                                path=path,
+                                secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
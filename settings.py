@@ -0,0 +1,29 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import os, yaml
+
+# configuration shared by the Flask app and its helper modules, read from credentials.yml or the file set in WEBSCHEDULER_CONFIG
+CONFIG_FILE = os.environ.get("WEBSCHEDULER_CONFIG", "credentials.yml")
+config = yaml.safe_load(open(CONFIG_FILE))
+
+# the base URLs of the upstream services can be changed in the configuration, e.g. to run against the local stand-ins of the benchmark
+MS_LOGIN_API_URL = "{base_url}/{tenant}/oauth2/v2.0".format(base_url=config.get('ms_login_base_url') or "https://login.microsoftonline.com",
+                                                             tenant=config['azure_client_tenant'])
+MS_GRAPH_API_URL = config.get('ms_graph_base_url') or "https://graph.microsoft.com"
+WEBEX_LOGIN_API_URL = config.get('webex_api_base_url') or "https://webexapis.com/v1"
+WEBEX_MEETINGS_API_URL = config.get('webex_meetings_api_url') or "https://api.webex.com/WBXService/XMLService"
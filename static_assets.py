@@ -0,0 +1,177 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import argparse, gzip, hashlib, mimetypes, os, posixpath, re
+
+try:
+    import brotli
+except ImportError: # brotli is optional, the files are then precompressed with gzip only
+    brotli = None
+
+# fingerprinted, precompressed copies of the files in static/: every file gets the hash of its content in its name
+# (e.g. css/cui-standard.min.<hash>.css), so that browsers can cache it forever and a changed file simply gets a new URL;
+# the url()s in stylesheets are rewritten to the fingerprinted names, and text files are stored gzip and brotli compressed as well,
+# so that no file is compressed per request; the copies are written once (by python static_assets.py or at startup) and reused
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+# fonts in woff/woff2 and images are compressed already
+COMPRESSIBLE_TYPES = ("text/", "image/svg+xml", "application/javascript", "application/json", "font/ttf", "application/vnd.ms-fontobject")
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+CSS_URL = re.compile(r"""url\(\s*(?:"([^"]*)"|'([^']*)'|([^)'"\s]*))\s*\)""")
+
+for _type, _extension in (("font/woff", ".woff"), ("font/woff2", ".woff2"), ("font/ttf", ".ttf"),
+                          ("application/vnd.ms-fontobject", ".eot"), ("image/svg+xml", ".svg")):
+    mimetypes.add_type(_type, _extension)
+
+
+def _compress(encoding, content):
+    if encoding == "br":
+        return brotli.compress(content, quality=11) if brotli is not None else None
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+# to write a file unless it exists already (the name contains the hash of the content), via a temporary file so that
+# worker processes building at the same time never see a partly written file
+def _write(path, content):
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary, "wb") as f:
+        f.write(content)
+    os.replace(temporary, path)
+
+
+# to rewrite the relative url()s of a stylesheet to the fingerprinted names of the files they point to
+def _rewrite_css(name, text, assets):
+    directory = posixpath.dirname(name)
+
+    def replace(match):
+        url = next(group for group in match.groups() if group is not None)
+        path, suffix = re.match(r"([^?#]*)(.*)", url).groups()
+        if not path or path.startswith("/") or ":" in path:
+            return match.group(0)
+        target = assets.get(posixpath.normpath(posixpath.join(directory, path)))
+        if target is None:
+            return match.group(0)
+        return 'url("{}{}")'.format(posixpath.relpath(target['path'], directory or "."), suffix)
+
+    return CSS_URL.sub(replace, text)
+
+
+# to choose the encoding of the response from the Accept-Encoding header, or None for the uncompressed file
+def negotiate(accept_encoding, available):
+    qualities = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, parameters = part.strip().partition(";")
+        quality = 1.0
+        match = re.search(r"q=([0-9.]+)", parameters)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding, _ in ENCODINGS:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if encoding in available and quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class AssetManifest:
+    def __init__(self, output, assets):
+        self.output = output
+        self.assets = assets
+        self._by_path = {entry['path']: entry for entry in assets.values()}
+        self._contents = {}
+
+    # to get the fingerprinted path of a file in static/ (e.g. "css/cui-standard.min.css"), or None if there is no such file
+    def url_path(self, filename):
+        entry = self.assets.get(filename)
+        return entry['path'] if entry is not None else None
+
+    def _read(self, path):
+        content = self._contents.get(path)
+        if content is None:
+            with open(os.path.join(self.output, path), "rb") as f:
+                content = self._contents[path] = f.read()
+        return content
+
+    # to answer the request of a fingerprinted path, returns (status, headers, body); the ETag differs per encoding,
+    # and a request with a matching If-None-Match gets a 304 without body
+    def response(self, path, accept_encoding=None, if_none_match=None):
+        entry = self._by_path.get(path)
+        if entry is None:
+            return 404, {}, b""
+        encoding = negotiate(accept_encoding, entry['encodings'])
+        etag = '"{}{}"'.format(entry['etag'], "-" + encoding if encoding else "")
+        headers = {"Cache-Control": CACHE_CONTROL, "ETag": etag, "Vary": "Accept-Encoding", "Content-Type": entry['content_type']}
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            if "*" in tags or etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]:
+                return 304, headers, b""
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return 200, headers, self._read(path + dict(ENCODINGS)[encoding] if encoding else path)
+
+
+# to fingerprint and precompress all files of the source folder into the output folder; returns the AssetManifest
+def build(source, output):
+    names = []
+    for directory, _, files in os.walk(source):
+        for filename in files:
+            names.append(posixpath.join(*os.path.relpath(os.path.join(directory, filename), source).split(os.sep)))
+
+    assets = {}
+    # the stylesheets come last, as their url()s are rewritten to the fingerprinted names of the other files
+    for name in sorted(names, key=lambda name: (name.endswith(".css"), name)):
+        with open(os.path.join(source, name), "rb") as f:
+            content = f.read()
+        if name.endswith(".css"):
+            content = _rewrite_css(name, content.decode("utf-8"), assets).encode("utf-8")
+        digest = hashlib.sha256(content).hexdigest()[:16]
+        base, extension = posixpath.splitext(name)
+        path = "{}.{}{}".format(base, digest, extension)
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        _write(os.path.join(output, path), content)
+
+        encodings = []
+        if content_type.startswith(COMPRESSIBLE_TYPES):
+            for encoding, suffix in ENCODINGS:
+                if not os.path.exists(os.path.join(output, path + suffix)):
+                    compressed = _compress(encoding, content)
+                    # only kept if it saves something
+                    if compressed is None or len(compressed) >= len(content):
+                        continue
+                    _write(os.path.join(output, path + suffix), compressed)
+                encodings.append(encoding)
+        if content_type.startswith("text/"):
+            content_type += "; charset=utf-8"
+        assets[name] = {"path": path, "etag": digest, "content_type": content_type, "encodings": encodings}
+    return AssetManifest(output, assets)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress the static files, e.g. when building a deployment")
+    parser.add_argument("--source", default="static", help="folder of the static files (default: static)")
+    parser.add_argument("--output", default="static_build", help="folder for the fingerprinted copies (default: static_build)")
+    args = parser.parse_args()
+    manifest = build(args.source, args.output)
+    for name, entry in sorted(manifest.assets.items()):
+        print("{} -> {} {}".format(name, entry['path'], " ".join(entry['encodings'])))
@@ -0,0 +1,53 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import asyncio, threading, time, pytest, throttle
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+async_upstream = pytest.importorskip("async_upstream")
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(1)
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_cancelled_call_releases_its_rate_limiter_slot():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    limiter = throttle.limiter_for("graph.test")
+    in_flight = limiter.in_flight
+
+    async def cancel_call():
+        task = asyncio.ensure_future(async_upstream.get("http://127.0.0.1:{}/".format(server.server_port), endpoint="graph.test"))
+        await asyncio.sleep(0.3)
+        assert limiter.in_flight == in_flight + 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await async_upstream.close()
+
+    try:
+        asyncio.run(cancel_call())
+    finally:
+        server.shutdown()
+    assert limiter.in_flight == in_flight
@@ -0,0 +1,52 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import datetime
+from availability import IntervalIndex, free_slots, occurrences
+
+
+def at(day, hour, minute=0):
+    return datetime.datetime(2030, 1, day, hour, minute)
+
+
+def test_interval_index_merges_overlapping_intervals():
+    index = IntervalIndex([(at(7, 10), at(7, 11)), (at(7, 10, 30), at(7, 12)), (at(7, 12), at(7, 13)), (at(7, 15), at(7, 16))])
+    assert list(zip(index.starts, index.ends)) == [(at(7, 10), at(7, 13)), (at(7, 15), at(7, 16))]
+    # back-to-back intervals do not overlap
+    assert index.first_overlap(at(7, 13), at(7, 14)) is None
+    assert index.first_overlap(at(7, 14), at(7, 15, 30)) == 1
+    assert index.overlapping(at(7, 9), at(7, 23)) == list(zip(index.starts, index.ends))
+
+
+def test_occurrences_skip_missing_days():
+    assert occurrences(datetime.datetime(2030, 1, 31, 10), "monthly", 3, datetime.datetime(2031, 1, 1)) == [
+        datetime.datetime(2030, 1, 31, 10), datetime.datetime(2030, 3, 31, 10)]
+
+
+def test_free_slots_skip_busy_periods_and_weekends():
+    index = IntervalIndex([(at(7, 8), at(7, 17, 15))])
+    slots = free_slots(index, at(7, 8), datetime.timedelta(hours=1), None, 2, datetime.date(2030, 1, 31), at(31, 0))
+    assert slots == [at(8, 8), at(8, 9)]
+    # Friday afternoon is full, the next slot is on Monday
+    index = IntervalIndex([(at(11, 8), at(11, 18))])
+    assert free_slots(index, at(11, 8), datetime.timedelta(hours=1), None, 1, datetime.date(2030, 1, 31), at(31, 0)) == [at(14, 8)]
+
+
+def test_free_slots_check_the_next_occurrences():
+    # the second weekly occurrence of Monday 8:00 is busy
+    index = IntervalIndex([(at(14, 8), at(14, 9))])
+    assert free_slots(index, at(7, 8), datetime.timedelta(hours=1), "weekly", 1, datetime.date(2030, 1, 31), at(31, 23)) == [at(7, 9)]
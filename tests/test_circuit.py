@@ -0,0 +1,72 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import time, pytest, circuit
+
+
+def breaker(**settings):
+    return circuit.CircuitBreaker("test.endpoint", **dict(dict(window=4, min_calls=4, failure_rate=0.5, open_seconds=0.1, probes=1), **settings))
+
+
+def test_opens_once_enough_calls_failed():
+    cb = breaker()
+    for success in (True, False, True):
+        cb.record(success, cb.before_call())
+    assert cb.state == circuit.CLOSED
+    cb.record(False, cb.before_call())
+    assert cb.state == circuit.OPEN
+    with pytest.raises(circuit.CircuitOpenError):
+        cb.before_call()
+
+
+def test_neutral_outcomes_are_not_counted():
+    cb = breaker()
+    for i in range(10):
+        cb.record(None, cb.before_call())
+    assert cb.state == circuit.CLOSED and len(cb._outcomes) == 0
+
+
+def test_half_open_probe_closes_or_reopens():
+    cb = breaker()
+    for i in range(4):
+        cb.record(False, cb.before_call())
+    time.sleep(0.15)
+    probe = cb.before_call()
+    assert probe and cb.state == circuit.HALF_OPEN
+    # only one probe at a time
+    with pytest.raises(circuit.CircuitOpenError):
+        cb.before_call()
+    cb.record(False, probe)
+    assert cb.state == circuit.OPEN
+
+    time.sleep(0.15)
+    cb.record(True, cb.before_call())
+    assert cb.state == circuit.CLOSED
+    assert cb.before_call() is False
+
+
+def test_with_fallback_uses_the_last_known_good_result():
+    store = {}
+
+    def failing():
+        raise circuit.CircuitOpenError("test.endpoint", 5)
+
+    assert circuit.with_fallback(store, 'key', lambda: [1, 2]) == ([1, 2], None)
+    value, stored_at = circuit.with_fallback(store, 'key', failing)
+    assert value == [1, 2] and stored_at is not None
+    with pytest.raises(circuit.CircuitOpenError):
+        circuit.with_fallback(store, 'other', failing)
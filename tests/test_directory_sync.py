@@ -0,0 +1,83 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import json, os, requests, upstream
+from directory_sync import GroupDirectory, GROUPS_DELTA_URL
+
+DELTA_LINK = GROUPS_DELTA_URL + "&$deltatoken=1"
+
+
+def response(status_code, body):
+    result = requests.Response()
+    result.status_code = status_code
+    result._content = json.dumps(body).encode()
+    return result
+
+
+# to answer the Graph delta queries with the given pages by URL
+def install(monkeypatch, pages):
+    calls = []
+
+    def get(url, **kwargs):
+        calls.append(url)
+        return pages[url]
+
+    monkeypatch.setattr(upstream, "get", get)
+    return calls
+
+
+def group(group_id, mail, name=None):
+    return {"id": group_id, "mail": mail, "displayName": name or mail}
+
+
+def test_full_sync_then_delta(monkeypatch, tmp_path):
+    directory = GroupDirectory(str(tmp_path / "directory.sqlite3"))
+    # the file is only created on first use
+    assert not os.path.exists(str(tmp_path / "directory.sqlite3"))
+    install(monkeypatch, {
+        GROUPS_DELTA_URL: response(200, {"value": [group("1", "Team@x.com", "Team")], "@odata.nextLink": "page2"}),
+        "page2": response(200, {"value": [group("2", "all@x.com", "All")], "@odata.deltaLink": DELTA_LINK}),
+    })
+    directory.ensure_synced("token")
+    assert [g['mail'] for g in directory.groups()] == ["all@x.com", "Team@x.com"]
+    assert directory.group_by_mail("team@X.com")['id'] == "1"
+
+    # a delta only holds the changed properties of updated groups, and removed groups
+    calls = install(monkeypatch, {DELTA_LINK: response(200, {"value": [{"id": "1", "displayName": "Renamed"}, {"id": "2", "@removed": {}}],
+                                                             "@odata.deltaLink": DELTA_LINK})})
+    directory.sync("token")
+    assert calls == [DELTA_LINK]
+    assert directory.groups() == [{"id": "1", "mail": "Team@x.com", "displayName": "Renamed"}]
+    assert directory.search("renamed")['total'] == 1
+
+
+def test_expired_delta_link_runs_a_full_sync(monkeypatch, tmp_path):
+    directory = GroupDirectory(str(tmp_path / "directory.sqlite3"))
+    install(monkeypatch, {GROUPS_DELTA_URL: response(200, {"value": [group("1", "a@x.com"), group("2", "b@x.com")], "@odata.deltaLink": DELTA_LINK})})
+    directory.sync("token")
+    install(monkeypatch, {DELTA_LINK: response(410, {}),
+                          GROUPS_DELTA_URL: response(200, {"value": [group("2", "b@x.com")], "@odata.deltaLink": DELTA_LINK})})
+    directory.sync("token")
+    # groups that the full sync did not return no longer exist
+    assert directory.group_mails() == ["b@x.com"]
+
+
+def test_other_instance_sees_the_synced_copy(monkeypatch, tmp_path):
+    install(monkeypatch, {GROUPS_DELTA_URL: response(200, {"value": [group("1", "a@x.com")], "@odata.deltaLink": DELTA_LINK})})
+    GroupDirectory(str(tmp_path / "directory.sqlite3")).sync("token")
+    other = GroupDirectory(str(tmp_path / "directory.sqlite3"))
+    assert other.is_synced() and other.group_mails() == ["a@x.com"]
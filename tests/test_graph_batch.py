@@ -0,0 +1,104 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import json, requests, upstream, graph_batch
+
+
+def response(status_code, body, headers=None):
+    result = requests.Response()
+    result.status_code = status_code
+    result._content = json.dumps(body).encode()
+    result.headers.update(headers or {})
+    return result
+
+
+class FakeGraph:
+    # statuses maps a request index to the statuses of its batch sub-responses, one per attempt
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.batches = []
+        self.singles = []
+
+    def post(self, url, json=None, **kwargs):
+        self.batches.append(json['requests'])
+        responses = []
+        for sub_request in json['requests']:
+            status = self.statuses.get(int(sub_request['id']), [201])[0]
+            responses.append({"id": sub_request['id'], "status": status, "headers": {}, "body": {"id": sub_request['id']}})
+        return response(200, {"responses": responses})
+
+    def request(self, method, url, json=None, **kwargs):
+        self.singles.append(url)
+        return response(201, {"id": "single"})
+
+
+def install(monkeypatch, graph):
+    monkeypatch.setattr(upstream, "post", graph.post)
+    monkeypatch.setattr(upstream, "request", graph.request)
+
+
+def events(count):
+    return [{"method": "POST", "url": "/me/events", "body": {"subject": str(i)}} for i in range(count)]
+
+
+def test_requests_are_sent_in_batches_of_20_in_order(monkeypatch):
+    graph = FakeGraph({})
+    install(monkeypatch, graph)
+    responses = graph_batch.send(events(45), "token")
+    assert [len(batch) for batch in graph.batches] == [20, 20, 5]
+    assert [r.json()['id'] for r in responses] == [str(i) for i in range(45)]
+
+
+def test_throttled_and_failed_dependency_requests_are_retried_one_by_one(monkeypatch):
+    graph = FakeGraph({1: [429], 2: [424]})
+    install(monkeypatch, graph)
+    requests_ = events(3)
+    requests_[2]['dependsOn'] = [1]
+    responses = graph_batch.send(requests_, "token")
+    assert graph.batches[0][2]['dependsOn'] == ["1"]
+    assert len(graph.singles) == 2
+    assert [r.status_code for r in responses] == [201, 201, 201]
+
+
+def test_dependency_on_an_earlier_batch_is_dropped(monkeypatch):
+    graph = FakeGraph({})
+    install(monkeypatch, graph)
+    requests_ = events(21)
+    requests_[20]['dependsOn'] = [0]
+    graph_batch.send(requests_, "token")
+    assert 'dependsOn' not in graph.batches[1][0]
+
+
+def test_request_whose_dependency_in_an_earlier_batch_failed_is_not_sent(monkeypatch):
+    graph = FakeGraph({0: [400]})
+    install(monkeypatch, graph)
+    requests_ = events(22)
+    requests_[20]['dependsOn'] = [0]
+    responses = graph_batch.send(requests_, "token")
+    assert [sub_request['id'] for sub_request in graph.batches[1]] == ["21"]
+    assert graph.singles == []
+    assert responses[20].status_code == graph_batch.FAILED_DEPENDENCY and responses[21].status_code == 201
+
+
+def test_request_whose_dependency_failed_is_not_retried(monkeypatch):
+    graph = FakeGraph({0: [400], 1: [424]})
+    install(monkeypatch, graph)
+    requests_ = events(2)
+    requests_[1]['dependsOn'] = [0]
+    responses = graph_batch.send(requests_, "token")
+    assert graph.singles == []
+    assert [r.status_code for r in responses] == [400, 424]
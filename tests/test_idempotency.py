@@ -0,0 +1,44 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import os
+from idempotency import OutcomeStore, submission_key
+
+
+def test_submission_key():
+    meeting_data = {"input_title": "Weekly", "input_date": "2030-01-07"}
+    key = submission_key("me@x.com", "form1", meeting_data)
+    assert key == submission_key("me@x.com", "form1", dict(reversed(list(meeting_data.items()))))
+    # a changed form, another form or another user is a new submission
+    assert key != submission_key("me@x.com", "form1", dict(meeting_data, input_title="Daily"))
+    assert key != submission_key("me@x.com", "form2", meeting_data)
+    assert key != submission_key("other@x.com", "form1", meeting_data)
+
+
+def test_outcomes_are_recorded_per_step_until_they_expire(tmp_path):
+    path = str(tmp_path / "idempotency.sqlite3")
+    store = OutcomeStore(path, ttl=60)
+    # the file is only created on first use
+    assert not os.path.exists(path)
+    assert store.get("key") == {}
+    store.record("key", "webex_meeting", {"meeting_key": "123"})
+    store.record("key", "event", {"status": "success"})
+    assert OutcomeStore(path).get("key") == {"webex_meeting": {"meeting_key": "123"}, "event": {"status": "success"}}
+
+    store.ttl = -1
+    store.record("expired", "event", {"status": "success"})
+    assert store.get("expired") == {}
@@ -0,0 +1,65 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import os, stat, threading, time
+from jobs import JobQueue
+
+
+def test_enqueue_deduplicates_and_requeues_failed_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), lambda: {"status": "failure", "error": "x"})
+    job_id = queue.enqueue({}, idempotency_key="k")
+    assert queue.enqueue({}, idempotency_key="k") == job_id
+    assert queue._run_one()
+    assert queue.get(job_id)['status'] == "failure"
+    assert queue.enqueue({}, idempotency_key="k") == job_id
+    assert queue.get(job_id)['status'] == "queued"
+    assert stat.S_IMODE(os.stat(str(tmp_path / "jobs.sqlite3")).st_mode) == 0o600
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    first, second = JobQueue(path, None, lease=0.2), JobQueue(path, None, lease=0.2)
+    job_id = first.enqueue({})
+    assert first._claim()[0] == job_id
+    assert second._claim() is None
+    # the first worker died: its lease is not renewed
+    time.sleep(0.3)
+    assert second._claim()[0] == job_id
+
+
+def test_running_job_keeps_its_lease(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    calls = []
+    release = threading.Event()
+
+    def handler():
+        calls.append(1)
+        release.wait(5)
+        return {"status": "success"}
+
+    first, second = JobQueue(path, handler, workers=1, lease=0.3), JobQueue(path, handler, lease=0.3)
+    job_id = first.enqueue({})
+    first.start()
+    time.sleep(0.8)
+    # the heartbeat has renewed the lease, so the job is not claimed by another worker while it runs
+    assert second._claim() is None
+    release.set()
+    for i in range(50):
+        if first.get(job_id)['status'] == "success":
+            break
+        time.sleep(0.05)
+    assert first.get(job_id)['status'] == "success" and len(calls) == 1
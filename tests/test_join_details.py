@@ -0,0 +1,53 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import pytest, join_details
+from settings import config
+
+
+@pytest.fixture(autouse=True)
+def site_templates():
+    join_details._site_template.cache_clear()
+    yield
+    join_details._site_template.cache_clear()
+
+
+def test_render_escapes_the_meeting_fields():
+    html = join_details.render("acme", "123 456", "<pw&>")
+    assert "https://acme.webex.com/acme/m.php?MK=123%20456" in html
+    assert "Meeting password: &lt;pw&amp;&gt;" in html
+    assert "dial 123 456@acme.webex.com" in html
+
+
+def test_render_uses_the_join_url_template(monkeypatch):
+    monkeypatch.setitem(config, 'webex_join_url_template', "https://join.example.com/{site}?key={meeting_key}&x=1")
+    assert 'href="https://join.example.com/acme?key=123&amp;x=1"' in join_details.render("acme", "123", "pw")
+
+
+def test_extract_alt_desc_unfolds_and_unescapes():
+    lines = ["BEGIN:VCALENDAR", "BEGIN:VTIMEZONE", "X-ALT-DESC:not this one", "END:VTIMEZONE", "BEGIN:VEVENT",
+             'X-ALT-DESC;FMTTYPE=text/html;X-NOTE="a:b":<p>Join\\, now</p>\\n', " <p>more</p>", "END:VEVENT"]
+    assert join_details.extract_alt_desc(lines) == "<p>Join, now</p>\n<p>more</p>"
+    assert join_details.extract_alt_desc(["BEGIN:VEVENT", "SUMMARY:x", "END:VEVENT", "X-ALT-DESC:later"]) is None
+
+
+def test_ical_source_falls_back_to_the_local_details(monkeypatch):
+    monkeypatch.setitem(config, 'join_details_source', "ical")
+    monkeypatch.setattr(join_details, "fetch_ical_alt_desc", lambda url: "<p>" + join_details.PASSWORD_PLACEHOLDER + "</p>")
+    assert join_details.join_details("acme", "123", "pw", ical_url="https://x") == "<p>pw</p>"
+    monkeypatch.setattr(join_details, "fetch_ical_alt_desc", lambda url: None)
+    assert join_details.join_details("acme", "123", "pw", ical_url="https://x") == join_details.render("acme", "123", "pw")
@@ -0,0 +1,59 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import time
+from profiler import Profiler
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_slow_request_is_captured(tmp_path):
+    profiler = Profiler(str(tmp_path / "profiles"), interval=0.005, sample_rate=0, slow_threshold=0.05)
+    profile = profiler.begin("/mainpage", "GET")
+    busy(0.2)
+    profiler.end(profile, 200)
+
+    profile = profiler.begin("/healthz", "GET")
+    profiler.end(profile, 200)
+
+    stored, = profiler.profiles()
+    assert stored['route'] == "mainpage" and stored['method'] == "GET" and stored['status'] == 200 and stored['duration_ms'] >= 200
+    with open(profiler.profile_path(stored['name'])) as f:
+        lines = f.read().splitlines()
+    assert lines and all(line.startswith("request;") for line in lines)
+    assert any("busy (test_profiler.py" in line for line in lines)
+
+
+def test_only_the_newest_profiles_are_kept(tmp_path):
+    profiler = Profiler(str(tmp_path / "profiles"), interval=0.005, sample_rate=1, max_profiles=2)
+    for i in range(3):
+        profile = profiler.begin("/jobs/<job_id>", "GET")
+        busy(0.03)
+        profiler.end(profile, 200)
+        time.sleep(0.002)
+    assert len(profiler.profiles()) == 2
+
+
+def test_profile_path_only_accepts_profile_names(tmp_path):
+    profiler = Profiler(str(tmp_path / "profiles"))
+    assert profiler.profiles() == []
+    assert profiler.profile_path("../credentials.yml") is None
+    assert profiler.profile_path("1700000000000_GET_x_200_5ms.folded") is None
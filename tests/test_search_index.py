@@ -0,0 +1,55 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import pytest
+from search_index import SearchIndex, host_index, search_arguments
+
+
+def groups_index():
+    groups = [{"mail": mail, "displayName": name} for mail, name in (
+        ("sales-emea@x.com", "Sales EMEA"), ("emea-all@x.com", "All of EMEA"), ("team@x.com", "Product team"), ("presales@x.com", "Presales"))]
+    return SearchIndex(groups, lambda group: (group['mail'], group['displayName']))
+
+
+def mails(page):
+    return [group['mail'] for group in page['results']]
+
+
+def test_matches_are_ranked_prefix_word_then_substring():
+    index = groups_index()
+    # emea-all starts with the query, sales-emea has a word starting with it
+    assert mails(index.search("emea")) == ["emea-all@x.com", "sales-emea@x.com"]
+    # presales only contains it
+    assert mails(index.search("SALES")) == ["sales-emea@x.com", "presales@x.com"]
+    assert mails(index.search("tea")) == ["team@x.com"]
+    assert index.search("zzz")['total'] == 0
+
+
+def test_paging():
+    index = groups_index()
+    page = index.search("", offset=0, limit=3)
+    assert page['total'] == 4 and page['next_offset'] == 3 and len(page['results']) == 3
+    page = index.search("", offset=3, limit=3)
+    assert mails(page) == ["presales@x.com"] and page['next_offset'] is None
+
+
+def test_host_index_and_arguments():
+    assert host_index(("me@x.com", "boss@x.com")).search("bo")['results'] == ["boss@x.com"]
+    assert search_arguments({"q": "a", "offset": "20", "limit": "10"}) == ("a", 20, 10)
+    assert search_arguments({}) == ("", 0, 20)
+    with pytest.raises(ValueError):
+        search_arguments({"limit": "ten"})
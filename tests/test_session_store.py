@@ -0,0 +1,94 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+from flask import Flask, session
+from session_store import MemorySessionStore, SQLiteSessionStore, ServerSideSessionInterface
+
+
+def test_memory_store_evicts_least_recently_used_and_idle_sessions():
+    store = MemorySessionStore(ttl=3600, max_entries=2)
+    store.set("a", {"n": 1})
+    store.set("b", {"n": 2})
+    store.get("a")
+    store.set("c", {"n": 3})
+    assert store.get("b") is None and store.get("a") == {"n": 1}
+    # a stored session is a copy, not shared by reference
+    data = store.get("a")
+    data['n'] = 5
+    assert store.get("a") == {"n": 1}
+
+    store = MemorySessionStore(ttl=-1)
+    store.set("a", {})
+    assert store.get("a") is None
+
+
+def test_sqlite_store(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"))
+    store.set("a", {"user": "me"})
+    # another worker process sees the same session
+    assert SQLiteSessionStore(str(tmp_path / "sessions.sqlite3")).get("a") == {"user": "me"}
+    store.delete("a")
+    assert store.get("a") is None
+    store.ttl = -1
+    store.set("b", {})
+    assert store.get("b") is None
+
+
+def app_with(store):
+    app = Flask(__name__)
+    app.secret_key = "secret"
+    app.session_interface = ServerSideSessionInterface(store)
+
+    @app.route("/set/<value>")
+    def set_value(value):
+        session['value'] = value
+        return "ok"
+
+    @app.route("/get")
+    def get_value():
+        return session.get('value', "-")
+
+    @app.route("/clear")
+    def clear():
+        session.clear()
+        return "ok"
+
+    return app
+
+
+def test_only_the_signed_session_id_is_sent_to_the_browser():
+    store = MemorySessionStore()
+    client = app_with(store).test_client()
+    client.get("/set/secret-value")
+    cookie = client.get_cookie("session")
+    assert "secret-value" not in cookie.value
+    sid = cookie.value.rsplit(".", 1)[0]
+    assert store.get(sid) == {"value": "secret-value"}
+    assert client.get("/get").data == b"secret-value"
+
+    # a cookie with a forged signature gets a new, empty session
+    client.set_cookie("session", sid + ".forged")
+    assert client.get("/get").data == b"-"
+
+
+def test_cleared_session_is_deleted():
+    store = MemorySessionStore()
+    client = app_with(store).test_client()
+    client.get("/set/x")
+    sid = client.get_cookie("session").value.rsplit(".", 1)[0]
+    client.get("/clear")
+    assert store.get(sid) is None
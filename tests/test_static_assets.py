@@ -0,0 +1,63 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import gzip, os, static_assets
+
+
+def build(tmp_path):
+    source = tmp_path / "static"
+    (source / "css").mkdir(parents=True, exist_ok=True)
+    (source / "img").mkdir(exist_ok=True)
+    (source / "img" / "logo.png").write_bytes(b"\x89PNG" + b"\0" * 100)
+    (source / "css" / "site.css").write_text('body { background: url("../img/logo.png?v=1"); } ' * 50 + 'a { background: url(data:x) }')
+    return static_assets.build(str(source), str(tmp_path / "build"))
+
+
+def test_files_are_fingerprinted_and_stylesheets_rewritten(tmp_path):
+    manifest = build(tmp_path)
+    logo = manifest.url_path("img/logo.png")
+    css = manifest.url_path("css/site.css")
+    assert logo.startswith("img/logo.") and logo.endswith(".png")
+    content = (tmp_path / "build" / css).read_text()
+    assert 'url("../{}?v=1")'.format(logo) in content and "url(data:x)" in content
+    # text files are precompressed, images are not
+    assert manifest.assets["css/site.css"]['encodings'][-1] == "gzip"
+    assert manifest.assets["img/logo.png"]['encodings'] == []
+    assert manifest.url_path("missing.css") is None
+    # a second build reuses the files
+    assert build(tmp_path).url_path("css/site.css") == css
+
+
+def test_response(tmp_path):
+    manifest = build(tmp_path)
+    css = manifest.url_path("css/site.css")
+    status, headers, body = manifest.response(css, "gzip, deflate")
+    assert status == 200 and headers['Content-Encoding'] == "gzip" and headers['Cache-Control'] == static_assets.CACHE_CONTROL
+    assert gzip.decompress(body) == (tmp_path / "build" / css).read_bytes()
+    assert manifest.response(css, "gzip", if_none_match='W/' + headers['ETag'])[0] == 304
+    status, plain_headers, body = manifest.response(css, None, if_none_match=headers['ETag'])
+    assert status == 200 and 'Content-Encoding' not in plain_headers
+    assert manifest.response("css/site.css")[0] == 404
+    assert not os.path.exists(str(tmp_path / "build" / (css + ".tmp")))
+
+
+def test_negotiate():
+    assert static_assets.negotiate("gzip, br", ["br", "gzip"]) == "br"
+    assert static_assets.negotiate("br;q=0.5, gzip", ["br", "gzip"]) == "gzip"
+    assert static_assets.negotiate("br;q=0, *", ["br", "gzip"]) == "gzip"
+    assert static_assets.negotiate("identity", ["br", "gzip"]) is None
+    assert static_assets.negotiate(None, ["gzip"]) is None
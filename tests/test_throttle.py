@@ -0,0 +1,80 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import threading, time, pytest, throttle
+
+
+def test_concurrency_limit_and_release():
+    limiter = throttle.Limiter("test", rate=1000, burst=1000, concurrency=2)
+    limiter.acquire(throttle.BACKGROUND, 1)
+    limiter.acquire(throttle.BACKGROUND, 1)
+    assert limiter.in_flight == 2
+    with pytest.raises(throttle.ThrottledError):
+        limiter.acquire(throttle.BACKGROUND, 0.1)
+    # a call that timed out does not keep its place in the queue
+    assert limiter._waiting == []
+    limiter.release()
+    limiter.acquire(throttle.BACKGROUND, 1)
+    assert limiter.in_flight == 2
+
+
+def test_throttling_halves_the_limit_and_blocks_until_retry_after():
+    limiter = throttle.Limiter("test", rate=1000, burst=1000, concurrency=8)
+    limiter.acquire(throttle.BACKGROUND, 1)
+    limiter.release(throttled=True, retry_after=0.2)
+    assert limiter.limit == 4
+    started = time.monotonic()
+    limiter.acquire(throttle.BACKGROUND, 1)
+    assert time.monotonic() - started >= 0.15
+    # successful calls raise the limit again, additively
+    limiter.release()
+    assert 4 < limiter.limit < 5
+
+
+def test_interactive_calls_go_first():
+    limiter = throttle.Limiter("test", rate=1000, burst=1000, concurrency=1)
+    limiter.acquire(throttle.BACKGROUND, 1)
+    order = []
+
+    def call(priority, name):
+        limiter.acquire(priority, 5)
+        order.append(name)
+        limiter.release()
+
+    threads = [threading.Thread(target=call, args=(throttle.BACKGROUND, "background"))]
+    threads[0].start()
+    time.sleep(0.05)
+    threads.append(threading.Thread(target=call, args=(throttle.INTERACTIVE, "interactive")))
+    threads[1].start()
+    time.sleep(0.05)
+    limiter.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == ["interactive", "background"]
+
+
+def test_is_throttled():
+    class Response:
+        def __init__(self, status_code, headers=None):
+            self.status_code = status_code
+            self.headers = headers or {}
+
+    assert throttle.is_throttled("POST", Response(429))
+    assert throttle.is_throttled("GET", Response(503))
+    assert not throttle.is_throttled("POST", Response(503))
+    assert throttle.is_throttled("POST", Response(503, {"Retry-After": "2"}))
+    assert throttle.retry_after(Response(429, {"Retry-After": "120"})) == 60
@@ -0,0 +1,70 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import threading, time
+from ticket_cache import TicketCache
+
+
+def test_ticket_is_reused_until_shortly_before_it_expires():
+    cache = TicketCache(safety_margin=60)
+    renewals = []
+
+    def renew():
+        renewals.append(1)
+        return "ticket{}".format(len(renewals)), 3600
+
+    assert cache.get(("me", "site"), renew) == "ticket1"
+    assert cache.get(("me", "site"), renew) == "ticket1"
+    # a ticket that lives no longer than the safety margin is renewed on every use
+    cache.put(("me", "site"), "short", 30)
+    assert cache.peek(("me", "site")) is None
+    assert cache.get(("me", "site"), renew) == "ticket2"
+
+
+def test_concurrent_requests_share_one_renewal():
+    cache = TicketCache()
+    renewals = []
+
+    def renew():
+        renewals.append(1)
+        time.sleep(0.2)
+        return "ticket", None
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(("me", "site"), renew))) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["ticket"] * 5 and len(renewals) == 1
+
+
+def test_invalidate():
+    cache = TicketCache()
+    cache.put(("me", "a"), "old")
+    # a rejected ticket that has been renewed in the meantime is kept
+    cache.put(("me", "a"), "new")
+    cache.invalidate(("me", "a"), "old")
+    assert cache.peek(("me", "a")) == "new"
+    cache.invalidate(("me", "a"), "new")
+    assert cache.peek(("me", "a")) is None
+
+    cache.put(("me", "a"), "t")
+    cache.put(("me", "b"), "t")
+    cache.put(("other", "a"), "t")
+    cache.invalidate_user("me")
+    assert cache.peek(("me", "a")) is None and cache.peek(("me", "b")) is None and cache.peek(("other", "a")) == "t"
@@ -0,0 +1,77 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import json, threading, time, requests, upstream
+from tokens import TokenManager
+
+
+def token_response(status_code, body):
+    result = requests.Response()
+    result.status_code = status_code
+    result._content = json.dumps(body).encode()
+    return result
+
+
+def install(monkeypatch, status_code=200, delay=0):
+    calls = []
+
+    def post(url, data=None, **kwargs):
+        calls.append(data['refresh_token'])
+        time.sleep(delay)
+        return token_response(status_code, {"access_token": "new", "refresh_token": "rotated", "expires_in": 3600})
+
+    monkeypatch.setattr(upstream, "post", post)
+    return calls
+
+
+def test_token_is_only_refreshed_when_it_expires_soon(monkeypatch):
+    calls = install(monkeypatch)
+    manager = TokenManager(refresh_margin=300)
+    session = {}
+    manager.store(session, "webex", {"access_token": "old", "refresh_token": "refresh", "expires_in": 3600})
+    assert manager.ensure_fresh(session, "webex") and calls == []
+
+    session['webex_token_expires_at'] = time.time() + 60
+    refreshed = []
+    assert manager.ensure_fresh(session, "webex", on_refresh=lambda: refreshed.append(1))
+    assert calls == ["refresh"] and refreshed == [1]
+    assert session['webex_access_token'] == "new" and session['webex_refresh_token'] == "rotated"
+
+
+def test_concurrent_requests_share_one_refresh(monkeypatch):
+    calls = install(monkeypatch, delay=0.2)
+    manager = TokenManager()
+    sessions = [{"o365_access_token": "old", "o365_refresh_token": "refresh", "o365_token_expires_at": time.time()} for i in range(4)]
+    threads = [threading.Thread(target=manager.ensure_fresh, args=(session, "o365")) for session in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert calls == ["refresh"]
+    assert all(session['o365_access_token'] == "new" for session in sessions)
+
+
+def test_rejected_refresh(monkeypatch):
+    install(monkeypatch, status_code=400)
+    manager = TokenManager(refresh_margin=300)
+    # the current token is used until it has actually expired
+    session = {"webex_access_token": "old", "webex_refresh_token": "refresh", "webex_token_expires_at": time.time() + 60}
+    assert manager.ensure_fresh(session, "webex") and session['webex_access_token'] == "old"
+    session['webex_token_expires_at'] = time.time() - 1
+    assert not manager.ensure_fresh(session, "webex")
+    assert session == {}
+    assert not manager.ensure_fresh({}, "webex")
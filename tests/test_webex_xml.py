@@ -0,0 +1,60 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import pytest, webex_xml
+
+
+def message(result, body="", header=""):
+    return ('<?xml version="1.0" encoding="UTF-8"?><serv:message xmlns:serv="s" xmlns:use="u" xmlns:meet="m"><serv:header><serv:response>'
+            '<serv:result>{}</serv:result>{}</serv:response></serv:header><serv:body><serv:bodyContent>{}</serv:bodyContent></serv:body>'
+            '</serv:message>').format(result, header, body)
+
+
+def test_extracts_single_and_repeated_values():
+    body = "<use:scheduleFor><use:webExID>a@x.com</use:webExID><use:webExID>b@x.com</use:webExID></use:scheduleFor>"
+    values = webex_xml.extract(message("SUCCESS", body), [webex_xml.SCHEDULE_FOR, webex_xml.MEETING_KEY], repeated=[webex_xml.SCHEDULE_FOR])
+    assert values[webex_xml.SCHEDULE_FOR] == ["a@x.com", "b@x.com"]
+    assert webex_xml.first(values, webex_xml.MEETING_KEY) is None
+
+
+def test_parsing_stops_once_all_values_are_read():
+    text = message("SUCCESS", "<meet:meetingkey>123</meet:meetingkey>")
+    # anything after the value is not parsed
+    text = text.replace("</serv:bodyContent>", "<broken></serv:bodyContent>")
+    values = webex_xml.extract(text, [webex_xml.MEETING_KEY])
+    assert webex_xml.first(values, webex_xml.MEETING_KEY) == "123"
+
+
+def test_failure_results_are_raised():
+    with pytest.raises(webex_xml.WebexXMLError) as error:
+        webex_xml.extract(message("FAILURE", header="<serv:reason>Meeting not found</serv:reason><serv:exceptionID>060001</serv:exceptionID>"),
+                          [webex_xml.MEETING_KEY])
+    assert error.value.exception_id == "060001" and not isinstance(error.value, webex_xml.WebexSessionTicketError)
+    with pytest.raises(webex_xml.WebexSessionTicketError):
+        webex_xml.extract(message("FAILURE", header="<serv:reason>Session ticket has expired</serv:reason>"), [webex_xml.MEETING_KEY])
+
+
+def test_non_xml_response_is_raised():
+    with pytest.raises(webex_xml.WebexXMLError) as error:
+        webex_xml.extract("<html><body><h1>502 Bad Gateway</h1><hr></body>", [webex_xml.MEETING_KEY])
+    assert "not valid XML" in str(error.value)
+    with pytest.raises(webex_xml.WebexXMLError):
+        webex_xml.extract("", [webex_xml.MEETING_KEY])
+
+
+def test_rendered_fields_are_escaped():
+    assert "a&amp;b&lt;c" in webex_xml.get_user("a&b<c", "ticket", "site")
@@ -0,0 +1,240 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import asyncio, contextvars, heapq, itertools, random, threading, time, requests, metrics
+from settings import config
+
+# client-side rate limiting of the calls to Graph (per tenant) and to Webex (per site), so that the app stays just below the service limits:
+# - a token bucket caps the request rate,
+# - the number of concurrent calls adapts to throttling (AIMD: +1 per round of successful calls, halved when throttled),
+#   and the rate of the token bucket is scaled down and up with it,
+# - after a 429/503 with Retry-After, no call of that limiter starts before the given time,
+# - waiting calls are started by priority: interactive page loads go ahead of background work (directory sync, jobs, bulk imports)
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE")
+
+# calls are background work unless they are made for a Flask request (see set_priority in main.py) or copied from one (upstream.submit)
+_priority = contextvars.ContextVar("upstream_priority", default=BACKGROUND)
+
+DEFAULT_LIMITS = {
+    "graph": {"rate": 20, "burst": 40, "concurrency": 16},
+    "webex": {"rate": 20, "burst": 40, "concurrency": 10}
+}
+# the OAuth token endpoints are not part of the API rate limits
+UNLIMITED_ENDPOINTS = ("webex.access_token", "webex.refresh_token")
+
+throttled_responses = metrics.Counter("webscheduler_upstream_throttled_total", "Throttled responses (429/503) by limiter.", ("limiter",))
+queue_wait = metrics.Histogram("webscheduler_upstream_queue_wait_seconds", "Time calls waited for the rate limiter.", ("limiter", "priority"))
+concurrency_limit = metrics.Gauge("webscheduler_upstream_concurrency_limit", "Current adaptive concurrency limit by limiter.", ("limiter",))
+metrics.REGISTRY.extend([throttled_responses, queue_wait, concurrency_limit])
+
+
+# raised when a call could not start within the queue timeout; a RequestException, so callers treat it like any other failed call
+class ThrottledError(requests.exceptions.RequestException):
+    pass
+
+
+def set_priority(priority):
+    _priority.set(priority)
+
+
+def current_priority():
+    return _priority.get()
+
+
+class Limiter:
+    def __init__(self, name, rate, burst, concurrency, min_concurrency=1):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_concurrency = concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(concurrency)
+        self.in_flight = 0
+        self.tokens = float(burst)
+        self.blocked_until = 0.0
+        self._refilled = time.monotonic()
+        self._last_decrease = 0.0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        concurrency_limit.set(self.limit, name)
+
+    # the rate shrinks and grows with the concurrency limit, so that fast calls cannot keep exceeding the service limit
+    def _current_rate(self):
+        return self.rate * self.limit / self.max_concurrency
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._refilled) * self._current_rate())
+        self._refilled = now
+
+    # to get how long the first waiting call still has to wait (0 if it can start now), or None if it waits for a running call to finish
+    def _wait_time(self, now):
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.in_flight >= int(self.limit):
+            return None
+        self._refill(now)
+        if self.tokens < 1:
+            return (1 - self.tokens) / self._current_rate()
+        return 0
+
+    # to start the queued call entry if it is its turn; returns 0 if it started, otherwise how long it still has to wait
+    # (None if it waits for its turn or for a running call to finish); must be called with the condition held
+    def _try_start(self, entry):
+        wait = self._wait_time(time.monotonic()) if self._waiting[0] == entry else None
+        if wait == 0:
+            heapq.heappop(self._waiting)
+            self.tokens -= 1
+            self.in_flight += 1
+            # the next call in line may be able to start as well
+            self._condition.notify_all()
+        return wait
+
+    def _cancel(self, entry):
+        self._waiting.remove(entry)
+        heapq.heapify(self._waiting)
+        self._condition.notify_all()
+
+    def _timed_out(self, entry, timeout):
+        self._cancel(entry)
+        return ThrottledError("{} rate limit: no call slot within {} seconds".format(self.name, timeout))
+
+    # to wait until a call may start, in the order of priority and then arrival; raises ThrottledError after timeout seconds
+    def acquire(self, priority, timeout):
+        started = time.monotonic()
+        with self._condition:
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            while True:
+                wait = self._try_start(entry)
+                if wait == 0:
+                    break
+                remaining = started + timeout - time.monotonic()
+                if remaining <= 0:
+                    raise self._timed_out(entry, timeout)
+                self._condition.wait(min(wait, remaining) if wait is not None else remaining)
+        queue_wait.observe(time.monotonic() - started, self.name, PRIORITY_NAMES.get(priority, str(priority)))
+
+    # the same for a coroutine: the call waits in the same queue, but in the event loop, checking for its turn at least every poll_interval seconds
+    async def acquire_async(self, priority, timeout, poll_interval=0.05):
+        started = time.monotonic()
+        with self._condition:
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+        try:
+            while True:
+                with self._condition:
+                    wait = self._try_start(entry)
+                    if wait == 0:
+                        break
+                    remaining = started + timeout - time.monotonic()
+                    if remaining <= 0:
+                        raise self._timed_out(entry, timeout)
+                await asyncio.sleep(min(wait if wait is not None else poll_interval, poll_interval, remaining))
+        except asyncio.CancelledError:
+            with self._condition:
+                self._cancel(entry)
+            raise
+        queue_wait.observe(time.monotonic() - started, self.name, PRIORITY_NAMES.get(priority, str(priority)))
+
+    def _throttled(self, retry_after):
+        now = time.monotonic()
+        throttled_responses.inc(self.name)
+        self._refill(now)
+        # no burst of waiting calls once the service accepts calls again
+        self.tokens = min(self.tokens, 0.0)
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+        # the calls that were already running when the first one was throttled do not halve the limit again
+        if now - self._last_decrease > 1:
+            self.limit = max(float(self.min_concurrency), self.limit / 2)
+            self._last_decrease = now
+
+    # to end a call; throttled is set for a 429/503 response, retry_after is the delay it asked for in seconds
+    def release(self, throttled=False, retry_after=None):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self._throttled(retry_after)
+            else:
+                self._refill(time.monotonic())
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            concurrency_limit.set(self.limit, self.name)
+            self._condition.notify_all()
+
+    # to take a throttling signal into account that did not end a call of its own, e.g. a throttled request inside a Graph $batch
+    def throttled(self, retry_after=None):
+        with self._condition:
+            self._throttled(retry_after)
+            concurrency_limit.set(self.limit, self.name)
+            self._condition.notify_all()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+# to get the limiter of an upstream call from its endpoint name: "graph.*" calls share the limiter of the tenant, "webex.*" calls
+# the limiter of the site; other calls (logins, iCalendar downloads) are not limited and None is returned
+def limiter_for(endpoint):
+    if endpoint in UNLIMITED_ENDPOINTS:
+        return None
+    service = (endpoint or "").split(".", 1)[0]
+    if service == "graph":
+        name = "graph:" + str(config.get('azure_client_tenant'))
+    elif service == "webex":
+        name = "webex:" + str(config.get('webex_site'))
+    else:
+        return None
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                limits = dict(DEFAULT_LIMITS[service])
+                limits.update((config.get('throttle_limits') or {}).get(service) or {})
+                limiter = _limiters[name] = Limiter(name, limits['rate'], limits['burst'], limits['concurrency'])
+    return limiter
+
+
+# to get the delay a throttled response asks for, in seconds (capped at 60), or None if it does not say
+def retry_after(response):
+    value = response.headers.get('Retry-After')
+    try:
+        return min(max(float(value), 0), 60) if value is not None else None
+    except ValueError:
+        return None
+
+
+# to check whether a response is a throttling signal that can be retried: 429 means the call was not run,
+# 503 is only retried for idempotent methods, or when the service asks for it with Retry-After (as Graph does when throttling)
+def is_throttled(method, response):
+    if response.status_code == 429:
+        return True
+    return response.status_code == 503 and (method.upper() in IDEMPOTENT_METHODS or 'Retry-After' in response.headers)
+
+
+# to get the delay before retrying a throttled call: Retry-After if given, otherwise an exponential backoff with full jitter
+def backoff(response, attempt):
+    delay = retry_after(response)
+    if delay is not None:
+        return delay
+    return random.uniform(0, min(30, 2 ** attempt))
@@ -0,0 +1,73 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import threading, time
+
+
+# cache of Webex Meetings XML API session tickets, keyed by (webExID, site name)
+# concurrent requests for a missing or expired ticket share one renewal: the first one calls the XML API, the others wait for its result
+class TicketCache:
+    def __init__(self, default_ttl=5400, safety_margin=60):
+        self.default_ttl = default_ttl
+        self.safety_margin = safety_margin
+        self._tickets = {}
+        self._renewal_locks = {}
+        self._lock = threading.Lock()
+
+    def _valid_ticket(self, key):
+        entry = self._tickets.get(key)
+        if entry is not None and entry[1] > time.time():
+            return entry[0]
+        return None
+
+    # to get a valid ticket without renewing it, or None
+    def peek(self, key):
+        return self._valid_ticket(key)
+
+    # to store a ticket that was obtained outside of get(), e.g. by the async mode
+    def put(self, key, ticket, ttl=None):
+        ttl = ttl or self.default_ttl
+        self._tickets[key] = (ticket, time.time() + max(ttl - self.safety_margin, 0))
+
+    # to get a valid ticket, calling renew() (which returns the ticket and its lifetime in seconds, or None) if there is none
+    def get(self, key, renew):
+        ticket = self._valid_ticket(key)
+        if ticket is not None:
+            return ticket
+        with self._lock:
+            renewal_lock = self._renewal_locks.setdefault(key, threading.Lock())
+        with renewal_lock:
+            # to use the ticket of a renewal that finished while waiting for the lock
+            ticket = self._valid_ticket(key)
+            if ticket is not None:
+                return ticket
+            ticket, ttl = renew()
+            self.put(key, ticket, ttl)
+            return ticket
+
+    # to drop a ticket that the XML API rejected; if a ticket is given, only that ticket is dropped and not one that was renewed in the meantime
+    def invalidate(self, key, ticket=None):
+        with self._lock:
+            entry = self._tickets.get(key)
+            if entry is not None and (ticket is None or entry[0] == ticket):
+                del self._tickets[key]
+
+    # to drop the tickets of a webExID on all sites, e.g. once the access token they were obtained with has been refreshed
+    def invalidate_user(self, webex_username):
+        with self._lock:
+            for key in [key for key in self._tickets if key[0] == webex_username]:
+                del self._tickets[key]
@@ -0,0 +1,127 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import logging, threading, time, requests, upstream
+from settings import config, MS_LOGIN_API_URL, WEBEX_LOGIN_API_URL
+
+logger = logging.getLogger(__name__)
+
+
+# to get the token endpoint and the client parameters of the refresh_token grant of a provider ("webex" or "o365")
+def _refresh_request(provider, refresh_token):
+    if provider == "webex":
+        return WEBEX_LOGIN_API_URL + "/access_token", "webex.refresh_token", {
+            'client_id': config['webex_integration_client_id'],
+            'client_secret': config['webex_integration_client_secret'],
+            'refresh_token': refresh_token,
+            'grant_type': 'refresh_token'
+        }
+    return MS_LOGIN_API_URL + "/token", "ms.refresh_token", {
+        'client_id': config['azure_client_id'],
+        'client_secret': config['azure_client_secret'],
+        'scope': config['azure_permissions'],
+        'refresh_token': refresh_token,
+        'grant_type': 'refresh_token'
+    }
+
+
+# OAuth tokens of the logged in user, kept in the session as <provider>_access_token, <provider>_refresh_token and <provider>_token_expires_at
+# tokens are refreshed with the refresh_token grant once they expire within refresh_margin seconds, so the user does not have to log in again
+# concurrent requests with the same refresh token share one refresh: the first one calls the token endpoint, the others wait for its result
+class TokenManager:
+    def __init__(self, refresh_margin=300, result_ttl=60):
+        self.refresh_margin = refresh_margin
+        self.result_ttl = result_ttl
+        self._results = {}
+        self._refresh_locks = {}
+        self._lock = threading.Lock()
+
+    # to store the tokens of a token endpoint response (authorization_code or refresh_token grant) in the session
+    def store(self, session, provider, token_response):
+        session[provider + '_access_token'] = token_response['access_token']
+        # a refresh response may leave out the refresh token if it has not been rotated
+        if token_response.get('refresh_token'):
+            session[provider + '_refresh_token'] = token_response['refresh_token']
+        if token_response.get('expires_in'):
+            session[provider + '_token_expires_at'] = time.time() + int(token_response['expires_in'])
+        else:
+            session.pop(provider + '_token_expires_at', None)
+
+    def _recent_result(self, refresh_token):
+        entry = self._results.get(refresh_token)
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+        return None
+
+    # to refresh the tokens once per refresh token; returns the token endpoint response, or None if the refresh token was rejected
+    # on_refresh() is only called by the request that actually refreshed
+    def _refresh(self, provider, refresh_token, on_refresh):
+        with self._lock:
+            refresh_lock = self._refresh_locks.setdefault(refresh_token, threading.Lock())
+        try:
+            with refresh_lock:
+                # to use the result of a refresh that finished while waiting for the lock (the old refresh token may no longer be valid)
+                token_response = self._recent_result(refresh_token)
+                if token_response is not None:
+                    return token_response
+                url, endpoint, body = _refresh_request(provider, refresh_token)
+                response = upstream.post(url, headers={"Content-type": "application/x-www-form-urlencoded"}, data=body, endpoint=endpoint)
+                if response.status_code != requests.codes.ok:
+                    logger.warning("%s token refresh failed with HTTP %s", provider, response.status_code)
+                    return None
+                token_response = response.json()
+                now = time.time()
+                with self._lock:
+                    self._results = {token: entry for token, entry in self._results.items() if entry[0] > now}
+                    self._results[refresh_token] = (now + self.result_ttl, token_response)
+                if on_refresh is not None:
+                    on_refresh()
+                return token_response
+        finally:
+            with self._lock:
+                if self._refresh_locks.get(refresh_token) is refresh_lock:
+                    del self._refresh_locks[refresh_token]
+
+    # to check whether the access token of the provider in the session expires within refresh_margin seconds
+    def expires_soon(self, session, provider):
+        expires_at = session.get(provider + '_token_expires_at')
+        return expires_at is not None and expires_at - self.refresh_margin <= time.time()
+
+    # to make sure the session holds a usable access token of the provider, refreshing it if it expires soon
+    # returns False if there is none (no token, or an expired token that could not be refreshed), the user then has to log in again
+    def ensure_fresh(self, session, provider, on_refresh=None):
+        if provider + '_access_token' not in session:
+            return False
+        if not self.expires_soon(session, provider):
+            return True
+        expires_at = session[provider + '_token_expires_at']
+        refresh_token = session.get(provider + '_refresh_token')
+        token_response = None
+        if refresh_token:
+            try:
+                token_response = self._refresh(provider, refresh_token, on_refresh)
+            except requests.RequestException:
+                logger.warning("%s token refresh failed", provider, exc_info=True)
+        if token_response is not None:
+            self.store(session, provider, token_response)
+            return True
+        # to keep using the current token until it has actually expired
+        if expires_at > time.time():
+            return True
+        for name in ('_access_token', '_refresh_token', '_token_expires_at'):
+            session.pop(provider + name, None)
+        return False
@@ -0,0 +1,152 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import contextvars, threading, time, requests, metrics, throttle, profiler, circuit
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from settings import config
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_executor = None
+
+
+# to build the retry policy: connection errors are retried for every method (nothing has been sent yet),
+# error statuses and read errors only for idempotent methods, so that e.g. a CreateMeeting is never sent twice;
+# throttled responses (429/503) are retried in request(), so that the rate limiter learns about them
+def _retry_policy():
+    retries = config.get('upstream_retries', 2)
+    kwargs = dict(total=retries,
+                  connect=retries,
+                  read=retries,
+                  status=retries,
+                  backoff_factor=config.get('upstream_backoff_factor', 0.3),
+                  status_forcelist=(500, 502, 504),
+                  raise_on_status=False)
+    try:
+        return Retry(allowed_methods=Retry.DEFAULT_ALLOWED_METHODS, **kwargs)
+    except (TypeError, AttributeError): # urllib3 < 1.26
+        return Retry(method_whitelist=Retry.DEFAULT_METHOD_WHITELIST, **kwargs)
+
+
+def _pool_size(host):
+    return (config.get('upstream_pool_sizes') or {}).get(host) or config.get('upstream_pool_size') or 10
+
+
+# to get the keep-alive session (and thereby connection pool) of an upstream host, created on first use;
+# every host gets its own pool, sized with upstream_pool_sizes in credentials.yml
+def session_for(host):
+    session = _sessions.get(host)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                # to never share upstream cookies between the users of this app
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                pool_size = _pool_size(host)
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=_retry_policy(), pool_block=False)
+                session.mount("https://" + host, adapter)
+                session.mount("http://" + host, adapter)
+                _sessions[host] = session
+    return session
+
+
+def timeout():
+    return (config.get('upstream_connect_timeout', 3.05), config.get('upstream_read_timeout', 30))
+
+
+# to send a request to an upstream service through the pooled session of its host, with the configured timeouts
+# the call is recorded in the metrics under its endpoint name (e.g. "graph.groups"), or under its host if no name is given;
+# Graph and Webex calls wait for the rate limiter of their tenant/site (see throttle.py), and throttled calls are retried
+# up to throttle_max_retries times after the delay the service asked for
+# while the circuit breaker of the endpoint is open (see circuit.py), circuit.CircuitOpenError is raised without calling it
+def request(method, url, endpoint=None, **kwargs):
+    breaker = circuit.breaker_for(endpoint or urlsplit(url).netloc)
+    probe = breaker.before_call()
+    success = False
+    try:
+        response = _send(method, url, endpoint, **kwargs)
+        success = response.status_code < 500
+        return response
+    except throttle.ThrottledError:
+        success = None
+        raise
+    finally:
+        breaker.record(success, probe)
+
+
+def _send(method, url, endpoint, **kwargs):
+    kwargs.setdefault('timeout', timeout())
+    host = urlsplit(url).netloc
+    limiter = throttle.limiter_for(endpoint)
+    max_retries = config.get('throttle_max_retries', 3)
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire(throttle.current_priority(), config.get('throttle_queue_timeout') or 60)
+        started = time.perf_counter()
+        try:
+            response = session_for(host).request(method, url, **kwargs)
+        except Exception as e:
+            if limiter is not None:
+                limiter.release()
+            metrics.observe_upstream(endpoint or host, time.perf_counter() - started, error=e)
+            raise
+        metrics.observe_upstream(endpoint or host, time.perf_counter() - started, response, streamed=kwargs.get('stream', False))
+        throttled = throttle.is_throttled(method, response)
+        if limiter is not None:
+            limiter.release(throttled, throttle.retry_after(response) if throttled else None)
+        if not throttled or attempt == max_retries:
+            return response
+        response.close()
+        time.sleep(throttle.backoff(response, attempt))
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+# to get the bounded thread pool that runs independent upstream calls concurrently
+# only leaf calls (that do not wait on other pool tasks) may be submitted, so the pool cannot deadlock itself
+def executor():
+    global _executor
+    if _executor is None:
+        with _sessions_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=config.get('upstream_max_workers') or 16, thread_name_prefix="upstream")
+    return _executor
+
+
+# to run a leaf call on the executor in the context of the caller, so that its upstream calls count towards the caller's request
+# (and the thread is sampled with the caller's request if that is profiled)
+def submit(function, *args, **kwargs):
+    return executor().submit(contextvars.copy_context().run, profiler.run, function, *args, **kwargs)
+
+
+# to close all pooled connections, e.g. when the worker process shuts down
+def close():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,105 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+import logging, threading, time, upstream, metrics
+from urllib.parse import urlsplit
+from settings import config, MS_LOGIN_API_URL, MS_GRAPH_API_URL, WEBEX_LOGIN_API_URL, WEBEX_MEETINGS_API_URL
+from scheduler import directory
+
+logger = logging.getLogger(__name__)
+
+# startup warm-up of a worker process: the work the first users after a deploy or a scale-out would otherwise wait for is done
+# before the instance reports ready at /readyz, so that the load balancer only sends users to warm instances:
+# - connections: a connection to every upstream service is opened and kept in its pool (incl. the TLS handshake),
+# - directory: the local copy of the O365 groups is loaded from disk and its search index is built,
+# - templates: the Jinja templates are compiled
+# the tasks run in the warmup_tasks order of credentials.yml; a failed task is logged and does not keep the instance from being ready
+
+TASKS = ("connections", "directory", "templates")
+
+startup_seconds = metrics.Gauge("webscheduler_startup_seconds", "Time taken by the startup phases of this process.", ("phase",))
+metrics.REGISTRY.append(startup_seconds)
+
+
+# to open a pooled connection to each upstream service; the response does not matter, only the connection is kept
+def open_connections():
+    urls = {urlsplit(url)._replace(path="/", query="").geturl() for url in (MS_LOGIN_API_URL, MS_GRAPH_API_URL, WEBEX_LOGIN_API_URL, WEBEX_MEETINGS_API_URL)}
+    timeout = (config.get('upstream_connect_timeout', 3.05), 5)
+    futures = [upstream.submit(upstream.request, "HEAD", url, timeout=timeout) for url in sorted(urls)]
+    for future in futures:
+        future.result().close()
+
+
+# to load the local copy of the O365 groups and build its search index; if there is no copy yet, the first user's sync creates it
+def load_directory():
+    directory.groups()
+    directory.search("")
+
+
+def compile_templates(jinja_env):
+    for name in jinja_env.list_templates(extensions=("html",)):
+        jinja_env.get_template(name)
+
+
+class Warmup:
+    def __init__(self, tasks):
+        self.tasks = tasks # list of (name, function)
+        self.results = {}
+        self.ready = threading.Event()
+        self.started = None
+        self.seconds = None
+
+    def run(self):
+        self.started = time.perf_counter()
+        for name, function in self.tasks:
+            started = time.perf_counter()
+            error = None
+            try:
+                function()
+            except Exception as e:
+                logger.exception("warm-up task %s failed", name)
+                error = str(e)
+            self.results[name] = {"seconds": round(time.perf_counter() - started, 3), "error": error}
+        self.seconds = time.perf_counter() - self.started
+        startup_seconds.set(self.seconds, "warmup")
+        logger.info("warm-up finished in %.3f seconds: %s", self.seconds, self.results)
+        self.ready.set()
+
+    # to run the tasks in a background thread (the instance is live, but not ready until they are done), or right away
+    def start(self, background=True):
+        if background:
+            threading.Thread(target=self.run, name="warmup", daemon=True).start()
+        else:
+            self.run()
+
+    # the body of the readiness probe
+    def status(self):
+        return {"status": "ready" if self.ready.is_set() else "warming up",
+                "warmup_seconds": round(self.seconds, 3) if self.seconds is not None else None,
+                "tasks": dict(self.results)}
+
+
+# to get the warm-up tasks set in warmup_tasks of the configuration (all of them by default, none with an empty list)
+def tasks_for(app_config, jinja_env):
+    functions = {"connections": open_connections, "directory": load_directory, "templates": lambda: compile_templates(jinja_env)}
+    names = app_config.get('warmup_tasks')
+    if names is None:
+        names = TASKS
+    unknown = [name for name in names if name not in functions]
+    if unknown:
+        raise ValueError("unknown warmup_tasks: {} (known are {})".format(", ".join(unknown), ", ".join(TASKS)))
+    return [(name, functions[name]) for name in names]
@@ -0,0 +1,223 @@
+'''
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+'''
+
+from xml.parsers import expat
+from xml.sax.saxutils import escape
+
+# paths of the response fields used by the app
+BODY_CONTENT = "serv:message/serv:body/serv:bodyContent/"
+SESSION_TICKET = BODY_CONTENT + "use:sessionTicket"
+TIME_TO_LIVE = BODY_CONTENT + "use:timeToLive"
+SCHEDULE_FOR = BODY_CONTENT + "use:scheduleFor/use:webExID"
+MEETING_KEY = BODY_CONTENT + "meet:meetingkey"
+MEETING_PASSWORD = BODY_CONTENT + "meet:meetingPassword"
+ICALENDAR_HOST_URL = BODY_CONTENT + "meet:iCalendarURL/serv:host"
+
+RESPONSE = "serv:message/serv:header/serv:response/"
+RESULT = RESPONSE + "serv:result"
+REASON = RESPONSE + "serv:reason"
+EXCEPTION_ID = RESPONSE + "serv:exceptionID"
+HEADER = "serv:message/serv:header"
+
+
+# raised when the XML API returns a FAILURE result
+class WebexXMLError(Exception):
+    def __init__(self, exception_id, reason):
+        super().__init__("Webex Meetings XML API error {}: {}".format(exception_id, reason))
+        self.exception_id = exception_id
+        self.reason = reason
+
+
+# raised when the request was rejected because its session ticket has expired or is invalid
+class WebexSessionTicketError(WebexXMLError):
+    pass
+
+
+# exception IDs (in addition to the reason text) that mark an expired or invalid session ticket, see webex_ticket_expired_exception_ids
+session_ticket_exception_ids = set()
+
+
+def _error(exception_id, reason):
+    text = (reason or "").lower()
+    if exception_id in session_ticket_exception_ids or ("ticket" in text and ("expire" in text or "invalid" in text)):
+        return WebexSessionTicketError(exception_id, reason)
+    return WebexXMLError(exception_id, reason)
+
+
+# request templates, composed once at import time; all values are XML-escaped when the template is rendered
+_SECURITY_CONTEXT = """<?xml version="1.0" encoding="UTF-8"?>
+<serv:message xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+    <header>
+        <securityContext>
+            <webExID>{webex_username}</webExID>
+            <sessionTicket>{webex_session_ticket}</sessionTicket>
+            <siteName>{webex_site_name}</siteName>
+        </securityContext>
+    </header>
+    <body>
+"""
+_END = """
+        </bodyContent>
+    </body>
+</serv:message>
+"""
+
+AUTHENTICATE_USER = _SECURITY_CONTEXT.replace("""
+            <sessionTicket>{webex_session_ticket}</sessionTicket>""", "") + """
+        <bodyContent xsi:type="java:com.webex.service.binding.user.AuthenticateUser">
+            <accessToken>{webex_access_token}</accessToken>""" + _END
+
+GET_USER = _SECURITY_CONTEXT + """
+        <bodyContent xsi:type="java:com.webex.service.binding.user.GetUser">
+            <webExId>{webex_username}</webExId>""" + _END
+
+_CREATE_MEETING = _SECURITY_CONTEXT + """
+        <bodyContent xsi:type="java:com.webex.service.binding.meeting.CreateMeeting">
+            <accessControl>
+                <meetingPassword>{meeting_password}</meetingPassword>
+            </accessControl>
+            <metaData>
+                <confName>{meeting_name}</confName>
+                <meetingType>3</meetingType>
+                <agenda>{meeting_agenda}</agenda>
+            </metaData>
+            <participants>
+                <maxUserNumber>100</maxUserNumber>
+            </participants>
+            <enableOptions>
+                <chat>true</chat>
+                <poll>true</poll>
+                <audioVideo>true</audioVideo>
+                <supportE2E>false</supportE2E>
+                <autoRecord>false</autoRecord>
+            </enableOptions>
+            <schedule>
+                <startDate>{start_date}</startDate>
+                <openTime>900</openTime>
+                <joinTeleconfBeforeHost>false</joinTeleconfBeforeHost>
+                <duration>{duration_minutes}</duration>
+                <timeZoneID>22</timeZoneID>
+                <hostWebExID>{owner}</hostWebExID>
+            </schedule>"""
+
+# the repeat element of CreateMeeting, depending on whether the meeting is repeated or not
+_REPEAT = {
+    None: "",
+    "daily": """
+            <repeat>
+                <repeatType>{pattern}</repeatType>
+                <interval>1</interval>
+            </repeat>""",
+    "weekly": """
+            <repeat>
+                <repeatType>{pattern}</repeatType>
+                <interval>1</interval>
+                <dayInWeek>
+                    <day>{dayInWeek}</day>
+                </dayInWeek>
+            </repeat>""",
+    "monthly": """
+            <repeat>
+                <repeatType>{pattern}</repeatType>
+                <interval>1</interval>
+                <dayInMonth>{dayInMonth}</dayInMonth>
+            </repeat>""",
+    "yearly": """
+            <repeat>
+                <repeatType>{pattern}</repeatType>
+                <monthInYear>{monthInYear}</monthInYear>
+                <dayInMonth>{dayInMonth}</dayInMonth>
+            </repeat>"""
+}
+
+CREATE_MEETING = {pattern: _CREATE_MEETING + repeat + _END for pattern, repeat in _REPEAT.items()}
+
+
+# to render a request template, escaping every value
+def render(template, **fields):
+    return template.format(**{name: escape(str(value)) for name, value in fields.items()})
+
+
+def authenticate_user(webex_username, webex_site_name, webex_access_token):
+    return render(AUTHENTICATE_USER, webex_username=webex_username, webex_site_name=webex_site_name, webex_access_token=webex_access_token)
+
+
+def get_user(webex_username, webex_session_ticket, webex_site_name):
+    return render(GET_USER, webex_username=webex_username, webex_session_ticket=webex_session_ticket, webex_site_name=webex_site_name)
+
+
+# fields: webex_username, webex_session_ticket, webex_site_name, meeting_password, meeting_name, meeting_agenda, start_date, duration_minutes, owner,
+# and the repeat fields of the pattern (pattern, dayInWeek, dayInMonth, monthInYear)
+def create_meeting(input_repeatmeeting_pattern, **fields):
+    return render(CREATE_MEETING[input_repeatmeeting_pattern], **fields)
+
+
+class _StopParsing(Exception):
+    pass
+
+
+# to extract the text of the elements at the given paths (prefixed element names joined by "/") from an XML API response
+# the response is parsed as a stream and parsing stops as soon as all paths have been read: a path is read at its first element,
+# a path in repeated at the end of the parent of its elements; the header is always checked and a FAILURE result is raised
+# as WebexXMLError (or WebexSessionTicketError), as is a response that is not XML (e.g. the HTML error page of a proxy)
+# returns a dict with a list of texts per path (empty if the path was not found)
+def extract(xml_text, paths, repeated=()):
+    values = {path: [] for path in paths}
+    pending = set(paths) - set(repeated)
+    pending_parents = {path.rsplit("/", 1)[0] for path in repeated}
+    header = {}
+    stack = []
+    text = []
+
+    def start_element(name, attributes):
+        stack.append(name)
+        text.clear()
+
+    def end_element(name):
+        path = "/".join(stack)
+        if path in values:
+            values[path].append("".join(text))
+            pending.discard(path)
+        elif path.startswith(RESPONSE):
+            header[path] = "".join(text)
+        elif path == HEADER and header.get(RESULT) == "FAILURE":
+            raise _error(header.get(EXCEPTION_ID), header.get(REASON))
+        pending_parents.discard(path)
+        text.clear()
+        stack.pop()
+        if not pending and not pending_parents:
+            raise _StopParsing()
+
+    def character_data(data):
+        text.append(data)
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = character_data
+    try:
+        parser.Parse(xml_text.strip(), True)
+    except _StopParsing:
+        pass
+    except expat.ExpatError as e:
+        raise WebexXMLError(None, "response is not valid XML ({})".format(e))
+    return values
+
+
+# to get the first text of a path in the result of extract(), or None
+def first(values, path):
+    return values[path][0] if values[path] else None